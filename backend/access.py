@@ -0,0 +1,125 @@
+"""
+Course access checks backed by a per-user enrollment cache.
+
+Every course and lesson page used to look up the student's Enrollment row
+(course_detail even twice), so clicking through a course produced one
+identical query per page. enrolled_course_ids() instead loads the ids of
+all courses a student is enrolled in with one query and keeps them as a
+frozenset in a per-process LRU (ENROLLMENT_CACHE_TTL seconds, at most
+ENROLLMENT_CACHE_SIZE users). The route-level checks below all answer from
+that set.
+
+A commit that adds or deletes Enrollment rows through the ORM (enroll_by_code,
+unenroll) drops the affected students' entries; bulk statements that bypass
+the unit of work call mark_enrollments_changed() (roster import, deletion.py).
+Another process may still hold the old set until it expires, so a course
+missing from a cached set is re-checked against the database before access
+is refused: a fresh enrollment is never turned away, and a removed one is
+only honoured for at most the TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, select
+
+from .models import db, Enrollment
+
+DEFAULT_TTL = 60
+DEFAULT_SIZE = 10000
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+_CHANGED_KEY = 'enrollment_cache_changed'
+# Marker for "drop every entry" (e.g. whole courses were deleted)
+ALL_STUDENTS = None
+
+
+def _load(student_id):
+    course_ids = frozenset(db.session.execute(
+        select(Enrollment.course_id).where(Enrollment.student_id == student_id)
+    ).scalars())
+    config = current_app.config
+    with _lock:
+        _cache[student_id] = (course_ids, time.monotonic() + config.get('ENROLLMENT_CACHE_TTL', DEFAULT_TTL))
+        _cache.move_to_end(student_id)
+        while len(_cache) > config.get('ENROLLMENT_CACHE_SIZE', DEFAULT_SIZE):
+            _cache.popitem(last=False)
+    return course_ids
+
+
+def enrolled_course_ids(student_id, refresh=False):
+    """Frozenset of the ids of the courses ``student_id`` is enrolled in."""
+    if not refresh:
+        with _lock:
+            entry = _cache.get(student_id)
+            if entry is not None and entry[1] > time.monotonic():
+                _cache.move_to_end(student_id)
+                return entry[0]
+    return _load(student_id)
+
+
+def is_enrolled(user, course_id):
+    """True if ``user`` is enrolled in ``course_id`` (re-checked before answering no)."""
+    if course_id in enrolled_course_ids(user.id):
+        return True
+    return course_id in enrolled_course_ids(user.id, refresh=True)
+
+
+def can_view_course(user, course):
+    """Instructors see their own courses, students the ones they are enrolled in."""
+    if user.is_instructor():
+        return course.instructor_id == user.id
+    if user.is_student():
+        return is_enrolled(user, course.id)
+    return False
+
+
+def can_view_lessons(user, course):
+    """Students need an enrollment; instructors and admins may open any lesson."""
+    if user.is_student():
+        return is_enrolled(user, course.id)
+    return True
+
+
+def invalidate_enrollments(student_ids=ALL_STUDENTS):
+    """Drop cached enrollment sets for ``student_ids`` (all of them by default)."""
+    with _lock:
+        if student_ids is ALL_STUDENTS:
+            _cache.clear()
+            return
+        for student_id in student_ids:
+            _cache.pop(student_id, None)
+
+
+def mark_enrollments_changed(student_ids=ALL_STUDENTS, session=None):
+    """Invalidate ``student_ids`` (or everyone) when ``session`` commits; for bulk statements."""
+    info = (session or db.session).info
+    if student_ids is ALL_STUDENTS or info.get(_CHANGED_KEY, ()) is ALL_STUDENTS:
+        info[_CHANGED_KEY] = ALL_STUDENTS
+    else:
+        info.setdefault(_CHANGED_KEY, set()).update(student_ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_enrollments(session, flush_context):
+    changed = {obj.student_id for obj in (*session.new, *session.dirty, *session.deleted)
+               if isinstance(obj, Enrollment)}
+    if changed:
+        mark_enrollments_changed(changed, session)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_on_commit(session):
+    if _CHANGED_KEY in session.info:
+        invalidate_enrollments(session.info.pop(_CHANGED_KEY))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_on_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CHANGED_KEY, None)
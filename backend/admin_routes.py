@@ -7,7 +7,16 @@ from sqlalchemy import or_
 import os
 
 from .app import app
-from .models import db, User, Course, Category, Lesson, Enrollment
+from .models import db, User, Course, Category, Lesson, Enrollment, Job
+from .loaders import with_profile
+from .stats import get_dashboard_stats
+from .search import search_courses
+from .deletion import delete_courses, delete_users
+from .jobs import job_counts, retry_job, JOB_STATUSES
+from .passwords import hash_settings, password_metrics
+from .database import pool_metrics, sqlite_pragmas
+from .fragments import fragment_metrics
+from .pagination import paginate_keyset, get_page_size, approximate_count
 
 # Admin decorator - only admins can access
 def admin_required(f):
@@ -24,26 +33,30 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def paginate_listing(query, sort_column, id_column, total=None, descending=True):
+    """Keyset-paginate an admin listing using the cursor/dir/per_page query args."""
+    return paginate_keyset(
+        query, sort_column, id_column,
+        cursor=request.args.get('cursor'),
+        direction=request.args.get('dir', 'next'),
+        per_page=get_page_size(request.args.get('per_page', type=int)),
+        descending=descending,
+        total=total,
+    )
+
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
     """Bootstrap-based admin dashboard"""
-    stats = {
-        'total_users': User.query.count(),
-        'total_courses': Course.query.count(),
-        'total_lessons': Lesson.query.count(),
-        'total_enrollments': Enrollment.query.count(),
-        'total_categories': Category.query.count(),
-        'total_instructors': User.query.filter_by(role='instructor').count(),
-        'total_students': User.query.filter_by(role='student').count(),
-        'published_courses': Course.query.filter_by(is_published=True).count(),
-        'unpublished_courses': Course.query.filter_by(is_published=False).count(),
-    }
+    stats, stats_generated_at = get_dashboard_stats()
+    stats_age = int((datetime.utcnow() - stats_generated_at).total_seconds())
     
     recent_users = User.query.order_by(User.created_at.desc()).limit(10).all()
-    recent_courses = Course.query.order_by(Course.created_at.desc()).limit(10).all()
+    recent_courses = with_profile(Course.query, 'admin_course_row').order_by(Course.created_at.desc()).limit(10).all()
     
-    return render_template('admin/dashboard.html', stats=stats, recent_users=recent_users, recent_courses=recent_courses)
+    return render_template('admin/dashboard.html', stats=stats, stats_age=stats_age,
+                         stats_generated_at=stats_generated_at,
+                         recent_users=recent_users, recent_courses=recent_courses)
 
 @app.route('/admin/users')
 @admin_required
@@ -65,7 +78,12 @@ def admin_users():
             )
         )
     
-    users = query.order_by(User.created_at.desc()).all()
+    if role_filter or search:
+        total = approximate_count(('users', role_filter, search), query)
+    else:
+        total = get_dashboard_stats()[0]['total_users']
+    
+    users = paginate_listing(query, User.created_at, User.id, total=total)
     return render_template('admin/users.html', users=users, search=search, role_filter=role_filter)
 
 @app.route('/admin/users/<int:user_id>/toggle')
@@ -85,7 +103,7 @@ def admin_toggle_user(user_id):
         if user.id == current_user.id:
             flash('You cannot delete your own account.', 'error')
             return redirect(url_for('admin_users'))
-        db.session.delete(user)
+        delete_users([user.id])
         db.session.commit()
         flash('User deleted successfully.', 'success')
     elif action == 'make_instructor':
@@ -99,6 +117,22 @@ def admin_toggle_user(user_id):
     
     return redirect(url_for('admin_users'))
 
+@app.route('/admin/users/bulk-delete', methods=['POST'])
+@admin_required
+def admin_bulk_delete_users():
+    """Delete the selected users with their courses and enrollments"""
+    user_ids = set(request.form.getlist('user_ids', type=int))
+    if current_user.id in user_ids:
+        user_ids.discard(current_user.id)
+        flash('You cannot delete your own account.', 'error')
+    
+    if user_ids:
+        result = delete_users(user_ids)
+        db.session.commit()
+        flash(f'Deleted {result.users} user(s) and {result.courses} course(s).', 'success')
+    
+    return redirect(url_for('admin_users'))
+
 @app.route('/admin/courses')
 @admin_required
 def admin_courses():
@@ -114,14 +148,15 @@ def admin_courses():
         query = query.filter_by(is_published=False)
     
     if search:
-        query = query.filter(
-            or_(
-                Course.title.contains(search),
-                Course.description.contains(search)
-            )
-        )
+        # Keep created_at ordering so the listing can still be keyset-paginated
+        query = search_courses(query, search, ranked=False)
+    
+    if status or search:
+        total = approximate_count(('courses', status, search), query)
+    else:
+        total = get_dashboard_stats()[0]['total_courses']
     
-    courses = query.order_by(Course.created_at.desc()).all()
+    courses = paginate_listing(with_profile(query, 'admin_course_row'), Course.created_at, Course.id, total=total)
     return render_template('admin/courses.html', courses=courses, search=search, status=status)
 
 @app.route('/admin/courses/<int:course_id>/toggle')
@@ -140,38 +175,26 @@ def admin_toggle_course(course_id):
         db.session.commit()
         flash('Course unpublished successfully.', 'success')
     elif action == 'delete':
-        # Delete all lessons associated with this course first
-        lessons = Lesson.query.filter_by(course_id=course.id).all()
-        for lesson in lessons:
-            # Delete associated files
-            if lesson.video_file:
-                video_path = os.path.join(app.config['UPLOAD_FOLDER'], lesson.video_file)
-                if os.path.exists(video_path):
-                    os.remove(video_path)
-            if lesson.lesson_file:
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], lesson.lesson_file)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            db.session.delete(lesson)
-        
-        # Delete all enrollments for this course
-        enrollments = Enrollment.query.filter_by(course_id=course.id).all()
-        for enrollment in enrollments:
-            db.session.delete(enrollment)
-        
-        # Delete course thumbnail if exists
-        if course.thumbnail:
-            thumbnail_path = os.path.join(app.config['UPLOAD_FOLDER'], course.thumbnail)
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-        
-        # Now delete the course
-        db.session.delete(course)
+        # Set-based cascade; files are removed by the background worker
+        delete_courses([course.id])
         db.session.commit()
         flash('Course deleted successfully.', 'success')
     
     return redirect(url_for('admin_courses'))
 
+@app.route('/admin/courses/bulk-delete', methods=['POST'])
+@admin_required
+def admin_bulk_delete_courses():
+    """Delete the selected courses with their lessons and enrollments"""
+    course_ids = request.form.getlist('course_ids', type=int)
+    if course_ids:
+        result = delete_courses(course_ids)
+        db.session.commit()
+        flash(f'Deleted {result.courses} course(s), {result.lessons} lesson(s) '
+              f'and {result.enrollments} enrollment(s).', 'success')
+    
+    return redirect(url_for('admin_courses'))
+
 @app.route('/admin/categories')
 @admin_required
 def admin_categories():
@@ -223,11 +246,13 @@ def admin_lessons():
     course_id = request.args.get('course_id', type=int)
     
     if course_id:
-        lessons = Lesson.query.filter_by(course_id=course_id).order_by(Lesson.order).all()
         course = Course.query.get_or_404(course_id)
+        query = with_profile(Lesson.query, 'admin_lesson_row').filter_by(course_id=course_id)
+        lessons = paginate_listing(query, Lesson.order, Lesson.id, total=course.lesson_count, descending=False)
         return render_template('admin/lessons.html', lessons=lessons, course=course)
     
-    lessons = Lesson.query.order_by(Lesson.created_at.desc()).limit(50).all()
+    lessons = paginate_listing(with_profile(Lesson.query, 'admin_lesson_row'), Lesson.created_at, Lesson.id,
+                               total=get_dashboard_stats()[0]['total_lessons'])
     return render_template('admin/lessons.html', lessons=lessons, course=None)
 
 @app.route('/admin/enrollments')
@@ -237,20 +262,72 @@ def admin_enrollments():
     course_id = request.args.get('course_id', type=int)
     
     if course_id:
-        enrollments = Enrollment.query.filter_by(course_id=course_id).order_by(Enrollment.enrolled_at.desc()).all()
         course = Course.query.get_or_404(course_id)
+        query = with_profile(Enrollment.query, 'admin_enrollment_row').filter_by(course_id=course_id)
+        enrollments = paginate_listing(query, Enrollment.enrolled_at, Enrollment.id, total=course.enrollment_count)
         return render_template('admin/enrollments.html', enrollments=enrollments, course=course)
     
-    enrollments = Enrollment.query.order_by(Enrollment.enrolled_at.desc()).limit(100).all()
+    enrollments = paginate_listing(with_profile(Enrollment.query, 'admin_enrollment_row'), Enrollment.enrolled_at,
+                                   Enrollment.id, total=get_dashboard_stats()[0]['total_enrollments'])
     return render_template('admin/enrollments.html', enrollments=enrollments, course=None)
 
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    """View pending and failed background jobs"""
+    status = request.args.get('status', 'active')
+    counts = job_counts()
+
+    query = Job.query
+    if status == 'active':
+        query = query.filter(Job.status.in_(('pending', 'running', 'failed')))
+        total = counts['pending'] + counts['running'] + counts['failed']
+    elif status in JOB_STATUSES:
+        query = query.filter(Job.status == status)
+        total = counts[status]
+    else:
+        total = sum(counts.values())
+
+    jobs = paginate_listing(query, Job.created_at, Job.id, total=total)
+    return render_template('admin/jobs.html', jobs=jobs, counts=counts, status=status)
+
+@app.route('/admin/jobs/<int:job_id>/retry', methods=['POST'])
+@admin_required
+def admin_retry_job(job_id):
+    """Queue a failed job again"""
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'failed':
+        flash('Only failed jobs can be retried.', 'error')
+    else:
+        retry_job(job)
+        db.session.commit()
+        flash(f'Job #{job.id} queued again.', 'success')
+    return redirect(url_for('admin_jobs', status=request.args.get('status', 'active')))
+
+@app.route('/admin/jobs/<int:job_id>/delete', methods=['POST'])
+@admin_required
+def admin_delete_job(job_id):
+    """Discard a job that is not running"""
+    job = Job.query.get_or_404(job_id)
+    if job.status == 'running':
+        flash('A running job cannot be discarded.', 'error')
+    else:
+        db.session.delete(job)
+        db.session.commit()
+        flash(f'Job #{job_id} discarded.', 'success')
+    return redirect(url_for('admin_jobs', status=request.args.get('status', 'active')))
+
 @app.route('/admin/settings')
 @admin_required
 def admin_settings():
     """Admin settings page"""
     from .app import app
     instructor_key = app.config.get('INSTRUCTOR_REGISTRATION_KEY', 'TEACHER2024')
-    return render_template('admin/settings.html', instructor_key=instructor_key)
+    return render_template('admin/settings.html', instructor_key=instructor_key,
+                         hash_method=hash_settings()[0], password_stats=password_metrics(),
+                         db_dialect=db.engine.dialect.name, db_pragmas=sqlite_pragmas(app.config),
+                         pool_stats=pool_metrics(), fragment_cache=app.config.get('FRAGMENT_CACHE'),
+                         fragment_stats=fragment_metrics())
 
 @app.route('/admin/users/<int:user_id>/make_admin', methods=['POST'])
 @admin_required
@@ -0,0 +1,192 @@
+"""
+Helpers for the versioned JSON API (``/api/v1``, routes in api_routes.py).
+
+The API serves the mobile app and the LTI bridge the same data the course
+pages show, under the same permission rules (access.py), without the HTML:
+
+- resources are serialized through field maps (COURSE_FIELDS, ...); a
+  ``?fields=id,title`` query arg picks a subset, and fields that need an
+  extra query (a course's ``lessons`` outline, a lesson's ``previous``/
+  ``next``) are only computed when asked for;
+- listings are keyset-paginated (pagination.py): ``?limit=`` (clamped to
+  API_MAX_PAGE_SIZE) and the ``next_cursor`` of the previous page as
+  ``?cursor=``;
+- responses carry weak ETags and the per-user caching headers of
+  conditional.py. Detail endpoints derive the ETag from timestamps before
+  serializing anything, listings from the body;
+- bodies are compressed (gzip, br or zstd) by the CompressionMiddleware
+  of compression.py like every other JSON response, not here.
+
+Errors are ``{"error": "..."}`` with the matching status code.
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import current_app, json, request, url_for
+from flask_login import current_user
+
+from . import conditional
+from .compression import DEFAULT_MIN_SIZE
+from .outline import lesson_neighbor, lesson_outline
+
+API_VERSION = 'v1'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class ApiError(Exception):
+    """An API request that cannot be answered; rendered as a JSON error."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_login_required(f):
+    """Like login_required, but answers 401 JSON instead of redirecting to the login page."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise ApiError('Authentication required.', 401)
+        if current_user.is_admin():
+            # Same rule as the course pages: admins work through the admin panel
+            raise ApiError('Admins use the admin panel.', 403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# Serialization --------------------------------------------------------------
+
+def _timestamp(value):
+    return value.isoformat() + 'Z' if value is not None else None
+
+
+def _media_url(path):
+    return url_for('media', filename=path) if path else None
+
+
+COURSE_FIELDS = {
+    'id': lambda course: course.id,
+    'title': lambda course: course.title,
+    'description': lambda course: course.description,
+    'category': lambda course: course.category_ref.name if course.category_ref else None,
+    'instructor': lambda course: {'id': course.instructor_ref.id, 'username': course.instructor_ref.username},
+    'thumbnail': lambda course: _media_url(course.thumbnail),
+    'is_published': lambda course: course.is_published,
+    # Only the owner sees the code students enroll with
+    'course_code': lambda course: course.course_code if course.instructor_id == current_user.id else None,
+    'lesson_count': lambda course: course.get_lessons_count(),
+    'enrollment_count': lambda course: course.get_enrollment_count(),
+    'created_at': lambda course: _timestamp(course.created_at),
+    'updated_at': lambda course: _timestamp(course.updated_at),
+    'lessons': lambda course: [
+        {'id': row.id, 'title': row.title, 'order': row.order,
+         'has_video': bool(row.has_video), 'has_text': bool(row.has_text), 'has_file': bool(row.has_file)}
+        for row in lesson_outline(course.id)
+    ],
+}
+COURSE_LIST_DEFAULT = ('id', 'title', 'description', 'category', 'instructor', 'thumbnail',
+                       'is_published', 'lesson_count', 'enrollment_count', 'created_at', 'updated_at')
+COURSE_DETAIL_DEFAULT = COURSE_LIST_DEFAULT + ('course_code', 'lessons')
+
+
+def _lesson_ref(row):
+    return {'id': row.id, 'title': row.title} if row is not None else None
+
+
+LESSON_FIELDS = {
+    'id': lambda lesson: lesson.id,
+    'course_id': lambda lesson: lesson.course_id,
+    'title': lambda lesson: lesson.title,
+    'order': lambda lesson: lesson.order,
+    'text_content': lambda lesson: lesson.text_content,
+    'video_url': lambda lesson: lesson.video_url,
+    'video_file': lambda lesson: _media_url(lesson.video_file),
+    'lesson_file': lambda lesson: _media_url(lesson.lesson_file),
+    'previous': lambda lesson: _lesson_ref(lesson_neighbor(lesson, before=True)),
+    'next': lambda lesson: _lesson_ref(lesson_neighbor(lesson, before=False)),
+    'created_at': lambda lesson: _timestamp(lesson.created_at),
+    'updated_at': lambda lesson: _timestamp(lesson.updated_at),
+}
+LESSON_DEFAULT = tuple(LESSON_FIELDS)
+
+ENROLLMENT_FIELDS = {
+    'id': lambda enrollment: enrollment.id,
+    'course_id': lambda enrollment: enrollment.course_id,
+    'course': lambda enrollment: {'id': enrollment.course_ref.id, 'title': enrollment.course_ref.title},
+    'student': lambda enrollment: {'id': enrollment.student_ref.id, 'username': enrollment.student_ref.username,
+                                   'email': enrollment.student_ref.email},
+    'enrolled_at': lambda enrollment: _timestamp(enrollment.enrolled_at),
+}
+STUDENT_ENROLLMENT_DEFAULT = ('id', 'course', 'enrolled_at')
+COURSE_ENROLLMENT_DEFAULT = ('id', 'student', 'enrolled_at')
+
+
+def requested_fields(available, default):
+    """Fields named by ``?fields=`` (comma separated), or ``default``; unknown names are a 400."""
+    raw = request.args.get('fields')
+    if not raw:
+        return tuple(default)
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in available]
+    if unknown or not fields:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown) or raw}. "
+                       f"Available: {', '.join(available)}.")
+    return fields
+
+
+def serialize(obj, fields, field_map):
+    return {name: field_map[name](obj) for name in fields}
+
+
+# Pagination -----------------------------------------------------------------
+
+def page_size():
+    """``?limit=`` clamped to 1..API_MAX_PAGE_SIZE."""
+    config = current_app.config
+    limit = config.get('API_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    requested = request.args.get('limit', type=int)
+    if not requested or requested < 1:
+        return min(config.get('API_PAGE_SIZE', DEFAULT_PAGE_SIZE), limit)
+    return min(requested, limit)
+
+
+def page_payload(page, fields, field_map):
+    """``{"data": [...], "next_cursor": ...}`` for a KeysetPage."""
+    return {
+        'data': [serialize(item, fields, field_map) for item in page.items],
+        'next_cursor': page.next_cursor,
+    }
+
+
+# Responses ------------------------------------------------------------------
+
+def not_modified(etag, last_modified=None):
+    """conditional.not_modified() with the Vary header the 200 would have had."""
+    response = conditional.not_modified(etag, last_modified)
+    # The compression middleware adds Vary to 200s but leaves 304s alone
+    if response is not None and current_app.config.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE):
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def json_response(payload, etag=None, last_modified=None, status=200):
+    """Serialize ``payload``; without ``etag`` one is derived from the body and checked here."""
+    # Fields keep the order they were requested in
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=False).encode('utf-8')
+    if etag is None:
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    return conditional.with_validators(response, etag, last_modified)
+
+
+def error_response(error):
+    return current_app.response_class(json.dumps({'error': error.message}), status=error.status,
+                                      mimetype='application/json')
+
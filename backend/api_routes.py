@@ -0,0 +1,101 @@
+from flask import request
+from flask_login import current_user
+
+from .app import app
+from .models import db, Course, Lesson, Enrollment
+from .loaders import with_profile
+from .pagination import paginate_keyset
+from .access import enrolled_course_ids, can_view_course, can_view_lessons
+from .fragments import course_version
+from .conditional import newest, page_etag, viewer_key
+from .api import (API_VERSION, ApiError, api_login_required, requested_fields, serialize, page_size,
+                  page_payload, not_modified, json_response, error_response,
+                  COURSE_FIELDS, COURSE_LIST_DEFAULT, COURSE_DETAIL_DEFAULT, LESSON_FIELDS, LESSON_DEFAULT,
+                  ENROLLMENT_FIELDS, STUDENT_ENROLLMENT_DEFAULT, COURSE_ENROLLMENT_DEFAULT)
+
+@app.errorhandler(ApiError)
+def api_error(error):
+    return error_response(error)
+
+def get_or_404(model, object_id, name):
+    obj = db.session.get(model, object_id)
+    if obj is None:
+        raise ApiError(f'{name} not found.', 404)
+    return obj
+
+def paginate(query, sort_column, id_column):
+    return paginate_keyset(query, sort_column, id_column, cursor=request.args.get('cursor'),
+                           per_page=page_size())
+
+@app.route('/api/v1/courses')
+@api_login_required
+def api_courses():
+    """Courses of the current user: an instructor's own, a student's enrolled published ones"""
+    fields = requested_fields(COURSE_FIELDS, COURSE_LIST_DEFAULT)
+    if current_user.is_instructor():
+        query = Course.query.filter_by(instructor_id=current_user.id)
+    else:
+        query = Course.query.filter(Course.id.in_(enrolled_course_ids(current_user.id)),
+                                    Course.is_published == True)
+    page = paginate(with_profile(query, 'course_card'), Course.created_at, Course.id)
+    return json_response(page_payload(page, fields, COURSE_FIELDS))
+
+@app.route('/api/v1/courses/<int:course_id>')
+@api_login_required
+def api_course(course_id):
+    """One course with its lesson outline; same access rule as the course page"""
+    course = get_or_404(Course, course_id, 'Course')
+    if not can_view_course(current_user, course):
+        raise ApiError('You must enroll in this course to access it.', 403)
+    fields = requested_fields(COURSE_FIELDS, COURSE_DETAIL_DEFAULT)
+    
+    # Validators from timestamps, so a revalidation skips the outline query
+    version = course_version(course)
+    etag = page_etag(API_VERSION, version, course.enrollment_count, course.course_code, viewer_key(), fields)
+    last_modified = newest(course.updated_at, version[4])
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    return json_response({'data': serialize(course, fields, COURSE_FIELDS)}, etag, last_modified)
+
+@app.route('/api/v1/lessons/<int:lesson_id>')
+@api_login_required
+def api_lesson(lesson_id):
+    """Lesson content; same access rule as the lesson page"""
+    lesson = get_or_404(Lesson, lesson_id, 'Lesson')
+    course = lesson.course_ref
+    if not can_view_lessons(current_user, course):
+        raise ApiError('You must enroll in this course to access lessons.', 403)
+    fields = requested_fields(LESSON_FIELDS, LESSON_DEFAULT)
+    
+    # Neighbors depend on the other lessons, so the whole course version is part of the key
+    version = course_version(course)
+    etag = page_etag(API_VERSION, version, lesson.id, viewer_key(), fields)
+    last_modified = newest(lesson.updated_at, version[4])
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    return json_response({'data': serialize(lesson, fields, LESSON_FIELDS)}, etag, last_modified)
+
+@app.route('/api/v1/enrollments')
+@api_login_required
+def api_enrollments():
+    """The current student's enrollments"""
+    if not current_user.is_student():
+        raise ApiError('Only students have enrollments; use /api/v1/courses/<id>/enrollments.', 403)
+    fields = requested_fields(ENROLLMENT_FIELDS, STUDENT_ENROLLMENT_DEFAULT)
+    query = with_profile(Enrollment.query.filter_by(student_id=current_user.id), 'api_enrollment')
+    page = paginate(query, Enrollment.enrolled_at, Enrollment.id)
+    return json_response(page_payload(page, fields, ENROLLMENT_FIELDS))
+
+@app.route('/api/v1/courses/<int:course_id>/enrollments')
+@api_login_required
+def api_course_enrollments(course_id):
+    """Students enrolled in one of the current instructor's courses"""
+    course = get_or_404(Course, course_id, 'Course')
+    if course.instructor_id != current_user.id:
+        raise ApiError('You can only list enrollments of your own courses.', 403)
+    fields = requested_fields(ENROLLMENT_FIELDS, COURSE_ENROLLMENT_DEFAULT)
+    query = with_profile(Enrollment.query.filter_by(course_id=course.id), 'api_enrollment')
+    page = paginate(query, Enrollment.enrolled_at, Enrollment.id)
+    return json_response(page_payload(page, fields, ENROLLMENT_FIELDS))
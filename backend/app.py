@@ -7,17 +7,97 @@ app = Flask(__name__,
             template_folder='../frontend/templates',
             static_folder='../frontend/static')
 app.config['SECRET_KEY'] = 'lms-development-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///lms.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('LMS_DATABASE_URI', 'sqlite:///lms.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite pragmas run on every connection (see database.py); None keeps SQLite's default
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('LMS_SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('LMS_SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('LMS_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('LMS_SQLITE_CACHE_SIZE', -64 * 1024))  # negative: KiB
+# Seconds a connection waits for a locked SQLite database before 'database is locked'
+app.config['SQLITE_BUSY_TIMEOUT'] = float(os.environ.get('LMS_SQLITE_BUSY_TIMEOUT', 5))
+# Connection pool: connections kept, extra ones allowed under load and seconds a
+# request waits for a free connection
+app.config['DB_POOL_SIZE'] = int(os.environ.get('LMS_DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('LMS_DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('LMS_DB_POOL_TIMEOUT', 10))
+# Read-only connections for GET/HEAD requests (0 disables), against DATABASE_READ_URI
+# (e.g. a replica) or the main database
+app.config['DB_READ_POOL_SIZE'] = int(os.environ.get('LMS_DB_READ_POOL_SIZE', 0))
+app.config['DATABASE_READ_URI'] = os.environ.get('LMS_DATABASE_READ_URI')
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'media')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Chunked lesson video uploads (see uploads.py); chunks must stay below MAX_CONTENT_LENGTH
+app.config['UPLOAD_TMP_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads_tmp')
+app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # 8MB per chunk
+app.config['LESSON_VIDEO_MAX_SIZE'] = int(os.environ.get('LMS_LESSON_VIDEO_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+# Zero-copy media delivery: X-Sendfile (Apache/lighttpd) or an nginx internal
+# location prefix for X-Accel-Redirect, e.g. '/protected-media'
+app.config['USE_X_SENDFILE'] = os.environ.get('LMS_USE_X_SENDFILE') == '1'
+app.config['MEDIA_X_ACCEL_PREFIX'] = os.environ.get('LMS_MEDIA_X_ACCEL_PREFIX')
 app.config['WTF_CSRF_ENABLED'] = True
+# Course thumbnail variants are generated by a process pool (see images.py)
+app.config['IMAGE_WORKERS'] = int(os.environ.get('LMS_IMAGE_WORKERS', 2))
+app.config['IMAGE_PROCESSING_INLINE'] = False
 # Instructor registration key - change this in production!
 app.config['INSTRUCTOR_REGISTRATION_KEY'] = 'TEACHER2024'
+# Seconds the admin dashboard statistics snapshot stays cached
+app.config['ADMIN_STATS_TTL'] = 60
+# Admin listings page size (per_page query arg is clamped to ADMIN_MAX_PAGE_SIZE)
+app.config['ADMIN_PAGE_SIZE'] = 50
+app.config['ADMIN_MAX_PAGE_SIZE'] = 200
+# Course codes are a keyed permutation of a counter reserved in blocks (see course_codes.py);
+# COURSE_CODE_KEY defaults to a value derived from SECRET_KEY
+app.config['COURSE_CODE_KEY'] = os.environ.get('LMS_COURSE_CODE_KEY')
+app.config['COURSE_CODE_BLOCK_SIZE'] = 100
+# Background jobs (see jobs.py): attempts before a job is marked failed and
+# the base retry delay in seconds (doubled on every further attempt)
+app.config['JOB_MAX_ATTEMPTS'] = 5
+app.config['JOB_RETRY_DELAY'] = 10
+# Rows resolved and enrolled per statement by the roster import (see roster.py)
+app.config['ROSTER_BATCH_SIZE'] = 500
+# Password hashing policy (see passwords.py): werkzeug method string, e.g.
+# 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'; older hashes are upgraded at login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('LMS_PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_SALT_LENGTH'] = 16
+# Login password checks: verification threads, checks admitted at once and
+# seconds a login waits for a slot before it is turned away
+app.config['PASSWORD_VERIFY_WORKERS'] = int(os.environ.get('LMS_PASSWORD_VERIFY_WORKERS', 2))
+app.config['PASSWORD_VERIFY_CONCURRENCY'] = int(os.environ.get('LMS_PASSWORD_VERIFY_CONCURRENCY', 8))
+app.config['PASSWORD_VERIFY_TIMEOUT'] = 5
+# Seconds a logged-in user's snapshot is reused by the user loader, and max entries (see user_cache.py)
+app.config['USER_CACHE_TTL'] = 30
+app.config['USER_CACHE_SIZE'] = 10000
+# Seconds a student's set of enrolled course ids is reused by access checks, and max entries (see access.py)
+app.config['ENROLLMENT_CACHE_TTL'] = 60
+app.config['ENROLLMENT_CACHE_SIZE'] = 10000
+# Rendered-fragment cache for the course/lesson pages (see fragments.py): 'memory'
+# (per process), 'disk' (shared by processes through FRAGMENT_CACHE_DIR) or 'off'
+app.config['FRAGMENT_CACHE'] = os.environ.get('LMS_FRAGMENT_CACHE', 'memory')
+app.config['FRAGMENT_CACHE_DIR'] = os.environ.get(
+    'LMS_FRAGMENT_CACHE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'fragments'))
+app.config['FRAGMENT_CACHE_SIZE'] = 2000
+app.config['FRAGMENT_CACHE_TTL'] = 3600
+# JSON API (see api.py): listing page size and its upper bound; responses are
+# compressed by the middleware below
+app.config['API_PAGE_SIZE'] = 50
+app.config['API_MAX_PAGE_SIZE'] = 200
+# Response compression (see compression.py): bodies smaller than this are sent
+# as they are (0 disables it); br/zstd are used when Brotli/zstandard are installed
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('LMS_COMPRESSION_MIN_SIZE', 500))
+app.config['COMPRESSION_ENCODINGS'] = ('br', 'zstd', 'gzip')
+app.config['COMPRESSION_SKIP_PATHS'] = ('/media/', '/assets/')
+# Fingerprinted, precompressed copies of frontend/static written by build-assets (see assets.py)
+app.config['ASSET_BUILD_DIR'] = os.environ.get(
+    'LMS_ASSET_BUILD_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'build', 'static'))
 
 # Initialize db from models
+from .database import engine_options, init_database
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 from .models import db
 db.init_app(app)
+# SQLite pragmas, pool metrics and the optional read-only pool (see database.py)
+init_database(app)
 
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
@@ -28,6 +108,13 @@ def inject_csrf_token():
     from flask_wtf.csrf import generate_csrf
     return dict(csrf_token=lambda: generate_csrf())
 
+# Responsive thumbnail helper used by the _thumbnail.html macro
+from .images import thumbnail_variants
+app.add_template_global(thumbnail_variants)
+# Fingerprinted static URLs: {{ asset_url('js/roster_import.js') }}
+from .assets import asset_url
+app.add_template_global(asset_url)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -36,14 +123,23 @@ login_manager.login_message_category = 'info'
 
 # Import models after db initialization
 from .models import User, Course, Category, Lesson, Enrollment
+from . import counters  # registers the Course counter flush hooks
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+# Cached, read-only user snapshots instead of one users query per request (see user_cache.py)
+from .user_cache import load_user
+login_manager.user_loader(load_user)
 
 # Import routes after all initialization
 from . import routes
 from . import admin_routes
+from . import upload_routes
+from . import api_routes
+from . import commands
+from . import tasks  # registers the background job handlers
+
+# gzip/br/zstd for HTML and JSON responses, streamed ones included (see compression.py)
+from .compression import CompressionMiddleware
+app.wsgi_app = CompressionMiddleware(app.wsgi_app, app.config)
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -55,7 +151,11 @@ def internal_server_error(e):
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        from .migrations import upgrade_database
+        # Creates a new database, or applies pending schema migrations
+        upgrade_database(report=print)
+        from .assets import build_assets
+        build_assets()
         # Create upload directories
         media_folder = app.config['UPLOAD_FOLDER']
         os.makedirs(os.path.join(media_folder, 'profile_pictures'), exist_ok=True)
@@ -0,0 +1,230 @@
+"""
+Fingerprinted static assets with precompressed variants.
+
+``flask --app backend.app build-assets`` (also run by run.py at startup)
+copies every file under ``frontend/static`` into ASSET_BUILD_DIR under a
+content-hashed name (``js/roster_import.3f2a9c1b7d04.js``) and, for text
+assets, writes ``.gz`` and (when the optional ``Brotli`` package is
+installed) ``.br`` siblings next to it. ``manifest.json`` maps each source
+path to its fingerprinted name and the encodings that were written.
+
+Templates link assets through ``asset_url('js/roster_import.js')``. With a
+manifest entry the URL points at ``/assets/<fingerprinted name>``; without
+one (no build yet, or a file added since) it falls back to the plain
+``/static`` URL, so a missing build never breaks a page.
+
+send_asset() serves ``/assets``:
+
+- ``Cache-Control: public, max-age=31536000, immutable``: the name changes
+  whenever the content does, so browsers never revalidate and repeat page
+  loads make no asset requests at all;
+- the ``.br`` or ``.gz`` variant when ``Accept-Encoding`` allows it, with
+  ``Content-Encoding`` and ``Vary: Accept-Encoding``;
+- fingerprinted files of the current build and of earlier ones still on
+  disk; anything else (the manifest, temporary files) is a 404.
+
+The manifest is re-read when its file changes, so a build is picked up by
+running workers without a restart. Older fingerprinted files are kept and
+still served (pages rendered before the build, and open tabs, reference
+them; the hash in the name means they can never be stale) until
+``build-assets --clean`` removes everything the manifest no longer lists.
+References inside CSS files (``url(...)``) are not rewritten.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from flask import abort, current_app, request, url_for
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz variants are written without it
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Files worth precompressing; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {'.js', '.mjs', '.css', '.svg', '.json', '.map', '.txt', '.html', '.xml'}
+# Smaller files gain nothing from a compressed variant
+MIN_COMPRESS_SIZE = 256
+# Variants in order of preference, with the suffix they are stored under
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# ``name.<12 hex digits>.ext``, as written by _fingerprinted_name()
+FINGERPRINT_RE = re.compile(r'\.([0-9a-f]{12})(\.[^./]+)?$')
+
+_lock = threading.Lock()
+_manifest = {'mtime': None, 'files': {}, 'served': {}}
+
+
+def _fingerprinted_name(path, digest):
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{digest[:12]}{ext}'
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical between builds
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def _write_file(path, data):
+    """Write ``data`` through a temporary file so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _source_files(source):
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, source).replace(os.sep, '/'), path
+
+
+def build_assets(clean=False, report=None):
+    """Fingerprint and precompress the static folder; returns the new manifest's entries.
+
+    With ``clean``, files in the build directory the new manifest does not
+    reference are removed afterwards.
+    """
+    source = current_app.static_folder
+    output = current_app.config['ASSET_BUILD_DIR']
+    encodings = [(name, suffix) for name, suffix in ENCODINGS if name != 'br' or brotli is not None]
+
+    files = {}
+    for relative, path in _source_files(source):
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        target = _fingerprinted_name(relative, digest)
+        target_path = os.path.join(output, target)
+        if not os.path.exists(target_path):
+            _write_file(target_path, data)
+
+        written = []
+        if os.path.splitext(relative)[1].lower() in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_SIZE:
+            for encoding, suffix in encodings:
+                compressed = _compress(data, encoding)
+                # Keep a variant only when it is actually smaller
+                if len(compressed) < len(data):
+                    if not os.path.exists(target_path + suffix):
+                        _write_file(target_path + suffix, compressed)
+                    written.append(encoding)
+        files[relative] = {'path': target, 'digest': digest, 'size': len(data), 'encodings': written}
+        if report:
+            report(f"{relative} -> {target}" + (f" ({', '.join(written)})" if written else ''))
+
+    _write_file(os.path.join(output, MANIFEST_NAME),
+                json.dumps({'files': files}, indent=2, sort_keys=True).encode('utf-8'))
+
+    if clean:
+        keep = {MANIFEST_NAME}
+        for entry in files.values():
+            keep.add(entry['path'])
+            keep.update(entry['path'] + suffix for encoding, suffix in ENCODINGS if encoding in entry['encodings'])
+        for relative, path in list(_source_files(output)):
+            if relative not in keep:
+                os.unlink(path)
+                if report:
+                    report(f'removed {relative}')
+    return files
+
+
+def load_manifest():
+    """``(source path -> entry, fingerprinted path -> entry)``, re-read when the manifest changes."""
+    path = os.path.join(current_app.config['ASSET_BUILD_DIR'], MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    with _lock:
+        if mtime != _manifest['mtime']:
+            files = {}
+            if mtime is not None:
+                with open(path, encoding='utf-8') as f:
+                    files = json.load(f)['files']
+            _manifest.update(mtime=mtime, files=files,
+                             served={entry['path']: entry for entry in files.values()})
+        return _manifest['files'], _manifest['served']
+
+
+def manifest_version():
+    """Changes with every build; part of the page ETags, since pages embed asset URLs."""
+    load_manifest()
+    return _manifest['mtime']
+
+
+def asset_url(filename):
+    """URL of a static file: fingerprinted when it has been built, else the plain /static URL."""
+    entry = load_manifest()[0].get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=entry['path'])
+
+
+def _preferred_encoding(entry):
+    """The best variant the client accepts, or None for the uncompressed file."""
+    available = [name for name, _ in ENCODINGS if name in entry['encodings']]
+    if not available:
+        return None
+    best = request.accept_encodings.best_match(available + ['identity'], default='identity')
+    return best if best != 'identity' else None
+
+
+def _built_entry(filename):
+    """Manifest-style entry for a fingerprinted file of the current or an earlier build, or None."""
+    entry = load_manifest()[1].get(filename)
+    if entry is not None:
+        return entry
+    match = FINGERPRINT_RE.search(filename)
+    path = safe_join(current_app.config['ASSET_BUILD_DIR'], filename) if match else None
+    if path is None or not os.path.isfile(path):
+        return None
+    # Left over from an earlier build: its variants are whatever is next to it
+    return {'path': filename, 'digest': match.group(1),
+            'encodings': [name for name, suffix in ENCODINGS if os.path.isfile(path + suffix)]}
+
+
+def send_asset(filename):
+    """Serve a fingerprinted asset (or its precompressed variant) with immutable caching."""
+    entry = _built_entry(filename)
+    if entry is None:
+        abort(404)
+
+    encoding = _preferred_encoding(entry)
+    path = os.path.join(current_app.config['ASSET_BUILD_DIR'], filename)
+    if encoding is not None:
+        path += dict(ENCODINGS)[encoding]
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    try:
+        response = send_file(path, request.environ, mimetype=mimetype, conditional=True,
+                             etag=f"{entry['digest'][:32]}-{encoding or 'identity'}")
+    except FileNotFoundError:
+        abort(404)
+
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if entry['encodings']:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,175 @@
+"""
+Maintenance commands for the Flask CLI.
+
+Usage:
+    flask --app backend.app recount-courses
+    flask --app backend.app rebuild-search-index
+    flask --app backend.app purge-uploads --hours 24
+    flask --app backend.app migrate-media [--dry-run]
+    flask --app backend.app jobs-worker [--burst]
+    flask --app backend.app purge-jobs --days 7
+    flask --app backend.app purge-fragment-cache [--all]
+    flask --app backend.app build-assets [--clean]
+    flask --app backend.app db-upgrade [--to N]
+    flask --app backend.app db-downgrade --to N
+    flask --app backend.app db-version
+    flask --app backend.app explain-queries
+"""
+
+import click
+
+from .app import app
+from .models import db
+
+
+@app.cli.command('recount-courses')
+def recount_courses_command():
+    """Rebuild the denormalized enrollment/lesson counters on courses."""
+    from .counters import recount_course_counters
+
+    updated = recount_course_counters()
+    db.session.commit()
+    click.echo(f'✅ Recounted enrollments and lessons for {updated} course(s).')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Create (if missing) and rebuild the FTS5 course search index."""
+    from .search import rebuild_search_index
+
+    indexed = rebuild_search_index()
+    db.session.commit()
+    click.echo(f'✅ Search index rebuilt ({indexed} course(s) indexed).')
+
+
+@app.cli.command('purge-uploads')
+@click.option('--hours', default=24, show_default=True, help='Age of inactivity after which an upload is discarded.')
+def purge_uploads_command(hours):
+    """Discard chunked uploads that were abandoned."""
+    from datetime import timedelta
+    from .uploads import purge_stale_uploads
+
+    purged = purge_stale_uploads(timedelta(hours=hours))
+    click.echo(f'✅ Removed {purged} stale upload(s).')
+
+
+@app.cli.command('migrate-media')
+@click.option('--dry-run', is_flag=True, help='Only report what would be migrated.')
+def migrate_media_command(dry_run):
+    """Move media stored under flat legacy paths into the content-addressed store."""
+    from .storage import migrate_legacy_media
+
+    counts = migrate_legacy_media(dry_run=dry_run)
+    prefix = 'Would migrate' if dry_run else 'Migrated'
+    click.echo(f"✅ {prefix} {counts['migrated']} reference(s) to {counts['stored']} stored file(s).")
+    if counts['missing']:
+        click.echo(f"⚠️  {counts['missing']} reference(s) point at missing files and were left unchanged.")
+
+
+@app.cli.command('jobs-worker')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty instead of waiting for new jobs.')
+@click.option('--interval', default=1.0, show_default=True, help='Seconds to sleep when the queue is empty.')
+def jobs_worker_command(burst, interval):
+    """Run queued background jobs (file cleanup, queued deletions)."""
+    from .jobs import work, default_worker_id
+
+    worker_id = default_worker_id()
+    click.echo(f'Worker {worker_id} started. Press Ctrl+C to stop.')
+    try:
+        processed = work(worker_id, burst=burst, interval=interval)
+    except KeyboardInterrupt:
+        return
+    click.echo(f'✅ Processed {processed} job(s).')
+
+
+@app.cli.command('purge-jobs')
+@click.option('--days', default=7, show_default=True, help='Age after which completed jobs are deleted.')
+def purge_jobs_command(days):
+    """Delete completed background jobs."""
+    from datetime import timedelta
+    from .jobs import purge_finished_jobs
+
+    purged = purge_finished_jobs(timedelta(days=days))
+    click.echo(f'✅ Removed {purged} completed job(s).')
+
+
+@app.cli.command('purge-fragment-cache')
+@click.option('--all', 'purge_all', is_flag=True, help='Remove every entry, not only expired ones.')
+def purge_fragment_cache_command(purge_all):
+    """Remove expired (or all) rendered fragments from the configured cache."""
+    from .fragments import clear_fragments, purge_fragments
+
+    if purge_all:
+        clear_fragments()
+        click.echo('✅ Fragment cache cleared.')
+    else:
+        click.echo(f'✅ Removed {purge_fragments()} expired fragment(s).')
+
+
+@app.cli.command('build-assets')
+@click.option('--clean', is_flag=True, help='Remove built files the new manifest no longer references.')
+def build_assets_command(clean):
+    """Write fingerprinted, precompressed copies of the static files and their manifest."""
+    from .assets import brotli, build_assets
+
+    files = build_assets(clean=clean, report=click.echo)
+    click.echo(f'✅ Built {len(files)} static asset(s) into {app.config["ASSET_BUILD_DIR"]}.')
+    if brotli is None:
+        click.echo('⚠️  Brotli is not installed; only .gz variants were written (pip install Brotli).')
+
+
+@app.cli.command('db-upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Version to upgrade to (default: latest).')
+def db_upgrade_command(target):
+    """Apply pending schema migrations (creates a new database from the models)."""
+    from .migrations import current_version, upgrade_database, upgrade
+
+    if target is None:
+        applied = upgrade_database(report=click.echo)
+    else:
+        applied = upgrade(target, report=click.echo)
+    click.echo(f'✅ Applied {len(applied)} migration(s); schema is at version {current_version()}.')
+
+
+@app.cli.command('db-downgrade')
+@click.option('--to', 'target', type=int, required=True, help='Version to go back to.')
+def db_downgrade_command(target):
+    """Undo schema migrations above a version."""
+    from .migrations import MigrationError, current_version, downgrade
+
+    try:
+        undone = downgrade(target, report=click.echo)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'✅ Reverted {len(undone)} migration(s); schema is at version {current_version()}.')
+
+
+@app.cli.command('db-version')
+def db_version_command():
+    """Show applied and pending schema migrations."""
+    from .migrations import MIGRATIONS, applied_migrations
+
+    applied = {row.version: row for row in applied_migrations()}
+    for step in MIGRATIONS:
+        row = applied.get(step.version)
+        state = f"applied {row.applied_at:%Y-%m-%d %H:%M}" if row else 'pending'
+        click.echo(f'{step.version:>3}  {step.name:<45} {state}')
+
+
+@app.cli.command('explain-queries')
+def explain_queries_command():
+    """Run EXPLAIN QUERY PLAN on every page's queries and flag full table scans."""
+    from .query_plans import audit_routes
+
+    reports = audit_routes()
+    flagged = 0
+    for report in reports:
+        marker = '⚠️ ' if report.scans else '  '
+        click.echo(f'{marker} [{report.role}] {report.url} -> {report.status}, {report.queries} query(ies)')
+        for table, statement in report.scans:
+            flagged += 1
+            click.echo(f'      full scan of {table}: {" ".join(statement.split())[:160]}')
+    if flagged:
+        click.echo(f'⚠️  {flagged} full table scan(s) in {sum(1 for r in reports if r.scans)} page(s).')
+    else:
+        click.echo(f'✅ No full table scans in {len(reports)} page(s).')
@@ -0,0 +1,226 @@
+"""
+WSGI middleware that compresses rendered HTML and JSON responses.
+
+The admin listings, the course grid and the API send large, repetitive
+markup, so CompressionMiddleware (installed around ``app.wsgi_app`` in
+app.py) compresses responses for clients that send ``Accept-Encoding``:
+
+- encodings are tried in COMPRESSION_ENCODINGS order (``br`` and ``zstd``
+  only when the optional ``Brotli``/``zstandard`` packages are installed,
+  ``gzip`` always), honouring the client's q-values;
+- only text-like content types (COMPRESSIBLE_TYPES) are compressed, and
+  only responses with a body (not 204/304), without a ``Content-Encoding``
+  of their own, ``Content-Range`` or
+  ``Cache-Control: no-transform``;
+- bodies with a ``Content-Length`` below COMPRESSION_MIN_SIZE are sent as
+  they are; larger ones are compressed in one go and get a new
+  ``Content-Length``;
+- streamed responses (no ``Content-Length``, e.g. the roster import's
+  progress lines) stay streamed: each chunk is compressed and flushed as
+  soon as the application yields it;
+- paths under COMPRESSION_SKIP_PATHS (``/media/`` and ``/assets/``, which
+  are already compressed or served with ``sendfile``) are passed through
+  untouched.
+
+Every compressible response gets ``Vary: Accept-Encoding`` whether or not
+it was compressed, and strong ETags of compressed bodies are made weak,
+since the bytes on the wire are no longer those the tag was computed for.
+COMPRESSION_MIN_SIZE = 0 turns the middleware off.
+"""
+
+import itertools
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+DEFAULT_MIN_SIZE = 500
+DEFAULT_ENCODINGS = ('br', 'zstd', 'gzip')
+# Dynamic responses are compressed per request, so favour speed over ratio
+DEFAULT_LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6}
+DEFAULT_SKIP_PATHS = ('/media/', '/assets/')
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript', 'application/json', 'application/x-ndjson', 'application/xml',
+    'image/svg+xml',
+}
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits=31: zlib stream with a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+COMPRESSORS = {'gzip': _GzipCompressor}
+if brotli is not None:
+    COMPRESSORS['br'] = _BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _ZstdCompressor
+
+
+def available_encodings():
+    """Encodings this process can produce, in the default order of preference."""
+    return [name for name in DEFAULT_ENCODINGS if name in COMPRESSORS]
+
+
+def negotiate(accept_encoding, preferred):
+    """The first of ``preferred`` with the client's highest q-value, or None."""
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for name in preferred:
+        if name not in COMPRESSORS:
+            continue
+        quality = accept[name]
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def is_compressible(mimetype):
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """Compress the responses of ``wsgi_app`` according to the settings in ``config``.
+
+    ``config`` is read on every request, so changing the app config takes
+    effect immediately.
+    """
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.config = config
+
+    def __call__(self, environ, start_response):
+        min_size = self.config.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+        path = environ.get('PATH_INFO', '')
+        if not min_size or path.startswith(tuple(self.config.get('COMPRESSION_SKIP_PATHS', DEFAULT_SKIP_PATHS))):
+            return self.wsgi_app(environ, start_response)
+
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''),
+                             self.config.get('COMPRESSION_ENCODINGS', DEFAULT_ENCODINGS))
+        captured = {}
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            # Bytes passed to write() are sent ahead of the iterable
+            return written.append
+
+        app_iter = self.wsgi_app(environ, capture)
+        if 'status' not in captured:
+            # The application starts the response at its first chunk
+            chunks = iter(app_iter)
+            written.extend(chunk for chunk in [next(chunks, b'')] if chunk)
+            app_iter = ClosingIterator(chunks, getattr(app_iter, 'close', None))
+
+        status, headers = captured['status'], Headers(captured['headers'])
+        plan = self._plan(status, headers, encoding, min_size, environ)
+        if plan is None:
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            if not written:
+                # Untouched, so file wrappers (sendfile) keep working
+                return app_iter
+            return ClosingIterator(itertools.chain(written, app_iter), getattr(app_iter, 'close', None))
+
+        compressor = COMPRESSORS[encoding](self.config.get('COMPRESSION_LEVELS', DEFAULT_LEVELS)[encoding])
+        headers['Content-Encoding'] = encoding
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+
+        if plan == 'stream':
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return ClosingIterator(self._stream(compressor, written, app_iter), getattr(app_iter, 'close', None))
+
+        try:
+            body = compressor.compress(b''.join(written) + b''.join(app_iter)) + compressor.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        headers['Content-Length'] = str(len(body))
+        start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+        return [body]
+
+    def _plan(self, status, headers, encoding, min_size, environ):
+        """'buffer' or 'stream' to compress the response, None to send it as it is.
+
+        Adds ``Vary: Accept-Encoding`` to every compressible response.
+        """
+        code = int(status.split(None, 1)[0])
+        mimetype = headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        if (code < 200 or code in (204, 206, 304) or 'Content-Encoding' in headers or 'Content-Range' in headers
+                or not is_compressible(mimetype)):
+            return None
+        if 'no-transform' in headers.get('Cache-Control', '').lower():
+            return None
+
+        vary = [value.strip() for value in headers.get('Vary', '').split(',') if value.strip()]
+        if 'accept-encoding' not in (value.lower() for value in vary) and '*' not in vary:
+            headers['Vary'] = ', '.join(vary + ['Accept-Encoding'])
+
+        length = headers.get('Content-Length')
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return None
+        if length is None:
+            return 'stream'
+        return 'buffer' if int(length) >= min_size else None
+
+    @staticmethod
+    def _stream(compressor, written, app_iter):
+        for chunk in written:
+            yield compressor.compress(chunk) + compressor.flush()
+        for chunk in app_iter:
+            if chunk:
+                # Flush per chunk so progress reaches the client as it is produced
+                yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
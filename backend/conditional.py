@@ -0,0 +1,99 @@
+"""
+Conditional GET (ETag/Last-Modified and 304 Not Modified) for the course pages.
+
+course_list, course_detail and lesson_detail compute their validators
+before rendering anything or loading relationships:
+
+- the ETag is a weak hash of what the page shows: the entities'
+  ``updated_at`` and counters (for the listing, one light query over the
+  courses the viewer can see, plus the per-category course counts of its
+  sidebar), which course thumbnail variants the image
+  pool has written so far (images.thumbnail_version()), the viewer (id, username and role, which
+  also decide enrollment and ownership) and the versions of the templates
+  the page is rendered from (fragments.template_version()) and the static
+  asset build the page links to (assets.manifest_version());
+- Last-Modified is the newest entity timestamp. It cannot see a change of
+  viewer, so clients that send If-None-Match (all browsers do once they
+  have an ETag) are answered from the ETag alone. course_list sends none:
+  its sidebar counts change when courses outside the listing are deleted,
+  which leaves no timestamp to compare.
+
+When the client's copy is current the view returns ``304 Not Modified``
+straight away. Pages are sent with ``Cache-Control: private, no-cache``
+(per-user, so shared caches must not store them; browsers revalidate on
+every visit) and ``Vary: Cookie``. Requests with pending flash messages
+always get the full page, since rendering it is what shows the message.
+"""
+
+import hashlib
+from datetime import timezone
+
+from flask import make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from .assets import manifest_version
+from .fragments import template_version
+from .images import thumbnail_version
+from .models import Course
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def viewer_key():
+    """The parts of the current user that change a page."""
+    if not current_user.is_authenticated:
+        return ('anonymous',)
+    return (current_user.id, current_user.username, current_user.role)
+
+
+def page_etag(*parts, templates=()):
+    """Weak ETag value (unquoted) for ``parts`` and, for pages, their ``templates`` and the asset build."""
+    digest = hashlib.sha256()
+    if templates:
+        # Rendered pages also embed the fingerprinted asset URLs
+        parts += tuple(template_version(name) for name in templates) + (manifest_version(),)
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+
+def newest(*timestamps):
+    """Latest of the given (naive UTC) timestamps as an aware datetime, or None."""
+    present = [ts for ts in timestamps if ts is not None]
+    return max(present).replace(tzinfo=timezone.utc) if present else None
+
+
+def courses_version(query):
+    """``(count, latest updated_at, total enrollments, thumbnail variants)`` of the courses ``query`` selects."""
+    # The viewer's own or enrolled courses: few rows, so they are read rather than aggregated
+    rows = query.with_entities(
+        Course.id, Course.updated_at, Course.enrollment_count, Course.thumbnail
+    ).order_by(None).order_by(Course.id).all()
+    return (
+        len(rows),
+        max((row.updated_at for row in rows if row.updated_at is not None), default=None),
+        sum(row.enrollment_count for row in rows),
+        tuple(thumbnail_version(row.thumbnail) for row in rows),
+    )
+
+
+def not_modified(etag, last_modified=None):
+    """A 304 response if the client's copy matches the validators, else None."""
+    if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return with_validators(make_response('', 304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    """Attach the validators and the per-user caching headers to a page response."""
+    response = make_response(response)
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.add('Cookie')
+    return response
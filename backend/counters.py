@@ -0,0 +1,111 @@
+"""
+Denormalized enrollment/lesson counters on Course.
+
+Course.enrollment_count and Course.lesson_count are maintained from session
+flush hooks, so every route that adds or deletes an Enrollment or Lesson
+through the ORM updates them in the same transaction without having to
+remember to. The counters are bumped with relative UPDATEs
+(``count = count + delta``) so concurrent writers never lose increments.
+
+Bulk statements that bypass the ORM (``Query.delete()``, raw SQL) must either
+adjust the counters themselves or call recount_course_counters().
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, select, update
+
+from .models import db, Course, Lesson, Enrollment
+
+# Model class -> name of the Course counter column it drives
+COUNTED_MODELS = {
+    Enrollment: 'enrollment_count',
+    Lesson: 'lesson_count',
+}
+
+_PENDING_KEY = 'course_counter_deltas'
+
+
+def _old_course_id(obj):
+    """Return the course_id an object had when it was loaded."""
+    history = inspect(obj).attrs.course_id.history
+    if history.deleted:
+        return history.deleted[0]
+    return obj.course_id
+
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_counter_deltas(session, flush_context):
+    deltas = defaultdict(lambda: defaultdict(int))
+
+    for obj in session.new:
+        column = COUNTED_MODELS.get(type(obj))
+        if column and obj.course_id is not None:
+            deltas[obj.course_id][column] += 1
+
+    for obj in session.deleted:
+        column = COUNTED_MODELS.get(type(obj))
+        if column:
+            course_id = _old_course_id(obj)
+            if course_id is not None:
+                deltas[course_id][column] -= 1
+
+    # Rows moved from one course to another
+    for obj in session.dirty:
+        column = COUNTED_MODELS.get(type(obj))
+        if not column:
+            continue
+        history = inspect(obj).attrs.course_id.history
+        if history.has_changes():
+            for old_id in history.deleted:
+                if old_id is not None:
+                    deltas[old_id][column] -= 1
+            for new_id in history.added:
+                if new_id is not None:
+                    deltas[new_id][column] += 1
+
+    for course_id, columns in deltas.items():
+        values = {name: getattr(Course, name) + delta for name, delta in columns.items() if delta}
+        if values:
+            # A counter change is not an edit of the course: keep updated_at
+            # (the fragment cache keys on it, see fragments.py)
+            session.execute(update(Course).where(Course.id == course_id)
+                            .values(updated_at=Course.updated_at, **values))
+            session.info.setdefault(_PENDING_KEY, {})[course_id] = list(values)
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _expire_stale_counters(session, flush_context):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    # Make loaded Course objects re-read the counters on next access
+    for course_id, names in pending.items():
+        course = session.identity_map.get(inspect(Course).identity_key_from_primary_key((course_id,)))
+        if course is not None and course not in session.deleted:
+            session.expire(course, names)
+
+
+def recount_course_counters():
+    """Rebuild every course's counters from the enrollment and lesson tables.
+
+    Runs as a single UPDATE with correlated subqueries and returns the number
+    of courses touched. The caller is responsible for committing.
+    """
+    enrollment_total = (
+        select(func.count(Enrollment.id))
+        .where(Enrollment.course_id == Course.id)
+        .scalar_subquery()
+    )
+    lesson_total = (
+        select(func.count(Lesson.id))
+        .where(Lesson.course_id == Course.id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        update(Course).values(enrollment_count=enrollment_total, lesson_count=lesson_total,
+                              updated_at=Course.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire_all()
+    return result.rowcount
@@ -0,0 +1,170 @@
+"""
+Course code allocation.
+
+Codes keep their old format (8 characters of A-Z and 0-9) but are no longer
+drawn at random and checked with one SELECT per candidate. Each code is a
+keyed permutation of a counter::
+
+    code = base36(feistel(counter, COURSE_CODE_KEY))
+
+The permutation is a 4-round Feistel network over 40 bits with HMAC-SHA256
+round functions, i.e. a bijection: distinct counter values always give
+distinct codes, and without the key consecutive courses get unrelated codes
+that cannot be guessed from one another.
+
+Counter values are reserved in blocks of COURSE_CODE_BLOCK_SIZE from the
+``allocator_counters`` table with one UPDATE, so most allocations need no
+database round trip at all and two processes never share a block. The
+reservation is part of the caller's transaction; if that rolls back the
+block is dropped from memory as well.
+
+A new code can still clash with a randomly generated code from before this
+allocator existed. Callers therefore insert optimistically and retry with a
+fresh code when the unique index rejects it (add_course()) instead of
+checking first.
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from .app import app
+from .models import db, AllocatorCounter
+
+COUNTER_NAME = 'course_code'
+DEFAULT_BLOCK_SIZE = 100
+CODE_LENGTH = 8
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+HALF_BITS = 20
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+MAX_COUNTER = 1 << (2 * HALF_BITS)
+
+DEFAULT_RETRIES = 5
+
+_lock = threading.Lock()
+_block = {'pid': None, 'next': 0, 'end': 0}
+_table_ready = set()
+
+_RESERVED_KEY = 'course_code_block_reserved'
+
+
+def _key():
+    key = app.config.get('COURSE_CODE_KEY') or 'course-code:' + app.config['SECRET_KEY']
+    return key.encode() if isinstance(key, str) else key
+
+
+def _round(key, index, half):
+    digest = hmac.new(key, bytes([index]) + half.to_bytes(3, 'big'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:3], 'big') & HALF_MASK
+
+
+def permute(value, key=None):
+    """Map a counter value in ``[0, 2**40)`` to a unique value in the same range."""
+    if not 0 <= value < MAX_COUNTER:
+        raise ValueError('Course code counter exhausted')
+    key = key or _key()
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for index in range(ROUNDS):
+        left, right = right, left ^ _round(key, index, right)
+    return (left << HALF_BITS) | right
+
+
+def encode_code(value):
+    """Base-36 encode ``value`` as a fixed-width course code."""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def code_for(counter, key=None):
+    return encode_code(permute(counter, key))
+
+
+def _ensure_table(session):
+    url = session.get_bind().url
+    if url not in _table_ready:
+        AllocatorCounter.__table__.create(session.connection(), checkfirst=True)
+        _table_ready.add(url)
+
+
+def _reserve(count):
+    """Reserve ``count`` consecutive counter values; returns the first one."""
+    session = db.session
+    _ensure_table(session)
+    table = AllocatorCounter.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        session.execute(insert(table).values(name=COUNTER_NAME, next_value=1)
+                        .on_conflict_do_nothing(index_elements=[table.c.name]))
+    elif session.execute(select(table.c.name).where(table.c.name == COUNTER_NAME)).first() is None:
+        session.execute(table.insert().values(name=COUNTER_NAME, next_value=1))
+    session.execute(update(table).where(table.c.name == COUNTER_NAME)
+                    .values(next_value=table.c.next_value + count))
+    end = session.execute(select(table.c.next_value).where(table.c.name == COUNTER_NAME)).scalar_one()
+    session.info[_RESERVED_KEY] = True
+    return end - count
+
+
+@event.listens_for(db.session, 'after_commit')
+def _keep_reserved_block(session):
+    session.info.pop(_RESERVED_KEY, None)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_reserved_block(session):
+    if session.in_nested_transaction():
+        # Only a savepoint was rolled back; the reservation still stands
+        return
+    # The reservation was undone, so another process may now get the same values
+    if session.info.pop(_RESERVED_KEY, False):
+        with _lock:
+            _block.update(next=0, end=0)
+
+
+def allocate_course_code():
+    """Return one new course code, reserving a new block of counter values when needed."""
+    with _lock:
+        if _block['pid'] != os.getpid():
+            # Never reuse a block inherited from the parent of a forked worker
+            _block.update(pid=os.getpid(), next=0, end=0)
+        if _block['next'] >= _block['end']:
+            block_size = app.config.get('COURSE_CODE_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+            start = _reserve(block_size)
+            _block.update(next=start, end=start + block_size)
+        counter = _block['next']
+        _block['next'] += 1
+    return code_for(counter)
+
+
+def is_code_conflict(error):
+    """True if an IntegrityError was raised by the course_code unique index."""
+    return 'course_code' in str(getattr(error, 'orig', error))
+
+
+def add_course(course, retries=DEFAULT_RETRIES):
+    """Add and flush a new course, giving it a fresh code.
+
+    The insert runs in a savepoint; if the code collides with an existing one
+    the savepoint is rolled back and the course is retried with a new code.
+    """
+    for attempt in range(retries + 1):
+        course.course_code = allocate_course_code()
+        try:
+            with db.session.begin_nested():
+                db.session.add(course)
+            return course
+        except IntegrityError as e:
+            if attempt == retries or not is_code_conflict(e):
+                raise
+            app.logger.warning('Course code collision, retrying with a new code')
+    return course
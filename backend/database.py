@@ -0,0 +1,227 @@
+"""
+Database engine configuration: SQLite pragmas, connection pools and pool metrics.
+
+Everything here is driven by app.config, which reads ``LMS_*`` environment
+variables (see app.py):
+
+- engine_options() builds SQLALCHEMY_ENGINE_OPTIONS: an explicit pool size,
+  overflow and checkout timeout, and for SQLite a busy timeout so a writer
+  waits for the lock instead of failing with ``database is locked``;
+- every new SQLite connection gets ``foreign_keys=ON`` (SQLite ignores
+  foreign keys and their ON DELETE actions unless asked) and the configured
+  pragmas: WAL journal
+  (readers no longer block on the writer), ``synchronous=NORMAL`` (safe
+  with WAL, one fsync per checkpoint instead of per commit), mmap and page
+  cache sizes. Set a pragma's config value to None to leave SQLite's default;
+- with DB_READ_POOL_SIZE > 0, the reads of GET/HEAD requests go to a
+  separate pool of ``query_only`` connections (DATABASE_READ_URI, or the
+  main database), leaving the main pool to requests that write. A GET that
+  does write (e.g. the admin toggles) is sent to the main pool from its
+  first write on, and reads after it stay there so it sees its own changes;
+- pools record checkouts, time spent waiting for a connection, checkout
+  timeouts and ``database is locked`` errors (pool_metrics(), shown on the
+  admin settings page). Counters are per process.
+"""
+
+import sqlite3
+import threading
+import time
+
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc, make_url
+from sqlalchemy.pool import QueuePool
+
+PRAGMA_SETTINGS = (
+    ('journal_mode', 'SQLITE_JOURNAL_MODE'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS'),
+    ('mmap_size', 'SQLITE_MMAP_SIZE'),
+    ('cache_size', 'SQLITE_CACHE_SIZE'),
+)
+
+# session.info keys: reads may use the read pool / the request has written
+READ_POOL_KEY = 'read_pool'
+WROTE_KEY = 'wrote'
+
+_lock = threading.Lock()
+_metrics = {}
+_pools = {}
+
+
+def _is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URI."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and not _is_sqlite_file(url):
+        # In-memory databases live in a single connection (Flask-SQLAlchemy uses StaticPool)
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_logging_name': 'main',
+    }
+    if url.get_backend_name() == 'sqlite':
+        # Pooled connections move between threads; the busy timeout is in seconds
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT'], 'check_same_thread': False}
+    return options
+
+
+def sqlite_pragmas(config):
+    """``(name, value)`` pragmas run on every new SQLite connection."""
+    return [('foreign_keys', 'ON')] + [(name, config[key]) for name, key in PRAGMA_SETTINGS
+                                       if config.get(key) is not None]
+
+
+# Metrics --------------------------------------------------------------------
+
+def _entry(pool_name):
+    return _metrics.setdefault(pool_name, {'checkouts': 0, 'wait_total': 0.0, 'wait_max': 0.0,
+                                           'timeouts': 0, 'locked': 0})
+
+
+def _count(pool_name, key):
+    with _lock:
+        _entry(pool_name)[key] += 1
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with _lock:
+            # engine.dispose() replaces the pool with a new one of the same name
+            _pools[self.logging_name or 'main'] = self
+
+    def _do_get(self):
+        name = self.logging_name or 'main'
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            _count(name, 'timeouts')
+            raise
+        waited = time.perf_counter() - started
+        with _lock:
+            entry = _entry(name)
+            entry['checkouts'] += 1
+            entry['wait_total'] += waited
+            entry['wait_max'] = max(entry['wait_max'], waited)
+        return connection
+
+
+def pool_metrics():
+    """Per-pool counters plus the pool's current size and connections in use."""
+    with _lock:
+        pools = dict(_pools)
+        entries = {name: dict(_entry(name)) for name in pools}
+    metrics = {}
+    for name, pool in sorted(pools.items()):
+        entry = entries[name]
+        metrics[name] = {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'checkouts': entry['checkouts'],
+            'avg_wait': entry['wait_total'] / entry['checkouts'] if entry['checkouts'] else 0.0,
+            'max_wait': entry['wait_max'],
+            'timeouts': entry['timeouts'],
+            'locked': entry['locked'],
+        }
+    return metrics
+
+
+def reset_pool_metrics():
+    with _lock:
+        _metrics.clear()
+
+
+# Engines --------------------------------------------------------------------
+
+def _configure_engine(engine, pragmas, read_only=False):
+    name = engine.pool.logging_name or 'main'
+
+    if engine.dialect.name == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in pragmas:
+                cursor.execute(f'PRAGMA {pragma}={value}')
+            if read_only:
+                cursor.execute('PRAGMA query_only=ON')
+            cursor.close()
+
+    @event.listens_for(engine, 'handle_error')
+    def _count_lock_errors(context):
+        error = context.original_exception
+        if isinstance(error, sqlite3.OperationalError) and 'locked' in str(error):
+            _count(name, 'locked')
+
+
+def _create_read_engine(app, pragmas):
+    from .models import db
+
+    url = app.config.get('DATABASE_READ_URI') or db.engine.url
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': app.config['DB_READ_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_logging_name': 'read',
+    }
+    if make_url(url).get_backend_name() == 'sqlite':
+        if not _is_sqlite_file(url):
+            app.logger.warning('DB_READ_POOL_SIZE ignored: an in-memory SQLite database cannot be shared')
+            return None
+        options['connect_args'] = {'timeout': app.config['SQLITE_BUSY_TIMEOUT'], 'check_same_thread': False}
+    engine = create_engine(url, **options)
+    _configure_engine(engine, pragmas, read_only=True)
+    return engine
+
+
+def read_engine(app=None):
+    """The read-only engine for GET/HEAD requests, or None when disabled."""
+    app = app or current_app
+    return app.extensions.get('lms_read_engine')
+
+
+class RoutingSession(Session):
+    """Session sending the SELECTs of GET/HEAD requests to the read-only pool.
+
+    Flushes, DML statements, textual SQL and bare session.connection() calls
+    use the main engine, and once one has, the rest of the request does too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(READ_POOL_KEY) and not self.info.get(WROTE_KEY):
+            if clause is not None and getattr(clause, 'is_select', False) and not self._flushing:
+                engine = read_engine()
+                if engine is not None:
+                    return engine
+            self.info[WROTE_KEY] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_database(app):
+    """Apply pragmas and metrics to the app's engines and set up the read pool."""
+    from .models import db
+
+    pragmas = sqlite_pragmas(app.config)
+    with app.app_context():
+        for engine in db.engines.values():
+            _configure_engine(engine, pragmas)
+        if app.config['DB_READ_POOL_SIZE']:
+            engine = _create_read_engine(app, pragmas)
+            if engine is not None:
+                app.extensions['lms_read_engine'] = engine
+
+    @app.before_request
+    def _route_reads():
+        if request.method in ('GET', 'HEAD') and read_engine(app) is not None:
+            db.session.info[READ_POOL_KEY] = True
@@ -0,0 +1,122 @@
+"""
+Set-based cascade deletion for courses and users.
+
+Deleting through the ORM loads every lesson and enrollment and issues one
+DELETE per row. delete_courses() and delete_users() instead run a handful
+of ``DELETE ... WHERE course_id IN (...)`` statements in the current
+transaction, whatever the number of rows, and work for one id or many.
+
+Because the statements bypass the unit of work:
+
+- media references are released in bulk (storage.release_many), which
+  queues the files for the cleanup job once the caller commits;
+- enrollment counters of courses that survive (a deleted student's other
+  courses) are adjusted with one UPDATE, since the counters.py flush hooks
+  do not see these rows;
+- the admin statistics snapshot, the cached login snapshots of deleted
+  users (user_cache.py) and the cached enrollment sets (access.py) are
+  marked stale explicitly.
+
+The schema declares the same cascades (``ON DELETE CASCADE``), so rows are
+not left dangling even when something is deleted another way. The caller
+commits.
+"""
+
+from sqlalchemy import delete, func, select, update
+
+from .access import mark_enrollments_changed
+from .images import thumbnail_derivatives
+from .models import db, User, Course, Lesson, Enrollment, UploadSession
+from .stats import mark_dashboard_stats_dirty
+from .storage import release_many
+from .user_cache import mark_users_changed
+
+# Ids per IN (...) list, well below SQLite's bound-parameter limit
+ID_BATCH_SIZE = 500
+
+
+class DeletionResult:
+    """Row counts and media paths released by a cascade delete."""
+
+    def __init__(self):
+        self.courses = 0
+        self.lessons = 0
+        self.enrollments = 0
+        self.users = 0
+        self.media_paths = set()
+
+    def __repr__(self):
+        return (f'<DeletionResult users={self.users} courses={self.courses} '
+                f'lessons={self.lessons} enrollments={self.enrollments} media={len(self.media_paths)}>')
+
+
+def _batches(ids):
+    ids = sorted({int(i) for i in ids})
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        yield ids[start:start + ID_BATCH_SIZE]
+
+
+def _execute(statement):
+    return db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
+
+
+def _delete_course_batch(course_ids, result):
+    media = []
+    thumbnails = {}
+    for video, document in db.session.execute(
+        select(Lesson.video_file, Lesson.lesson_file).where(Lesson.course_id.in_(course_ids))
+    ):
+        media.extend((video, document))
+    for thumbnail in db.session.execute(
+        select(Course.thumbnail).where(Course.id.in_(course_ids), Course.thumbnail.isnot(None))
+    ).scalars():
+        media.append(thumbnail)
+        thumbnails[thumbnail] = thumbnail_derivatives(thumbnail)
+
+    result.enrollments += _execute(delete(Enrollment).where(Enrollment.course_id.in_(course_ids)))
+    result.lessons += _execute(delete(Lesson).where(Lesson.course_id.in_(course_ids)))
+    _execute(delete(UploadSession).where(UploadSession.course_id.in_(course_ids)))
+    result.courses += _execute(delete(Course).where(Course.id.in_(course_ids)))
+    result.media_paths |= release_many(media, thumbnails)
+    # Any student may have been enrolled in these courses
+    mark_enrollments_changed()
+
+
+def delete_courses(course_ids, result=None):
+    """Delete courses with their lessons, enrollments and pending uploads."""
+    result = result or DeletionResult()
+    for batch in _batches(course_ids):
+        _delete_course_batch(batch, result)
+    mark_dashboard_stats_dirty()
+    return result
+
+
+def delete_users(user_ids, result=None):
+    """Delete users, the courses they teach and their enrollments."""
+    result = result or DeletionResult()
+    for batch in _batches(user_ids):
+        owned = db.session.execute(select(Course.id).where(Course.instructor_id.in_(batch))).scalars().all()
+        delete_courses(owned, result)
+
+        # Courses the users were enrolled in lose those enrollments
+        removed = (select(func.count(Enrollment.id))
+                   .where(Enrollment.course_id == Course.id, Enrollment.student_id.in_(batch))
+                   .scalar_subquery())
+        _execute(
+            update(Course)
+            .where(Course.id.in_(select(Enrollment.course_id).where(Enrollment.student_id.in_(batch))))
+            # A counter change, not an edit: keep updated_at (see counters.py)
+            .values(enrollment_count=Course.enrollment_count - removed, updated_at=Course.updated_at)
+        )
+        result.enrollments += _execute(delete(Enrollment).where(Enrollment.student_id.in_(batch)))
+        mark_enrollments_changed(batch)
+        _execute(delete(UploadSession).where(UploadSession.user_id.in_(batch)))
+
+        pictures = db.session.execute(
+            select(User.profile_picture).where(User.id.in_(batch), User.profile_picture.isnot(None))
+        ).scalars().all()
+        result.users += _execute(delete(User).where(User.id.in_(batch)))
+        mark_users_changed(batch)
+        result.media_paths |= release_many(pictures)
+    mark_dashboard_stats_dirty()
+    return result
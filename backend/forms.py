@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, TextAreaField, SelectField, IntegerField, PasswordField, BooleanField, RadioField
+from wtforms import HiddenField, StringField, TextAreaField, SelectField, IntegerField, PasswordField, BooleanField, RadioField
 from wtforms.validators import DataRequired, Length, EqualTo, Optional, URL, NumberRange
 
 class LoginForm(FlaskForm):
@@ -68,6 +68,8 @@ class LessonForm(FlaskForm):
                            render_kw={"class": "form-control", "placeholder": "https://youtube.com/watch?v=..."})
     video_file = FileField('Video File', validators=[Optional()], 
                           render_kw={"class": "form-control", "accept": "video/*"})
+    # Set by the chunked uploader once a large video has been uploaded through /api/uploads
+    video_upload_id = HiddenField('Video Upload', validators=[Optional(), Length(max=32)])
     text_content = TextAreaField('Text Content', validators=[Optional()], 
                                 render_kw={"class": "form-control", "rows": 10})
     lesson_file = FileField('Additional File', validators=[Optional()], 
@@ -0,0 +1,249 @@
+"""
+Rendered-fragment cache for the course and lesson pages.
+
+The parts of course_detail and lesson_detail that look the same to every
+viewer (course header, lesson outline, lesson statistics, lesson content)
+live in partial templates. cached_fragment() returns the rendered partial
+from the cache, and only runs the queries it needs and renders it on a miss.
+Per-user parts (enroll button, instructor actions, course code,
+enrollment count) stay in the page templates and render on every request.
+
+Keys are built from:
+
+- the fragment name and a hash of its template source, so a deploy that
+  changes a partial never serves the old markup;
+- course_version(): the course id and ``updated_at``, its category and
+  instructor ids, plus the latest ``updated_at`` and the number of its
+  lessons (one indexed aggregate query). Editing the course or adding,
+  editing or deleting a lesson changes the key;
+- whatever else the fragment depends on (e.g. the lesson being shown, or
+  for the course header the thumbnail variants written so far: the first
+  render usually happens before the image pool has produced any).
+
+Old entries are never invalidated explicitly: they stop being requested
+and age out through the LRU bound or FRAGMENT_CACHE_TTL. The TTL also
+bounds how long a renamed category or instructor shows its old name.
+
+Backends (FRAGMENT_CACHE): ``memory`` is a per-process LRU of at most
+FRAGMENT_CACHE_SIZE entries; ``disk`` stores one file per entry under
+FRAGMENT_CACHE_DIR, shared by all worker processes (expired files are
+removed by ``flask --app backend.app purge-fragment-cache``); ``off``
+disables caching. Hit/miss counters are per process (fragment_metrics()).
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, render_template
+from markupsafe import Markup
+from sqlalchemy import func, select
+
+from .models import db, Lesson
+
+DEFAULT_TTL = 3600
+DEFAULT_SIZE = 2000
+
+_lock = threading.Lock()
+_metrics = {}
+_template_versions = {}
+_backend = None
+
+
+class MemoryBackend:
+    """Per-process LRU of rendered fragments."""
+
+    name = 'memory'
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl=None):
+        # Entries carry the expiry they were stored with
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, html, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge(self, ttl):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskBackend:
+    """Rendered fragments as files, shared by every process using the directory.
+
+    Files are named after the SHA-256 of their key and written to a temporary
+    file first, so readers never see a partial entry. An entry expires
+    ``ttl`` seconds after it was written (its mtime).
+    """
+
+    name = 'disk'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + '.html')
+
+    def get(self, key, ttl=None):
+        path = self._path(key)
+        try:
+            if ttl is not None and os.path.getmtime(path) + ttl <= time.time():
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, html, ttl):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def purge(self, ttl):
+        """Remove entries older than ``ttl`` seconds; returns how many."""
+        cutoff = time.time() - ttl
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) <= cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def get_backend():
+    """The configured backend, or None when the cache is off."""
+    global _backend
+    config = current_app.config
+    kind = config.get('FRAGMENT_CACHE', 'memory')
+    with _lock:
+        if _backend is None or _backend.name != kind:
+            if kind == 'memory':
+                _backend = MemoryBackend(config.get('FRAGMENT_CACHE_SIZE', DEFAULT_SIZE))
+            elif kind == 'disk':
+                _backend = DiskBackend(config['FRAGMENT_CACHE_DIR'])
+            else:
+                _backend = None
+        return _backend
+
+
+def _count(name, outcome):
+    with _lock:
+        entry = _metrics.setdefault(name, {'hits': 0, 'misses': 0})
+        entry[outcome] += 1
+
+
+def fragment_metrics():
+    """Per-fragment hit/miss counters for this process."""
+    with _lock:
+        return {
+            name: {
+                'hits': entry['hits'],
+                'misses': entry['misses'],
+                'hit_rate': entry['hits'] / (entry['hits'] + entry['misses']),
+            }
+            for name, entry in sorted(_metrics.items())
+        }
+
+
+def template_version(template):
+    """Short hash of a template's source; re-read on every call when templates auto-reload."""
+    app = current_app._get_current_object()
+    reload = app.debug or app.config.get('TEMPLATES_AUTO_RELOAD')
+    if not reload and template in _template_versions:
+        return _template_versions[template]
+    source = app.jinja_env.loader.get_source(app.jinja_env, template)[0]
+    version = hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]
+    _template_versions[template] = version
+    return version
+
+
+def course_version(course):
+    """Key parts that change whenever the course or any of its lessons changes."""
+    latest, count = db.session.execute(
+        select(func.max(Lesson.updated_at), func.count(Lesson.id)).where(Lesson.course_id == course.id)
+    ).one()
+    return (course.id, course.updated_at, course.category_id, course.instructor_id, latest, count)
+
+
+def cached_fragment(name, template, key, context):
+    """Render ``template`` (or reuse the cached markup) for ``name`` and ``key``.
+
+    ``key`` is a tuple of the values the fragment depends on; ``context`` is
+    a callable returning the template variables, only called on a miss.
+    """
+    backend = get_backend()
+    if backend is None:
+        return Markup(render_template(template, **context()))
+
+    ttl = current_app.config.get('FRAGMENT_CACHE_TTL', DEFAULT_TTL)
+    cache_key = '|'.join([name, template_version(template)] + [str(part) for part in key])
+    html = backend.get(cache_key, ttl)
+    if html is not None:
+        _count(name, 'hits')
+        return Markup(html)
+
+    _count(name, 'misses')
+    html = render_template(template, **context())
+    backend.set(cache_key, html, ttl)
+    return Markup(html)
+
+
+def purge_fragments():
+    """Drop expired entries from the configured backend; returns how many."""
+    backend = get_backend()
+    if backend is None:
+        return 0
+    return backend.purge(current_app.config.get('FRAGMENT_CACHE_TTL', DEFAULT_TTL))
+
+
+def clear_fragments():
+    """Drop every cached fragment and reset the counters."""
+    backend = get_backend()
+    if backend is not None:
+        backend.clear()
+    with _lock:
+        _metrics.clear()
@@ -0,0 +1,208 @@
+"""
+Course thumbnail pipeline (Pillow).
+
+Uploaded thumbnails are validated and re-encoded without EXIF/GPS metadata
+in the request (strip_metadata()), before storage.py hashes them: the
+stored original is served as immutable under its content hash, so it must
+never change afterwards. A process pool then produces resized JPEG and
+WebP variants next to it (``name.w320.jpg``, ``name.w320.webp``, ...); the
+request does not wait for this.
+
+Templates render thumbnails through thumbnail_variants() (exposed as a
+Jinja global) which lists the variants that exist so far, falling back to
+the original until the pool has finished.
+
+The Pillow work (process_thumbnail) deliberately does not import the Flask
+app, so pool workers stay light to start.
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF'}
+# Reject decompression bombs well before Pillow's own (warning-only) limit
+MAX_PIXELS = 40_000_000
+
+_executor = None
+
+
+class InvalidImage(ValueError):
+    """Raised when an uploaded file is not an acceptable image."""
+
+
+def validate_image(stream):
+    """Check that ``stream`` holds a JPEG/PNG/GIF of sane dimensions.
+
+    The stream is rewound afterwards so it can still be saved.
+    """
+    try:
+        with Image.open(stream) as img:
+            if img.format not in ALLOWED_FORMATS:
+                raise InvalidImage('Unsupported image format.')
+            width, height = img.size
+            if width * height > MAX_PIXELS:
+                raise InvalidImage('Image dimensions are too large.')
+            img.verify()
+    except Image.DecompressionBombError as e:
+        # Raised by Image.open() itself for headers far beyond MAX_PIXELS
+        raise InvalidImage('Image dimensions are too large.') from e
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidImage('The uploaded file is not a valid image.') from e
+    finally:
+        stream.seek(0)
+
+
+def strip_metadata(file):
+    """Re-encode an uploaded JPEG/PNG without its metadata, in place of ``file.stream``.
+
+    The EXIF orientation is applied to the pixels first, so the image still
+    displays the right way up. Other formats (GIF) are left as they are.
+    Call after validate_image().
+    """
+    with Image.open(file.stream) as original:
+        original_format = original.format
+        if original_format not in ('JPEG', 'PNG'):
+            file.stream.seek(0)
+            return file
+        img = ImageOps.exif_transpose(original)
+        cleaned = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+        # Only the colour profile is carried over; EXIF, GPS and text chunks are dropped
+        icc_profile = original.info.get('icc_profile')
+        if original_format == 'JPEG':
+            img.save(cleaned, format='JPEG', quality=90, optimize=True, icc_profile=icc_profile)
+        else:
+            img.save(cleaned, format='PNG', optimize=True, icc_profile=icc_profile)
+    cleaned.seek(0)
+    file.stream = cleaned
+    return file
+
+
+def variant_path(path, width, ext):
+    """``course_thumbnails/a.jpg`` -> ``course_thumbnails/a.w320.<ext>``."""
+    base = path.rsplit('.', 1)[0]
+    return f'{base}.w{width}.{ext}'
+
+
+def _save_atomic(img, destination, **save_kwargs):
+    # Write to a temp file first so a half-written variant is never served
+    directory = os.path.dirname(destination)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        img.save(tmp_path, **save_kwargs)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def process_thumbnail(media_root, path, widths=THUMBNAIL_WIDTHS):
+    """Generate the resized variants for ``path``; the original itself is never rewritten.
+
+    Runs in a pool worker. Returns the list of variant paths written.
+    """
+    source = os.path.join(media_root, path)
+    written = []
+    with Image.open(source) as original:
+        # Originals stored before strip_metadata() existed may still carry an orientation
+        img = ImageOps.exif_transpose(original)
+        if img.mode not in ('RGB', 'L'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            rgba = img.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            img = background
+        elif img.mode == 'L':
+            img = img.convert('RGB')
+
+        for width in widths:
+            if width > img.width and width != widths[0]:
+                continue
+            height = max(1, round(img.height * min(width, img.width) / img.width))
+            resized = img.resize((min(width, img.width), height), Image.LANCZOS)
+            for ext, kwargs in (
+                ('jpg', {'format': 'JPEG', 'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}),
+                ('webp', {'format': 'WEBP', 'quality': WEBP_QUALITY, 'method': 4}),
+            ):
+                target = variant_path(path, width, ext)
+                _save_atomic(resized, os.path.join(media_root, target), **kwargs)
+                written.append(target)
+    return written
+
+
+def _get_executor(max_workers):
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def schedule_thumbnail(path):
+    """Queue variant generation for a saved thumbnail and return immediately."""
+    from .app import app
+
+    if any(thumbnail_variants(path).values()):
+        # Already processed (the same image was uploaded before)
+        return
+    media_root = app.config['UPLOAD_FOLDER']
+    if app.config.get('IMAGE_PROCESSING_INLINE'):
+        try:
+            process_thumbnail(media_root, path)
+        except (OSError, ValueError):
+            app.logger.exception('Thumbnail processing failed for %s', path)
+        return
+
+    future = _get_executor(app.config.get('IMAGE_WORKERS', 2)).submit(process_thumbnail, media_root, path)
+
+    def _log_failure(done):
+        if done.exception() is not None:
+            app.logger.error('Thumbnail processing failed for %s: %s', path, done.exception())
+
+    future.add_done_callback(_log_failure)
+
+
+def thumbnail_variants(path, widths=THUMBNAIL_WIDTHS):
+    """Return ``{'jpg': [(path, width)], 'webp': [(path, width)]}`` for variants on disk."""
+    from .app import app
+
+    variants = {'jpg': [], 'webp': []}
+    if not path:
+        return variants
+    media_root = app.config['UPLOAD_FOLDER']
+    for width in widths:
+        for ext in variants:
+            candidate = variant_path(path, width, ext)
+            if os.path.exists(os.path.join(media_root, candidate)):
+                variants[ext].append((candidate, width))
+    return variants
+
+
+def thumbnail_version(path):
+    """How many JPEG and WebP variants of ``path`` exist so far, for cache keys and ETags.
+
+    Changes while the pool writes the variants, so markup rendered with the
+    original as its only source is not reused once they are there.
+    """
+    variants = thumbnail_variants(path)
+    return (len(variants['jpg']), len(variants['webp']))
+
+
+def thumbnail_derivatives(path, widths=THUMBNAIL_WIDTHS):
+    """All variant paths that may have been generated for ``path``."""
+    return [variant_path(path, w, ext) for w in widths for ext in ('jpg', 'webp')]
+
+
+def delete_thumbnail(path, widths=THUMBNAIL_WIDTHS):
+    """Release a thumbnail; its variants go with the file once nothing references it."""
+    from .storage import release
+
+    if path:
+        release(path, thumbnail_derivatives(path, widths))
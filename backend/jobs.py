@@ -0,0 +1,197 @@
+"""
+Durable background job queue stored in the application database.
+
+Routes call enqueue() to add a Job row to the current session, so the job
+is committed in the same transaction as the change that needs it: if the
+request fails, no job is left behind, and once it commits the work survives
+process restarts. A worker (``flask --app backend.app jobs-worker``) claims
+pending jobs one at a time and runs the handler registered for their kind.
+
+Delivery is at-least-once. A job's own database changes and its "done"
+status are committed together, and handlers are written to be idempotent
+(deleting something already deleted is a no-op), so a retry after a crash
+is harmless. Failures are retried with exponential backoff
+(JOB_RETRY_DELAY * 2 ** (attempts - 1) seconds) until ``max_attempts``, after
+which the job is marked failed and shown under /admin/jobs.
+
+Handlers live in tasks.py.
+"""
+
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+
+from .app import app
+from .models import db, Job
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 10
+# Running jobs whose worker has been silent this long are handed out again
+DEFAULT_STALE_AFTER = timedelta(minutes=15)
+
+ACTIVE_STATUSES = ('pending', 'running')
+JOB_STATUSES = ('pending', 'running', 'failed', 'done')
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler for jobs of ``kind``."""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, dedupe_key=None, delay=0, max_attempts=None, **payload):
+    """Add a job to the current session; workers see it once the caller commits.
+
+    If ``dedupe_key`` is given and a pending or running job already has it,
+    that job is returned instead of queueing a second one.
+    """
+    if dedupe_key:
+        existing = Job.query.filter(Job.dedupe_key == dedupe_key,
+                                    Job.status.in_(ACTIVE_STATUSES)).first()
+        if existing is not None:
+            return existing
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        dedupe_key=dedupe_key,
+        status='pending',
+        attempts=0,
+        max_attempts=max_attempts or app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        run_after=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_job(worker_id):
+    """Atomically mark the next due job as running for ``worker_id`` and return it (or None)."""
+    now = datetime.utcnow()
+    next_id = (select(Job.id)
+               .where(Job.status == 'pending', Job.run_after <= now)
+               .order_by(Job.run_after, Job.id)
+               .limit(1)
+               .scalar_subquery())
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id == next_id, Job.status == 'pending')
+        .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return None
+    return (Job.query
+            .filter(Job.status == 'running', Job.locked_by == worker_id)
+            .order_by(Job.locked_at.desc(), Job.id.desc())
+            .first())
+
+
+def run_job(job):
+    """Run one claimed job and record the outcome; returns True on success."""
+    job_id, kind = job.id, job.kind
+    handler = JOB_HANDLERS.get(kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind {kind!r}')
+        handler(**json.loads(job.payload or '{}'))
+        job = db.session.get(Job, job_id)
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        job.last_error = None
+        job.locked_by = None
+        db.session.commit()
+        return True
+    except Exception:
+        error = traceback.format_exc()
+        db.session.rollback()
+        app.logger.error('Job %s (%s) failed:\n%s', job_id, kind, error)
+
+    job = db.session.get(Job, job_id)
+    job.last_error = error[-4000:]
+    job.locked_by = None
+    if job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+    else:
+        delay = app.config.get('JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY) * 2 ** (job.attempts - 1)
+        job.status = 'pending'
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.commit()
+    return False
+
+
+def requeue_stale_jobs(stale_after=DEFAULT_STALE_AFTER):
+    """Put running jobs whose worker died back in the queue; returns how many."""
+    cutoff = datetime.utcnow() - stale_after
+    requeued = db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < cutoff)
+        .values(status='pending', locked_by=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return requeued
+
+
+def work(worker_id=None, burst=False, interval=1.0, max_jobs=None):
+    """Process jobs until interrupted (or, with ``burst``, until the queue is empty).
+
+    Returns the number of jobs run.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    requeue_stale_jobs()
+    while max_jobs is None or processed < max_jobs:
+        job = claim_job(worker_id)
+        if job is None:
+            if burst:
+                break
+            time.sleep(interval)
+            continue
+        run_job(job)
+        processed += 1
+        # Start every job with a clean session/identity map
+        db.session.remove()
+    return processed
+
+
+def retry_job(job):
+    """Queue a failed job again with a fresh attempt budget."""
+    job.status = 'pending'
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.finished_at = None
+    job.locked_by = None
+
+
+def job_counts():
+    """Return ``{status: count}`` for every status, zero-filled."""
+    counts = dict.fromkeys(JOB_STATUSES, 0)
+    rows = db.session.execute(select(Job.status, func.count(Job.id)).group_by(Job.status))
+    counts.update({status: total for status, total in rows})
+    return counts
+
+
+def purge_finished_jobs(older_than=timedelta(days=7)):
+    """Delete completed jobs finished before ``older_than`` ago; returns how many."""
+    cutoff = datetime.utcnow() - older_than
+    purged = db.session.execute(
+        delete(Job)
+        .where(Job.status == 'done', Job.finished_at < cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return purged
@@ -0,0 +1,56 @@
+"""
+Named eager-loading profiles for the list views.
+
+Each profile is a tuple of SQLAlchemy loader options describing which
+relationships a given page touches while rendering. Applying a profile to a
+query makes the page run a fixed number of SELECTs no matter how many rows
+it shows, instead of one lazy load per row.
+
+Usage:
+    courses = with_profile(Course.query, 'course_card').all()
+"""
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from .models import Course, Lesson, Enrollment
+
+LOADER_PROFILES = {
+    # Course cards on /courses: instructor name and category badge
+    'course_card': (
+        joinedload(Course.instructor_ref),
+        joinedload(Course.category_ref),
+    ),
+    # Rows in /admin/courses and the admin dashboard "recent courses" table
+    'admin_course_row': (
+        joinedload(Course.instructor_ref),
+        joinedload(Course.category_ref),
+    ),
+    # Rows in /admin/lessons
+    'admin_lesson_row': (
+        joinedload(Lesson.course_ref),
+    ),
+    # Rows in /admin/enrollments
+    'admin_enrollment_row': (
+        joinedload(Enrollment.student_ref),
+        joinedload(Enrollment.course_ref),
+    ),
+    # /api/v1 enrollment listings: student and course summaries
+    'api_enrollment': (
+        joinedload(Enrollment.student_ref),
+        joinedload(Enrollment.course_ref),
+    ),
+    # Course table on the instructor dashboard (counts come from the counter columns)
+    'instructor_dashboard': (
+        joinedload(Course.category_ref),
+    ),
+    # Enrollment list on the student dashboard: course card plus first lesson link
+    'student_dashboard': (
+        joinedload(Enrollment.course_ref).joinedload(Course.category_ref),
+        joinedload(Enrollment.course_ref).selectinload(Course.lessons),
+    ),
+}
+
+
+def with_profile(query, name):
+    """Apply the named loader profile to a query."""
+    return query.options(*LOADER_PROFILES[name])
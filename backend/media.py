@@ -0,0 +1,229 @@
+"""
+Media delivery for uploaded files (lesson videos, documents, thumbnails).
+
+send_media() is what the /media route serves through. On top of a plain file
+send it adds:
+
+- strong ETags and Last-Modified, answering If-None-Match/If-Modified-Since
+  with 304 and honouring If-Range;
+- single ``Range`` requests (206) so <video> seeking only fetches what it
+  needs, and multi-range requests as ``multipart/byteranges``;
+- a Cache-Control policy per media directory (MEDIA_CACHE_POLICIES);
+- zero-copy sending: whole files and single ranges go out through the WSGI
+  server's file wrapper (sendfile on gunicorn), USE_X_SENDFILE hands the
+  file to Apache/lighttpd, and MEDIA_X_ACCEL_PREFIX hands it to an nginx
+  ``internal`` location.
+"""
+
+import mimetypes
+import os
+import secrets
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import abort, request
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+from .app import app
+
+# Cache-Control per top-level media directory
+MEDIA_CACHE_POLICIES = {
+    'course_thumbnails': 'public, max-age=31536000, immutable',
+    'profile_pictures': 'public, max-age=86400',
+    'lesson_videos': 'private, max-age=86400',
+    'lesson_files': 'private, max-age=300, must-revalidate',
+}
+DEFAULT_CACHE_POLICY = 'private, no-cache'
+
+# More ranges than this in one request are ignored and the whole file is sent
+MAX_RANGES = 16
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def cache_policy_for(filename):
+    """Return the Cache-Control value for a media path like 'lesson_videos/a.mp4'."""
+    policies = app.config.get('MEDIA_CACHE_POLICIES', MEDIA_CACHE_POLICIES)
+    directory = filename.split('/', 1)[0] if '/' in filename else ''
+    return policies.get(directory, DEFAULT_CACHE_POLICY)
+
+
+def media_etag(stat):
+    """Strong validator derived from the file's identity, size and mtime."""
+    return f'{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+
+def _if_range_satisfied(etag, last_modified):
+    """True if there is no If-Range header or it still matches the file."""
+    if_range = request.if_range
+    if if_range.etag is None and if_range.date is None:
+        return True
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return if_range.date is not None and int(if_range.date.timestamp()) == int(last_modified.timestamp())
+
+
+def parse_byte_ranges(header):
+    """Parse a ``Range: bytes=...`` header into ``(start, stop)`` pairs.
+
+    ``stop`` is exclusive or None for open ranges; suffix ranges are returned
+    as ``(-length, None)``. Unlike Werkzeug's parser, overlapping and unsorted
+    ranges are accepted (they are coalesced later). Returns None for headers
+    that are not valid byte ranges, which callers should ignore.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        first, sep, last = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not first:
+                length = int(last)
+                if length <= 0:
+                    return None
+                ranges.append((-length, None))
+            elif not last:
+                ranges.append((int(first), None))
+            else:
+                start, end = int(first), int(last)
+                if end < start or start < 0:
+                    return None
+                ranges.append((start, end + 1))
+        except ValueError:
+            return None
+    return ranges or None
+
+
+def _resolve_ranges(byte_ranges, size):
+    """Turn parsed byte ranges into sorted, coalesced ``[start, stop)`` pairs within ``size``."""
+    resolved = []
+    for start, stop in byte_ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            resolved.append([start, stop])
+
+    resolved.sort()
+    merged = []
+    for start, stop in resolved:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def _read_span(path, start, stop):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _multirange_response(path, ranges, size, mimetype):
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = app.response_class(_read_span(path, start, stop), status=206,
+                                      mimetype=mimetype, direct_passthrough=True)
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.headers['Content-Length'] = str(stop - start)
+        return response
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    for index, (start, stop) in enumerate(ranges):
+        separator = b'' if index == 0 else b'\r\n'
+        header = separator + (
+            f'--{boundary}\r\n'
+            f'Content-Type: {mimetype}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+        ).encode('latin-1')
+        parts.append((header, start, stop))
+    closing = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+    content_length = sum(len(h) + (stop - start) for h, start, stop in parts) + len(closing)
+
+    def generate():
+        for header, start, stop in parts:
+            yield header
+            yield from _read_span(path, start, stop)
+        yield closing
+
+    response = app.response_class(generate(), status=206, direct_passthrough=True,
+                                  content_type=f'multipart/byteranges; boundary={boundary}')
+    response.headers['Content-Length'] = str(content_length)
+    return response
+
+
+def send_media(filename):
+    """Serve a file from UPLOAD_FOLDER with range, conditional and cache handling."""
+    path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = media_etag(stat)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    cache_control = cache_policy_for(filename)
+
+    accel_prefix = app.config.get('MEDIA_X_ACCEL_PREFIX')
+    if accel_prefix:
+        # nginx serves the bytes (ranges, sendfile) from an internal location
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(filename)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    environ = request.environ
+    byte_ranges = parse_byte_ranges(environ.get('HTTP_RANGE'))
+    multi_range = byte_ranges is not None and len(byte_ranges) > 1
+    if 'HTTP_RANGE' in environ and (byte_ranges is None or multi_range
+                                    or not _if_range_satisfied(etag, last_modified)):
+        # Werkzeug only handles single, well-formed ranges: malformed headers
+        # and stale If-Range are ignored, multi-range is answered below.
+        environ = {k: v for k, v in environ.items() if k not in ('HTTP_RANGE', 'HTTP_IF_RANGE')}
+
+    if multi_range and _if_range_satisfied(etag, last_modified):
+        ranges = _resolve_ranges(byte_ranges, size)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified,
+                                    ignore_if_range=True):
+            response = app.response_class(status=304)
+        elif not ranges:
+            response = app.response_class(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+        elif len(ranges) <= MAX_RANGES:
+            response = _multirange_response(path, ranges, size, mimetype)
+        else:
+            response = None
+        if response is not None:
+            response.set_etag(etag)
+            response.headers['Last-Modified'] = http_date(last_modified)
+            response.headers['Accept-Ranges'] = 'bytes'
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+    response = send_file(
+        path,
+        environ,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag,
+        last_modified=last_modified,
+        use_x_sendfile=app.config.get('USE_X_SENDFILE', False),
+        response_class=app.response_class,
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = cache_control
+    return response
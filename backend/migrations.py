@@ -0,0 +1,419 @@
+"""
+Versioned schema migrations.
+
+db.create_all() only creates missing tables; it never adds a column, an
+index or a foreign key action to a table that already exists. Schema
+changes are therefore written as numbered migrations, each with an
+``up`` and (where it can be undone) a ``down`` step, and the version a
+database is at is recorded in the ``schema_version`` table (one row per
+applied migration).
+
+upgrade_database() is what the run scripts call at startup: a new, empty
+database is created from the models with create_all() and stamped with
+the latest version; an existing one gets every pending migration applied
+in order, each in its own transaction. The steps are idempotent (they
+check what exists first), so databases created by create_all() before
+this runner existed, which already have part of the schema, upgrade
+cleanly too.
+
+Adding a migration: append a function decorated with
+``@migration(<next version>, '<description>')`` taking the session, and
+register its undo step with ``@<function>.downgrade`` if it has one.
+
+CLI: ``db-upgrade``, ``db-downgrade --to N`` and ``db-version`` (see
+commands.py).
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.schema import CreateTable
+
+from .models import db, User, Course, Lesson, Enrollment, UploadSession, Job
+
+VERSION_TABLE = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+class MigrationError(RuntimeError):
+    """A migration cannot be applied or undone."""
+
+
+class Migration:
+    def __init__(self, version, name, up):
+        self.version = version
+        self.name = name
+        self.up = up
+        self.down = None
+
+    def downgrade(self, down):
+        """Decorator registering the undo step of this migration."""
+        self.down = down
+        return down
+
+    def __repr__(self):
+        return f'<Migration {self.version} {self.name}>'
+
+
+def migration(version, name):
+    """Register the decorated function as the ``up`` step of migration ``version``."""
+    def decorator(up):
+        if MIGRATIONS and version != MIGRATIONS[-1].version + 1:
+            raise MigrationError(f'Migration {version} must follow {MIGRATIONS[-1].version}')
+        step = Migration(version, name, up)
+        MIGRATIONS.append(step)
+        return step
+    return decorator
+
+
+def head_version():
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+# Helpers --------------------------------------------------------------------
+
+def _has_table(connection, name):
+    return inspect(connection).has_table(name)
+
+
+def _column_names(connection, table):
+    return {column['name'] for column in inspect(connection).get_columns(table)}
+
+
+def _is_sqlite(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def _remove_orphans(connection, table):
+    """Apply the ON DELETE action of ``table``'s foreign keys to rows whose parent is gone."""
+    removed = 0
+    for fk in table.foreign_key_constraints:
+        column = fk.elements[0].parent.name
+        target = fk.elements[0].target_fullname.split('.')
+        orphan = (f'"{column}" IS NOT NULL AND "{column}" NOT IN '
+                  f'(SELECT "{target[1]}" FROM "{target[0]}")')
+        if (fk.ondelete or '').upper() == 'SET NULL':
+            connection.exec_driver_sql(f'UPDATE "{table.name}" SET "{column}" = NULL WHERE {orphan}')
+        elif (fk.ondelete or '').upper() == 'CASCADE':
+            removed += connection.exec_driver_sql(f'DELETE FROM "{table.name}" WHERE {orphan}').rowcount
+    return removed
+
+
+def _rebuild_sqlite_table(connection, table):
+    """Recreate ``table`` from its model definition, keeping its rows.
+
+    SQLite cannot alter a foreign key, so this follows its documented
+    procedure: create the new table, copy the rows, drop the old table and
+    rename the new one into place, then recreate the model's indexes.
+    Foreign key enforcement must already be off.
+    """
+    name = table.name
+    # Copy the tables it references too, so its foreign keys resolve
+    metadata = MetaData()
+    for other in db.metadata.sorted_tables:
+        other.to_metadata(metadata)
+    temp = table.to_metadata(metadata, name=f'{name}__rebuild')
+    existing = _column_names(connection, name)
+    columns = ', '.join(f'"{column}"' for column in table.columns.keys() if column in existing)
+    connection.execute(CreateTable(temp))
+    connection.exec_driver_sql(f'INSERT INTO "{temp.name}" ({columns}) SELECT {columns} FROM "{name}"')
+    connection.exec_driver_sql(f'DROP TABLE "{name}"')
+    connection.exec_driver_sql(f'ALTER TABLE "{temp.name}" RENAME TO "{name}"')
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _ondelete_actions(connection, table):
+    return {tuple(fk['constrained_columns']): (fk.get('options', {}).get('ondelete') or '').upper()
+            for fk in inspect(connection).get_foreign_keys(table.name)}
+
+
+# Migrations -----------------------------------------------------------------
+
+@migration(1, 'baseline schema')
+def baseline(session):
+    """Create any missing table and the course search index."""
+    from .search import FTS_SCHEMA, FTS_TABLE
+
+    connection = session.connection()
+    for table in db.metadata.sorted_tables:
+        table.create(connection, checkfirst=True)
+    if _is_sqlite(connection) and not _has_table(connection, FTS_TABLE):
+        for statement in FTS_SCHEMA:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+@migration(2, 'course enrollment and lesson counters')
+def course_counters(session):
+    """Add courses.enrollment_count/lesson_count and fill them."""
+    from .counters import recount_course_counters
+
+    existing = _column_names(session.connection(), 'courses')
+    added = False
+    for column in ('enrollment_count', 'lesson_count'):
+        if column not in existing:
+            session.execute(text(f'ALTER TABLE courses ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'))
+            added = True
+    if added:
+        recount_course_counters()
+
+
+@course_counters.downgrade
+def _drop_course_counters(session):
+    for column in ('enrollment_count', 'lesson_count'):
+        session.execute(text(f'ALTER TABLE courses DROP COLUMN {column}'))
+
+
+# Tables whose foreign keys gained ON DELETE actions, parents first
+CASCADE_TABLES = (Course, Lesson, Enrollment, UploadSession)
+
+
+def _rebuild_sqlite_tables(models, needs_rebuild, prepare):
+    """Rebuild the tables of ``models`` for which ``needs_rebuild(connection, table)`` is true.
+
+    ``prepare(connection, table)`` runs first, to fix rows the new definition
+    would reject. Foreign key enforcement can only be switched outside a
+    transaction, so the rebuild runs on its own connection rather than the
+    session's, and every foreign key is checked once all tables are rebuilt.
+    """
+    from .search import FTS_SCHEMA, FTS_TABLE
+
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        connection.commit()
+        try:
+            with connection.begin():
+                for model in models:
+                    table = model.__table__
+                    if not needs_rebuild(connection, table):
+                        continue
+                    prepare(connection, table)
+                    _rebuild_sqlite_table(connection, table)
+                    if table.name == 'courses' and _has_table(connection, FTS_TABLE):
+                        # The search index triggers were dropped with the old table
+                        for statement in FTS_SCHEMA[1:]:
+                            connection.exec_driver_sql(statement)
+                problems = connection.exec_driver_sql('PRAGMA foreign_key_check').all()
+                if problems:
+                    raise MigrationError(f'Rows violate foreign keys after the rebuild: {problems[:5]}')
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+            connection.commit()
+
+
+@migration(3, 'ON DELETE actions on foreign keys')
+def cascade_foreign_keys(session):
+    """Rebuild tables whose foreign keys predate their ON DELETE CASCADE/SET NULL."""
+    if db.engine.dialect.name != 'sqlite':
+        # Other backends were never created without the actions
+        return
+
+    def needs_rebuild(connection, table):
+        current = _ondelete_actions(connection, table)
+        wanted = {tuple(element.parent.name for element in fk.elements): (fk.ondelete or '').upper()
+                  for fk in table.foreign_key_constraints}
+        return any(current.get(columns) != action for columns, action in wanted.items())
+
+    # Rows already orphaned would fail the foreign key check
+    _rebuild_sqlite_tables(CASCADE_TABLES, needs_rebuild, _remove_orphans)
+
+
+@cascade_foreign_keys.downgrade
+def _keep_cascades(session):
+    # The ON DELETE actions are compatible with older code; nothing to undo
+    pass
+
+
+# Indexes declared on the models for the listing, dashboard and navigation queries
+HOT_PATH_INDEXES = (
+    'ix_users_role_created',
+    'ix_users_created',
+    'ix_courses_instructor_published',
+    'ix_courses_created',
+    'ix_courses_category',
+    'ix_lessons_course_order',
+    'ix_lessons_created',
+    'ix_enrollments_course_enrolled',
+    'ix_enrollments_enrolled',
+    'ix_upload_sessions_user',
+    'ix_upload_sessions_course',
+    'ix_upload_sessions_updated',
+)
+
+
+def _hot_path_indexes():
+    return [index for table in db.metadata.sorted_tables for index in table.indexes
+            if index.name in HOT_PATH_INDEXES]
+
+
+@migration(4, 'hot-path indexes')
+def hot_path_indexes(session):
+    """Create the indexes behind the listing, access-check and navigation queries."""
+    for index in _hot_path_indexes():
+        index.create(session.connection(), checkfirst=True)
+
+
+@hot_path_indexes.downgrade
+def _drop_hot_path_indexes(session):
+    for index in _hot_path_indexes():
+        index.drop(session.connection(), checkfirst=True)
+
+
+# Columns the keyset-paginated listings sort on (see pagination.py): a NULL
+# key never satisfies the (key, id) < cursor comparison, so such rows would
+# only ever show up on the first page
+KEYSET_COLUMNS = (
+    (User, 'created_at'),
+    (Course, 'created_at'),
+    (Lesson, 'order'),
+    (Lesson, 'created_at'),
+    (Enrollment, 'enrolled_at'),
+    (Job, 'created_at'),
+)
+
+
+def _fill_null_sort_keys(connection, table):
+    """Give rows without a sort key one: lesson order 0, else the table's oldest timestamp."""
+    for model, column in KEYSET_COLUMNS:
+        if model.__table__ is not table:
+            continue
+        if column == 'order':
+            fallback = '0'
+        else:
+            # Rows of unknown age sort with the oldest ones
+            fallback = f'COALESCE((SELECT MIN("{column}") FROM "{table.name}"), CURRENT_TIMESTAMP)'
+        connection.exec_driver_sql(f'UPDATE "{table.name}" SET "{column}" = {fallback} WHERE "{column}" IS NULL')
+
+
+def _nullable_sort_keys(connection, table):
+    nullable = {column['name'] for column in inspect(connection).get_columns(table.name) if column['nullable']}
+    return [column for model, column in KEYSET_COLUMNS if model.__table__ is table and column in nullable]
+
+
+@migration(5, 'NOT NULL listing sort keys')
+def not_null_sort_keys(session):
+    """Backfill and make NOT NULL the columns keyset pagination sorts on."""
+    models = tuple(dict.fromkeys(model for model, _ in KEYSET_COLUMNS))
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite cannot alter a column's nullability; the tables are rebuilt
+        _rebuild_sqlite_tables(models, _nullable_sort_keys, _fill_null_sort_keys)
+        return
+
+    connection = session.connection()
+    for model in models:
+        table = model.__table__
+        columns = _nullable_sort_keys(connection, table)
+        if columns:
+            _fill_null_sort_keys(connection, table)
+        for column in columns:
+            connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ALTER COLUMN "{column}" SET NOT NULL')
+
+
+@not_null_sort_keys.downgrade
+def _keep_not_null_sort_keys(session):
+    # Every code path already sets these columns; nothing to undo
+    pass
+
+
+# Runner ---------------------------------------------------------------------
+
+def _ensure_version_table(session):
+    VERSION_TABLE.create(session.connection(), checkfirst=True)
+
+
+def current_version(session=None):
+    """Highest applied migration, or 0 for a database the runner has not touched."""
+    session = session or db.session
+    if not _has_table(session.connection(), VERSION_TABLE.name):
+        return 0
+    return session.execute(select(func.max(VERSION_TABLE.c.version))).scalar() or 0
+
+
+def applied_migrations(session=None):
+    """``(version, name, applied_at)`` rows of the applied migrations."""
+    session = session or db.session
+    if not _has_table(session.connection(), VERSION_TABLE.name):
+        return []
+    return session.execute(select(VERSION_TABLE).order_by(VERSION_TABLE.c.version)).all()
+
+
+def _record(session, step):
+    session.execute(VERSION_TABLE.insert().values(version=step.version, name=step.name,
+                                                  applied_at=datetime.utcnow()))
+
+
+def stamp(version=None, session=None):
+    """Mark migrations up to ``version`` (default: all) as applied without running them."""
+    session = session or db.session
+    version = head_version() if version is None else version
+    _ensure_version_table(session)
+    session.execute(VERSION_TABLE.delete())
+    for step in MIGRATIONS:
+        if step.version <= version:
+            _record(session, step)
+    session.commit()
+
+
+def upgrade(target=None, report=None):
+    """Apply pending migrations up to ``target`` (default: latest); returns the ones applied."""
+    session = db.session
+    target = head_version() if target is None else target
+    _ensure_version_table(session)
+    session.commit()
+
+    applied = []
+    for step in MIGRATIONS:
+        if step.version <= current_version(session) or step.version > target:
+            continue
+        session.commit()
+        if report:
+            report(f'Applying {step.version}: {step.name}')
+        try:
+            step.up(session)
+            _record(session, step)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        applied.append(step)
+    return applied
+
+
+def downgrade(target, report=None):
+    """Undo applied migrations above ``target``, newest first; returns the ones undone."""
+    session = db.session
+    undone = []
+    for step in reversed(MIGRATIONS):
+        if step.version <= target or step.version > current_version(session):
+            continue
+        if step.down is None:
+            raise MigrationError(f'Migration {step.version} ({step.name}) cannot be undone')
+        session.commit()
+        if report:
+            report(f'Reverting {step.version}: {step.name}')
+        try:
+            step.down(session)
+            session.execute(VERSION_TABLE.delete().where(VERSION_TABLE.c.version == step.version))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        undone.append(step)
+    return undone
+
+
+def upgrade_database(report=None):
+    """Bring the database up to date: create a new one from the models, migrate an existing one."""
+    if not _has_table(db.session.connection(), User.__tablename__):
+        db.session.commit()
+        db.create_all()
+        stamp()
+        return []
+    return upgrade(report=report)
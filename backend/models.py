@@ -1,11 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-import secrets
-import string
 
-db = SQLAlchemy()
+from .database import RoutingSession
+from .passwords import hash_password, verify_password, needs_rehash, rehash_password
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -17,17 +17,38 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), nullable=False, default='student')  # 'student', 'instructor', or 'admin'
     profile_picture = db.Column(db.String(255), nullable=True)
     bio = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Admin user listing, newest first, optionally filtered by role
+    # (email and username lookups use their unique indexes)
+    __table_args__ = (
+        db.Index('ix_users_role_created', 'role', 'created_at', 'id'),
+        db.Index('ix_users_created', 'created_at', 'id'),
+    )
     
     # Relationships
-    courses = db.relationship('Course', backref='instructor_ref', lazy=True, foreign_keys='Course.instructor_id')
-    enrollments = db.relationship('Enrollment', backref='student_ref', lazy=True)
+    # Children are removed by the database (ON DELETE CASCADE) or deletion.py
+    courses = db.relationship('Course', back_populates='instructor_ref', lazy=True, foreign_keys='Course.instructor_id',
+                              cascade='all, delete-orphan', passive_deletes=True)
+    enrollments = db.relationship('Enrollment', back_populates='student_ref', lazy=True,
+                                  cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
+    
+    def upgrade_password_hash(self, password):
+        """Re-hash under the current policy if a verification slot is free; True if it was."""
+        password_hash = rehash_password(password)
+        if password_hash is None:
+            return False
+        self.password_hash = password_hash
+        return True
     
     def is_instructor(self):
         return self.role == 'instructor'
@@ -58,7 +79,7 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    courses = db.relationship('Course', backref='category_ref', lazy=True)
+    courses = db.relationship('Course', back_populates='category_ref', lazy=True, passive_deletes=True)
     
     def __repr__(self):
         return f'<Category {self.name}>'
@@ -69,41 +90,53 @@ class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     thumbnail = db.Column(db.String(255), nullable=True)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id', ondelete='SET NULL'), nullable=True)
     is_published = db.Column(db.Boolean, default=False)
     course_code = db.Column(db.String(20), unique=True, nullable=False, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized counters, kept in sync by the flush hooks in counters.py
+    enrollment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    lesson_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Instructor dashboards/course lists, admin listing and category filters
+    __table_args__ = (
+        db.Index('ix_courses_instructor_published', 'instructor_id', 'is_published'),
+        db.Index('ix_courses_created', 'created_at', 'id'),
+        db.Index('ix_courses_category', 'category_id'),
+    )
+    
     # Relationships
-    lessons = db.relationship('Lesson', backref='course_ref', lazy=True, order_by='Lesson.order')
-    enrollments = db.relationship('Enrollment', backref='course_ref', lazy=True)
+    instructor_ref = db.relationship('User', back_populates='courses', lazy=True, foreign_keys=[instructor_id])
+    category_ref = db.relationship('Category', back_populates='courses', lazy=True)
+    lessons = db.relationship('Lesson', back_populates='course_ref', lazy=True, order_by='(Lesson.order, Lesson.id)',
+                              cascade='all, delete-orphan', passive_deletes=True)
+    enrollments = db.relationship('Enrollment', back_populates='course_ref', lazy=True,
+                                  cascade='all, delete-orphan', passive_deletes=True)
     
+    # The accessors below go through the relationships so that they hit the
+    # identity map / eager-loaded state instead of issuing a SELECT per access.
     @property
     def instructor(self):
-        return User.query.get(self.instructor_id)
+        return self.instructor_ref
     
     @property
     def category(self):
-        return Category.query.get(self.category_id) if self.category_id else None
+        return self.category_ref
     
     def get_enrollment_count(self):
-        return len(self.enrollments)
+        return self.enrollment_count or 0
     
     def get_lessons_count(self):
-        return len(self.lessons)
+        return self.lesson_count or 0
     
     @staticmethod
     def generate_course_code():
-        """Generate a unique 8-character alphanumeric course code"""
-        while True:
-            # Generate 8-character code (uppercase letters and numbers)
-            code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
-            # Check if code already exists
-            if not Course.query.filter_by(course_code=code).first():
-                return code
+        """Allocate a new 8-character alphanumeric course code (see course_codes.py)"""
+        from .course_codes import allocate_course_code
+        return allocate_course_code()
     
     def __repr__(self):
         return f'<Course {self.title}>'
@@ -113,18 +146,27 @@ class Lesson(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
     video_url = db.Column(db.String(500), nullable=True)
     video_file = db.Column(db.String(255), nullable=True)
     text_content = db.Column(db.Text, nullable=True)
     lesson_file = db.Column(db.String(255), nullable=True)
-    order = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    order = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Outline order and prev/next navigation (see outline.py); admin lesson listing
+    __table_args__ = (
+        db.Index('ix_lessons_course_order', 'course_id', 'order', 'id'),
+        db.Index('ix_lessons_created', 'created_at', 'id'),
+    )
+    
+    # Relationships
+    course_ref = db.relationship('Course', back_populates='lessons', lazy=True)
+    
     @property
     def course(self):
-        return Course.query.get(self.course_id)
+        return self.course_ref
     
     def __repr__(self):
         return f'<Lesson {self.title}>'
@@ -133,20 +175,110 @@ class Enrollment(db.Model):
     __tablename__ = 'enrollments'
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
-    enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    enrolled_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # unique_enrollment also serves lookups by student_id; the others back the
+    # per-course and global admin enrollment listings
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='unique_enrollment'),
+        db.Index('ix_enrollments_course_enrolled', 'course_id', 'enrolled_at', 'id'),
+        db.Index('ix_enrollments_enrolled', 'enrolled_at', 'id'),
+    )
     
-    __table_args__ = (db.UniqueConstraint('student_id', 'course_id', name='unique_enrollment'),)
+    # Relationships
+    student_ref = db.relationship('User', back_populates='enrollments', lazy=True)
+    course_ref = db.relationship('Course', back_populates='enrollments', lazy=True)
     
     @property
     def student(self):
-        return User.query.get(self.student_id)
+        return self.student_ref
     
     @property
     def course(self):
-        return Course.query.get(self.course_id)
+        return self.course_ref
     
     def __repr__(self):
         return f'<Enrollment {self.student_id} - {self.course_id}>'
 
+
+class UploadSession(db.Model):
+    """An in-progress chunked upload; bytes received so far live in a .part file."""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False, default='video')
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Cascading deletes by user/course and the stale-upload purge
+    __table_args__ = (
+        db.Index('ix_upload_sessions_user', 'user_id'),
+        db.Index('ix_upload_sessions_course', 'course_id'),
+        db.Index('ix_upload_sessions_updated', 'updated_at'),
+    )
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.filename}>'
+
+
+class MediaBlob(db.Model):
+    """A stored media file, shared by every row that references the same content.
+    
+    ``path`` is relative to UPLOAD_FOLDER and derived from the SHA-256 of the
+    uploaded bytes (see storage.py); ``ref_count`` is the number of columns
+    currently pointing at it.
+    """
+    __tablename__ = 'media_blobs'
+    
+    path = db.Column(db.String(255), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    kind = db.Column(db.String(40), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaBlob {self.path} refs={self.ref_count}>'
+
+
+class Job(db.Model):
+    """A unit of background work (see jobs.py), committed together with the change that needs it."""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # Jobs with the same key are not queued twice while one is pending/running
+    dedupe_key = db.Column(db.String(120), nullable=True, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (db.Index('ix_jobs_status_run_after', 'status', 'run_after'),)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+
+class AllocatorCounter(db.Model):
+    """A named counter handed out in blocks (see course_codes.py)."""
+    __tablename__ = 'allocator_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)
+    
+    def __repr__(self):
+        return f'<AllocatorCounter {self.name}={self.next_value}>'
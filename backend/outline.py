@@ -0,0 +1,70 @@
+"""
+Lesson ordering, outline and previous/next navigation.
+
+Lessons of a course are ordered by ``(order, id)``, the id breaking ties
+between lessons that share an ``order`` value. The composite index
+``ix_lessons_course_order`` on ``(course_id, order, id)`` serves both
+lookups here:
+
+- lesson_outline() returns the course outline as light rows (id, title,
+  order and whether the lesson has a video, text or file) without loading
+  lesson bodies;
+- lesson_neighbors() finds the previous and next lesson with two index
+  seeks (``LIMIT 1`` either side of the current position), so navigation
+  costs the same in a 3-lesson and a 300-lesson course.
+"""
+
+from sqlalchemy import and_, or_, select
+
+from .models import db, Lesson
+
+_OUTLINE_COLUMNS = (
+    Lesson.id,
+    Lesson.title,
+    Lesson.order,
+    or_(Lesson.video_url.isnot(None), Lesson.video_file.isnot(None)).label('has_video'),
+    and_(Lesson.text_content.isnot(None), Lesson.text_content != '').label('has_text'),
+    Lesson.lesson_file.isnot(None).label('has_file'),
+)
+
+
+def lesson_outline(course_id):
+    """Ordered ``(id, title, order, has_video, has_text, has_file)`` rows for a course."""
+    return db.session.execute(
+        select(*_OUTLINE_COLUMNS)
+        .where(Lesson.course_id == course_id)
+        .order_by(Lesson.order, Lesson.id)
+    ).all()
+
+
+def first_lesson_id(course_id):
+    """Id of the first lesson of a course (one index seek), or None."""
+    return db.session.execute(
+        select(Lesson.id)
+        .where(Lesson.course_id == course_id)
+        .order_by(Lesson.order, Lesson.id)
+        .limit(1)
+    ).scalar()
+
+
+def lesson_neighbor(lesson, before):
+    """The previous (``before``) or next lesson as an ``(id, title)`` row, or None."""
+    order = lesson.order or 0
+    if before:
+        position = or_(Lesson.order < order, and_(Lesson.order == order, Lesson.id < lesson.id))
+        ordering = (Lesson.order.desc(), Lesson.id.desc())
+    else:
+        position = or_(Lesson.order > order, and_(Lesson.order == order, Lesson.id > lesson.id))
+        ordering = (Lesson.order, Lesson.id)
+    return db.session.execute(
+        select(Lesson.id, Lesson.title)
+        .where(Lesson.course_id == lesson.course_id, position)
+        .order_by(*ordering)
+        .limit(1)
+    ).first()
+
+
+def lesson_neighbors(lesson):
+    """``(previous, next)`` lessons as ``(id, title)`` rows, None at either end."""
+    return lesson_neighbor(lesson, before=True), lesson_neighbor(lesson, before=False)
+
@@ -0,0 +1,158 @@
+"""
+Keyset (cursor) pagination for the admin listings.
+
+Pages are addressed by an opaque cursor holding the sort key and id of the
+row at the page boundary, so fetching page N costs the same as page 1: the
+database seeks to ``(sort_key, id) < cursor`` on an index instead of skipping
+OFFSET rows. The id is the tiebreak for rows sharing the same timestamp.
+Sort columns must be NOT NULL (migration 5): a row with a NULL key matches
+neither side of the comparison and would drop out after the first page.
+
+Totals shown next to the pager are approximate: they come from the cached
+dashboard snapshot or the Course counter columns when possible, and from a
+short-lived cached COUNT(*) for filtered listings.
+"""
+
+import base64
+import binascii
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from .models import db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COUNT_CACHE_TTL = 300
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode a page boundary as an opaque, URL-safe token."""
+    if isinstance(sort_value, datetime):
+        payload = ['dt', sort_value.isoformat(), row_id]
+    else:
+        payload = ['v', sort_value, row_id]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor produced by encode_cursor(); returns None if it is invalid."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        kind, sort_value, row_id = json.loads(raw)
+        if kind == 'dt':
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+def get_page_size(requested, default=None):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE."""
+    from .app import app
+
+    if default is None:
+        default = app.config.get('ADMIN_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    limit = app.config.get('ADMIN_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    if not requested or requested < 1:
+        return min(default, limit)
+    return min(requested, limit)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def paginate_keyset(query, sort_column, id_column, cursor=None, direction='next',
+                    per_page=DEFAULT_PAGE_SIZE, descending=True, total=None):
+    """Return a KeysetPage of ``query`` ordered by ``(sort_column, id_column)``.
+
+    ``cursor`` is a token from a previous page's next_cursor/prev_cursor and
+    ``direction`` says which way to walk from it ('next' or 'prev').
+    """
+    boundary = decode_cursor(cursor)
+    backwards = boundary is not None and direction == 'prev'
+    # Walking backwards flips the comparison and the ORDER BY, then the rows are reversed
+    forward_desc = descending != backwards
+
+    if boundary is not None:
+        sort_value, row_id = boundary
+        if forward_desc:
+            query = query.filter(or_(sort_column < sort_value,
+                                     and_(sort_column == sort_value, id_column < row_id)))
+        else:
+            query = query.filter(or_(sort_column > sort_value,
+                                     and_(sort_column == sort_value, id_column > row_id)))
+
+    if forward_desc:
+        query = query.order_by(None).order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(None).order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    sort_key = sort_column.key
+    id_key = id_column.key
+
+    def boundary_of(row):
+        return encode_cursor(getattr(row, sort_key), getattr(row, id_key))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if backwards:
+            next_cursor = boundary_of(rows[-1])
+            prev_cursor = boundary_of(rows[0]) if has_more else None
+        else:
+            next_cursor = boundary_of(rows[-1]) if has_more else None
+            prev_cursor = boundary_of(rows[0]) if boundary is not None else None
+
+    return KeysetPage(rows, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
+
+
+def approximate_count(key, query, ttl=COUNT_CACHE_TTL):
+    """COUNT(*) of ``query`` cached under ``key`` for ``ttl`` seconds."""
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+    total = query.order_by(None).count()
+    with _count_lock:
+        if len(_count_cache) > 1024:
+            _count_cache.clear()
+        _count_cache[key] = (total, now + ttl)
+    return total
@@ -0,0 +1,181 @@
+"""
+Password hashing policy.
+
+The hash method and cost come from the config (PASSWORD_HASH_METHOD, in
+werkzeug's ``method:params`` notation, and PASSWORD_SALT_LENGTH), so the
+cost can be tuned without code changes. Hashes created under an older
+policy keep working: needs_rehash() compares a stored hash's parameters
+with the current ones and the login view re-hashes the password after a
+successful check (rehash_password()).
+
+Verifying a password is deliberately expensive, so a burst of logins can
+take every CPU away from ordinary page views. verify_password() therefore
+runs the check in a small thread pool (PASSWORD_VERIFY_WORKERS; the hash
+functions release the GIL) and admits at most PASSWORD_VERIFY_CONCURRENCY
+checks at once, in flight or queued. A request that cannot get a slot
+within PASSWORD_VERIFY_TIMEOUT seconds fails fast with PasswordCheckBusy
+instead of piling up behind the others. The re-hash at login goes through
+the same pool and slots, but never waits: when no slot is free it is
+skipped and simply happens at a later login.
+
+Hash and verify timings are kept in per-process counters
+(password_metrics()) and shown on the admin settings page.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULT_SALT_LENGTH = 16
+DEFAULT_WORKERS = 2
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 5.0
+
+_lock = threading.Lock()
+_executor = {'pid': None, 'pool': None, 'slots': None}
+_metrics = {}
+
+
+class PasswordCheckBusy(RuntimeError):
+    """Too many password checks are running; the caller should try again later."""
+
+
+def normalize_method(method):
+    """Expand a werkzeug hash method to its full ``name:params`` form."""
+    name, _, params = method.partition(':')
+    if name == 'scrypt':
+        return 'scrypt:' + (params or '32768:8:1')
+    if name == 'pbkdf2':
+        digest, _, iterations = (params or 'sha256').partition(':')
+        return f'pbkdf2:{digest}:{iterations or DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def hash_settings():
+    """Return ``(method, salt_length)`` of the current policy."""
+    config = current_app.config
+    method = normalize_method(config.get('PASSWORD_HASH_METHOD') or DEFAULT_METHOD)
+    return method, config.get('PASSWORD_SALT_LENGTH', DEFAULT_SALT_LENGTH)
+
+
+def _record(name, seconds):
+    with _lock:
+        entry = _metrics.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        entry['count'] += 1
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+
+
+def _count(name):
+    with _lock:
+        entry = _metrics.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        entry['count'] += 1
+
+
+def password_metrics():
+    """Per-process counters: count, average and max seconds per operation."""
+    with _lock:
+        return {
+            name: {
+                'count': entry['count'],
+                'avg': entry['total'] / entry['count'] if entry['count'] and entry['total'] else 0.0,
+                'max': entry['max'],
+            }
+            for name, entry in sorted(_metrics.items())
+        }
+
+
+def hash_password(password):
+    """Hash ``password`` with the configured method and cost."""
+    method, salt_length = hash_settings()
+    started = time.perf_counter()
+    password_hash = generate_password_hash(password, method=method, salt_length=salt_length)
+    _record('hash', time.perf_counter() - started)
+    return password_hash
+
+
+def needs_rehash(password_hash):
+    """True if ``password_hash`` was created with other parameters than the current policy."""
+    stored_method = password_hash.split('$', 1)[0]
+    return normalize_method(stored_method) != hash_settings()[0]
+
+
+def _get_executor():
+    with _lock:
+        if _executor['pid'] != os.getpid():
+            # Threads do not survive a fork, so a forked worker builds its own pool
+            config = current_app.config
+            _executor['pool'] = ThreadPoolExecutor(
+                max_workers=config.get('PASSWORD_VERIFY_WORKERS', DEFAULT_WORKERS),
+                thread_name_prefix='password-verify',
+            )
+            _executor['slots'] = threading.BoundedSemaphore(
+                config.get('PASSWORD_VERIFY_CONCURRENCY', DEFAULT_CONCURRENCY))
+            _executor['pid'] = os.getpid()
+        return _executor['pool'], _executor['slots']
+
+
+def _timed_check(password_hash, password):
+    started = time.perf_counter()
+    try:
+        return check_password_hash(password_hash, password)
+    finally:
+        _record('verify', time.perf_counter() - started)
+
+
+def _run_bounded(timeout, func, *args):
+    """Run ``func`` in the verification pool once a slot is free; PasswordCheckBusy after ``timeout``."""
+    pool, slots = _get_executor()
+    acquired = slots.acquire(timeout=timeout) if timeout else slots.acquire(blocking=False)
+    if not acquired:
+        raise PasswordCheckBusy('Too many password checks in progress')
+    try:
+        return pool.submit(func, *args).result()
+    finally:
+        slots.release()
+
+
+def verify_password(password_hash, password):
+    """Check ``password`` against ``password_hash`` in the bounded verification pool.
+
+    Raises PasswordCheckBusy if no slot frees up within PASSWORD_VERIFY_TIMEOUT.
+    """
+    timeout = current_app.config.get('PASSWORD_VERIFY_TIMEOUT', DEFAULT_TIMEOUT)
+    started = time.perf_counter()
+    try:
+        result = _run_bounded(timeout, _timed_check, password_hash, password)
+    except PasswordCheckBusy:
+        _count('rejected')
+        raise
+    _record('verify_latency', time.perf_counter() - started)
+    return result
+
+
+def rehash_password(password):
+    """Hash ``password`` under the current policy in the verification pool, or None if it is busy.
+
+    Never waits for a slot: the re-hash is an optimisation and can happen
+    at the next login instead.
+    """
+    app = current_app._get_current_object()
+
+    def _hash():
+        # Pool threads have no application context of their own
+        with app.app_context():
+            return hash_password(password)
+
+    try:
+        return _run_bounded(0, _hash)
+    except PasswordCheckBusy:
+        _count('rehash_skipped')
+        return None
+
+
+def record_rehash():
+    """Count a hash upgraded at login."""
+    _count('rehash')
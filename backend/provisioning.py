@@ -0,0 +1,221 @@
+"""
+Bulk user provisioning (``python create_admin.py provision``).
+
+Creating accounts one at a time with User.set_password() spends almost all
+of its time in the password hash, which is deliberately slow. provision()
+instead:
+
+1. reads every record from a CSV or JSONL file and validates it, detecting
+   duplicate usernames/emails within the file and, with batched ``IN``
+   lookups, against existing users (emails compared case-insensitively
+   in both checks), before anything is written;
+2. hashes the passwords of each batch across a process pool (one worker
+   per core by default), with the same policy as set_password() (see
+   passwords.py);
+3. inserts each batch with one multi-row INSERT and commits it, then
+   records the last committed line in a checkpoint file.
+
+If the run is interrupted, running it again with the same checkpoint skips
+every line up to the recorded one instead of starting over. The checkpoint
+is removed once the whole file has been imported.
+"""
+
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.security import generate_password_hash
+
+from .models import db, User
+from .passwords import hash_settings
+from .stats import mark_dashboard_stats_dirty
+
+DEFAULT_BATCH_SIZE = 1000
+LOOKUP_BATCH_SIZE = 500
+MIN_PASSWORD_LENGTH = 8
+ROLES = ('student', 'instructor', 'admin')
+
+
+class ProvisioningError(ValueError):
+    """The input file or checkpoint cannot be used."""
+
+
+class UserRecord:
+    """One account to create, with the input line it came from."""
+
+    __slots__ = ('line', 'username', 'email', 'password', 'role')
+
+    def __init__(self, line, username, email, password, role):
+        self.line = line
+        self.username = username
+        self.email = email
+        self.password = password
+        self.role = role
+
+
+def _field(data, name):
+    value = data.get(name)
+    return str(value).strip() if value is not None else ''
+
+
+def read_records(path):
+    """Yield UserRecords from a CSV (with a header row) or JSONL file."""
+    jsonl = os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if jsonl:
+            rows = []
+            for line, text in enumerate(f, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    data = json.loads(text)
+                except ValueError as e:
+                    raise ProvisioningError(f'Line {line}: invalid JSON ({e})') from e
+                if not isinstance(data, dict):
+                    raise ProvisioningError(f'Line {line}: expected a JSON object')
+                rows.append((line, data))
+        else:
+            reader = csv.DictReader(f)
+            missing = {'username', 'email', 'password'} - set(reader.fieldnames or ())
+            if missing:
+                raise ProvisioningError(f'Missing CSV column(s): {", ".join(sorted(missing))}')
+            rows = [(reader.line_num, row) for row in reader]
+
+    for line, data in rows:
+        yield UserRecord(line, _field(data, 'username'), _field(data, 'email'),
+                         _field(data, 'password'), _field(data, 'role').lower() or 'student')
+
+
+def _existing(column, values):
+    found = set()
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        batch = values[start:start + LOOKUP_BATCH_SIZE]
+        found.update(db.session.execute(select(column).where(column.in_(batch))).scalars())
+    return found
+
+
+def validate_records(records):
+    """Split records into (valid, errors), errors being ``(line, message)`` pairs.
+
+    Checks required fields, role and password length, duplicates within the
+    input and usernames/emails that already exist in the database.
+    """
+    valid, errors = [], []
+    usernames, emails = {}, {}
+    for record in records:
+        if not record.username or not record.email or not record.password:
+            errors.append((record.line, 'username, email and password are required'))
+        elif record.role not in ROLES:
+            errors.append((record.line, f'unknown role "{record.role}"'))
+        elif len(record.password) < MIN_PASSWORD_LENGTH:
+            errors.append((record.line, f'password must be at least {MIN_PASSWORD_LENGTH} characters'))
+        elif record.username in usernames:
+            errors.append((record.line, f'duplicate username "{record.username}" (line {usernames[record.username]})'))
+        elif record.email.lower() in emails:
+            errors.append((record.line, f'duplicate email "{record.email}" (line {emails[record.email.lower()]})'))
+        else:
+            usernames[record.username] = record.line
+            emails[record.email.lower()] = record.line
+            valid.append(record)
+
+    taken_usernames = _existing(User.username, usernames)
+    # Same rule as the duplicate check above: emails differing only in case clash
+    taken_emails = _existing(func.lower(User.email), {record.email.lower() for record in valid})
+    accepted = []
+    for record in valid:
+        if record.username in taken_usernames:
+            errors.append((record.line, f'username "{record.username}" already exists'))
+        elif record.email.lower() in taken_emails:
+            errors.append((record.line, f'email "{record.email}" already exists'))
+        else:
+            accepted.append(record)
+    errors.sort()
+    return accepted, errors
+
+
+def load_checkpoint(path, source):
+    """Return the last committed line recorded for ``source`` (0 if none)."""
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except ValueError as e:
+        raise ProvisioningError(f'Unreadable checkpoint {path}: {e}') from e
+    if data.get('source') != os.path.abspath(source):
+        raise ProvisioningError(f'Checkpoint {path} belongs to {data.get("source")}')
+    return int(data.get('line', 0))
+
+
+def save_checkpoint(path, source, line, created):
+    """Atomically record that everything up to ``line`` is committed."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'source': os.path.abspath(source), 'line': line, 'created': created}, f)
+    os.replace(temp_path, path)
+
+
+def _insert_users(rows):
+    """Multi-row insert skipping rows that clash with users created meanwhile; returns rows inserted."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(User).values(rows).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        stmt = postgresql.insert(User).values(rows).on_conflict_do_nothing()
+    else:
+        stmt = insert(User).values(rows)
+    return db.session.execute(stmt).rowcount
+
+
+def provision(path, checkpoint=None, batch_size=None, workers=None, dry_run=False, report=print):
+    """Create the users listed in ``path``; returns ``(created, errors)``.
+
+    Must run inside an application context. ``report`` receives one progress
+    line per committed batch.
+    """
+    checkpoint = checkpoint or path + '.checkpoint'
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    resume_after = load_checkpoint(checkpoint, path)
+    if resume_after:
+        report(f'Resuming after line {resume_after}')
+
+    records = [record for record in read_records(path) if record.line > resume_after]
+    accepted, errors = validate_records(records)
+    report(f'{len(records)} record(s): {len(accepted)} to create, {len(errors)} rejected')
+    if dry_run or not accepted:
+        return 0, errors
+
+    created = 0
+    workers = workers or os.cpu_count() or 1
+    method, salt_length = hash_settings()
+    hash_password = partial(generate_password_hash, method=method, salt_length=salt_length)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(accepted), batch_size):
+            batch = accepted[start:start + batch_size]
+            hashes = pool.map(hash_password, [record.password for record in batch],
+                              chunksize=max(1, len(batch) // (4 * workers)))
+            rows = [
+                {'username': record.username, 'email': record.email, 'role': record.role, 'password_hash': password_hash}
+                for record, password_hash in zip(batch, hashes)
+            ]
+            inserted = _insert_users(rows)
+            if inserted < len(rows):
+                errors.append((batch[0].line, f'{len(rows) - inserted} user(s) in this batch were created '
+                                              'meanwhile by someone else and skipped'))
+            mark_dashboard_stats_dirty()
+            db.session.commit()
+            created += inserted
+
+            # Lines before the next accepted record were rejected, so they count as done too
+            if start + batch_size < len(accepted):
+                save_checkpoint(checkpoint, path, accepted[start + batch_size].line - 1, created)
+            report(f'{created}/{len(accepted)} user(s) created')
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return created, errors
@@ -0,0 +1,172 @@
+"""
+Query plan audit for the page routes (``flask --app backend.app explain-queries``).
+
+Every GET route the app serves is requested through the test client, once
+per role (student, instructor, admin), with ids filled in from existing
+rows. The SELECT statements each page runs are captured together with
+their parameters and passed to SQLite's ``EXPLAIN QUERY PLAN``; plan steps
+that scan a whole table (``SCAN <table>`` without an index) are flagged.
+
+Requests are made against the configured database, so run it on a copy of
+production data (or a realistic seed) to see the plans that matter. SQLite
+only; on other backends use their own EXPLAIN tooling.
+"""
+
+import re
+
+from flask import url_for
+from sqlalchemy import event, select
+
+from .app import app
+from .database import read_engine
+from .models import db, User, Course, Lesson, Enrollment
+
+# GET endpoints with side effects or nothing to plan
+SKIPPED_ENDPOINTS = {'logout', 'static', 'media', 'admin_toggle_user', 'admin_toggle_course'}
+
+# Listing variants worth planning besides the bare URLs
+EXTRA_REQUESTS = (
+    ('admin', '/admin/users?role=student'),
+    ('admin', '/admin/users?search=a'),
+    ('admin', '/admin/courses?status=published'),
+    ('admin', '/admin/lessons?course_id={course_id}'),
+    ('admin', '/admin/enrollments?course_id={course_id}'),
+    ('admin', '/admin/jobs?status=failed'),
+    ('student', '/courses?search=a'),
+    ('instructor', '/courses?search=a'),
+)
+
+# 'SCAN courses' (older SQLite: 'SCAN TABLE courses'), but not index or virtual table scans
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)\b(?! USING)(?! VIRTUAL TABLE)')
+
+
+class PlanReport:
+    """Plans of the queries one page ran, and the full table scans among them."""
+
+    def __init__(self, role, url, status):
+        self.role = role
+        self.url = url
+        self.status = status
+        self.queries = 0
+        self.scans = []  # (table, statement)
+
+    def __repr__(self):
+        return f'<PlanReport {self.role} {self.url} queries={self.queries} scans={len(self.scans)}>'
+
+
+def full_table_scans(connection, statement, parameters):
+    """Tables ``statement`` reads with a full scan, according to EXPLAIN QUERY PLAN."""
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    tables = []
+    for row in rows:
+        match = _FULL_SCAN.match(row[-1])
+        # Subquery results ('SCAN anon_1') are not tables
+        if match and match.group(1) in db.metadata.tables:
+            tables.append(match.group(1))
+    return tables
+
+
+def _sample(role):
+    """A user of ``role`` plus ids for the URL placeholders, preferring users with data."""
+    query = select(User).where(User.role == role).order_by(User.id)
+    if role == 'student':
+        query = query.where(User.id.in_(select(Enrollment.student_id)))
+    elif role == 'instructor':
+        query = query.where(User.id.in_(select(Course.instructor_id)))
+    user = db.session.execute(query.limit(1)).scalar() or \
+        db.session.execute(select(User).where(User.role == role).order_by(User.id).limit(1)).scalar()
+    if user is None:
+        return None, {}
+
+    if role == 'student':
+        course_id = db.session.execute(select(Enrollment.course_id).where(Enrollment.student_id == user.id)
+                                       .limit(1)).scalar()
+    elif role == 'instructor':
+        course_id = db.session.execute(select(Course.id).where(Course.instructor_id == user.id).limit(1)).scalar()
+    else:
+        course_id = db.session.execute(select(Course.id).limit(1)).scalar()
+    lesson_id = db.session.execute(select(Lesson.id).where(Lesson.course_id == course_id).limit(1)).scalar()
+    ids = {'user_id': user.id, 'course_id': course_id, 'lesson_id': lesson_id}
+    return user.id, {key: value for key, value in ids.items() if value is not None}
+
+
+def _urls(ids, role):
+    urls = []
+    for rule in app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.endpoint in SKIPPED_ENDPOINTS:
+            continue
+        if not set(rule.arguments) <= set(ids):
+            continue
+        with app.test_request_context():
+            urls.append(url_for(rule.endpoint, **{name: ids[name] for name in rule.arguments}))
+    for extra_role, template in EXTRA_REQUESTS:
+        if extra_role == role:
+            try:
+                urls.append(template.format(**ids))
+            except KeyError:
+                continue
+    return sorted(set(urls))
+
+
+def _reset_caches():
+    from .access import invalidate_enrollments
+    from .fragments import clear_fragments
+    from .stats import invalidate_dashboard_stats
+    from .user_cache import clear_user_cache
+
+    # Cold caches, so the audit sees the queries a cache miss runs
+    clear_fragments()
+    invalidate_enrollments()
+    invalidate_dashboard_stats()
+    clear_user_cache()
+
+
+def audit_routes(roles=('student', 'instructor', 'admin')):
+    """Request every GET route as each role; returns a list of PlanReports."""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        raise RuntimeError('explain-queries only supports SQLite')
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.append((statement, parameters))
+
+    # GET requests query the read-only pool when it is configured (database.py)
+    engines = [engine] + [other for other in (read_engine(app),) if other is not None and other is not engine]
+    reports = []
+    for listened in engines:
+        event.listen(listened, 'before_cursor_execute', capture)
+    try:
+        for role in roles:
+            user_id, ids = _sample(role)
+            if user_id is None:
+                continue
+            _reset_caches()
+            client = app.test_client()
+            with client.session_transaction() as flask_session:
+                flask_session['_user_id'] = str(user_id)
+                flask_session['_fresh'] = True
+            for url in _urls(ids, role):
+                captured.clear()
+                # A fresh app context per request, so g (and the user Flask-Login
+                # keeps in it) does not carry over from the previous request
+                with app.app_context():
+                    response = client.get(url)
+                report = PlanReport(role, url, response.status_code)
+                seen = set()
+                with engine.connect() as connection:
+                    for statement, parameters in captured:
+                        if statement in seen:
+                            continue
+                        seen.add(statement)
+                        report.queries += 1
+                        for table in full_table_scans(connection, statement, parameters):
+                            report.scans.append((table, statement))
+                reports.append(report)
+    finally:
+        for listened in engines:
+            event.remove(listened, 'before_cursor_execute', capture)
+        db.session.remove()
+    return reports
@@ -0,0 +1,173 @@
+"""
+Bulk roster import: enroll a CSV of students into a course.
+
+The CSV holds usernames or email addresses, either as a single column or
+under a ``username``/``email`` header. Rows are processed in batches of
+ROSTER_BATCH_SIZE:
+
+1. identifiers are resolved with one ``username IN (...)`` and one
+   ``email IN (...)`` lookup per batch;
+2. the resolved students are enrolled with one multi-row
+   ``INSERT ... ON CONFLICT (student_id, course_id) DO NOTHING``, so students
+   who are already enrolled are skipped by the unique_enrollment
+   constraint rather than looked up first;
+3. the course's enrollment_count is bumped by the number of rows actually
+   inserted and the students' cached enrollment sets (access.py) are
+   invalidated, since bulk inserts bypass the flush hooks; then the batch
+   is committed.
+
+import_roster() is a generator yielding a progress dict after every batch,
+so the route can stream progress while a large roster is imported. Rows
+that cannot be enrolled are reported with their line number and reason.
+"""
+
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .access import mark_enrollments_changed
+from .app import app
+from .models import db, User, Course, Enrollment
+from .stats import mark_dashboard_stats_dirty
+
+DEFAULT_BATCH_SIZE = 500
+# Error rows kept in the report (the counts stay exact)
+MAX_REPORTED_ERRORS = 500
+
+IDENTIFIER_COLUMNS = ('username', 'email', 'user', 'student', 'identifier')
+
+
+class RosterError(ValueError):
+    """The uploaded file cannot be read as a roster."""
+
+
+def parse_roster(stream):
+    """Read a roster upload into a list of ``(line_number, identifier)`` pairs."""
+    try:
+        text = stream.read().decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        raise RosterError('The roster must be a UTF-8 encoded CSV file.') from e
+
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        raise RosterError('The roster file is empty.')
+
+    column = 0
+    start = 0
+    header = [cell.strip().lower() for cell in rows[0]]
+    for name in IDENTIFIER_COLUMNS:
+        if name in header:
+            column, start = header.index(name), 1
+            break
+
+    entries = []
+    for line_number, row in enumerate(rows[start:], start=start + 1):
+        value = row[column].strip() if len(row) > column else ''
+        if value:
+            entries.append((line_number, value))
+    return entries
+
+
+def _insert_ignore(rows):
+    """Multi-row enrollment insert that skips existing (student, course) pairs; returns rows inserted."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(Enrollment).values(rows).on_conflict_do_nothing(
+            index_elements=['student_id', 'course_id'])
+    elif dialect == 'postgresql':
+        stmt = postgresql.insert(Enrollment).values(rows).on_conflict_do_nothing(
+            constraint='unique_enrollment')
+    else:
+        existing = {student_id for (student_id,) in db.session.query(Enrollment.student_id).filter(
+            Enrollment.course_id == rows[0]['course_id'],
+            Enrollment.student_id.in_([row['student_id'] for row in rows]))}
+        rows = [row for row in rows if row['student_id'] not in existing]
+        if not rows:
+            return 0
+        stmt = insert(Enrollment).values(rows)
+    return db.session.execute(stmt).rowcount
+
+
+def _resolve(identifiers):
+    """Map each identifier to its User row (matched by username or email)."""
+    found = {}
+    columns = (User.id, User.username, User.email, User.role)
+    for user in db.session.query(*columns).filter(User.username.in_(identifiers)):
+        found[user.username] = user
+    missing = [value for value in identifiers if value not in found and '@' in value]
+    if missing:
+        for user in db.session.query(*columns).filter(User.email.in_(missing)):
+            found.setdefault(user.email, user)
+    return found
+
+
+def import_roster(course, entries, batch_size=None):
+    """Enroll the students listed in ``entries`` into ``course``, one committed batch at a time.
+
+    Yields a progress dict (total, processed, enrolled, already_enrolled,
+    errors, error_count) after every batch; the last one has ``done=True``.
+    """
+    batch_size = batch_size or app.config.get('ROSTER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    course_id = course.id
+    progress = {
+        'total': len(entries),
+        'processed': 0,
+        'enrolled': 0,
+        'already_enrolled': 0,
+        'error_count': 0,
+        'errors': [],
+        'done': False,
+    }
+    seen = set()
+
+    def error(line_number, value, reason):
+        progress['error_count'] += 1
+        if len(progress['errors']) < MAX_REPORTED_ERRORS:
+            progress['errors'].append({'line': line_number, 'value': value, 'error': reason})
+
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        users = _resolve(list({value for _, value in batch}))
+
+        student_ids = []
+        for line_number, value in batch:
+            user = users.get(value)
+            if user is None:
+                error(line_number, value, 'No user with this username or email.')
+            elif user.role != 'student':
+                error(line_number, value, f'{user.username} is not a student.')
+            elif user.id in seen:
+                error(line_number, value, 'Duplicate entry in the roster.')
+            else:
+                seen.add(user.id)
+                student_ids.append(user.id)
+
+        inserted = 0
+        if student_ids:
+            now = datetime.utcnow()
+            inserted = _insert_ignore([
+                {'student_id': student_id, 'course_id': course_id, 'enrolled_at': now}
+                for student_id in student_ids
+            ])
+            if inserted:
+                db.session.execute(
+                    update(Course)
+                    .where(Course.id == course_id)
+                    # A counter change, not an edit: keep updated_at (see counters.py)
+                    .values(enrollment_count=Course.enrollment_count + inserted, updated_at=Course.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+                mark_dashboard_stats_dirty()
+                mark_enrollments_changed(student_ids)
+        db.session.commit()
+
+        progress['processed'] += len(batch)
+        progress['enrolled'] += inserted
+        progress['already_enrolled'] += len(student_ids) - inserted
+        yield dict(progress, errors=list(progress['errors']))
+
+    progress['done'] = True
+    yield progress
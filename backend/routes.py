@@ -1,14 +1,31 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session, send_from_directory, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, send_from_directory, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 from functools import wraps
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, select
+import json
 import os
 
 from .app import app
 from .models import db, User, Course, Category, Lesson, Enrollment
+from .loaders import with_profile
+from .search import search_courses, course_snippets
+from .media import send_media
+from .assets import send_asset
+from .uploads import UploadError, get_user_upload, attach_video
+from .images import (InvalidImage, validate_image, strip_metadata, schedule_thumbnail, delete_thumbnail,
+                     thumbnail_version)
+from .storage import store_upload, release
+from .deletion import delete_courses
+from .course_codes import add_course
+from .roster import RosterError, parse_roster, import_roster
+from .passwords import PasswordCheckBusy, record_rehash
+from .access import enrolled_course_ids, is_enrolled, can_view_course, can_view_lessons
+from .outline import lesson_outline, lesson_neighbors, first_lesson_id
+from .fragments import cached_fragment, course_version
+from .conditional import courses_version, newest, not_modified, page_etag, viewer_key, with_validators
 from .forms import LoginForm, StudentRegisterForm, InstructorRegisterForm, CourseForm, LessonForm
 
 # Helper function to check if user is instructor
@@ -78,7 +95,17 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordCheckBusy:
+            flash('The server is busy signing other users in. Please try again in a moment.', 'error')
+            return render_template('accounts/login.html', form=form), 503
+        if valid:
+            # Stored hash predates the current policy; upgrade it while we have the password,
+            # through the same bounded pool as the check (skipped when it is busy)
+            if user.password_needs_rehash() and user.upgrade_password_hash(form.password.data):
+                db.session.commit()
+                record_rehash()
             login_user(user, remember=form.remember_me.data)
             flash(f'Welcome back, {user.username}!', 'success')
             next_page = request.args.get('next')
@@ -176,6 +203,14 @@ def register_instructor():
         return redirect(url_for('instructor_dashboard'))
     return render_template('accounts/register_instructor.html', form=form)
 
+# Templates behind each conditionally served page (their versions are part of the ETag)
+COURSE_LIST_TEMPLATES = ('base.html', '_thumbnail.html', 'courses/course_list.html')
+COURSE_DETAIL_TEMPLATES = ('base.html', '_thumbnail.html', 'courses/course_detail.html',
+                           'courses/_course_header.html', 'courses/_course_outline.html',
+                           'courses/_course_stats.html')
+LESSON_DETAIL_TEMPLATES = ('base.html', 'lessons/lesson_detail.html',
+                           'lessons/_lesson_content.html', 'lessons/_lesson_outline.html')
+
 # Course routes
 @app.route('/courses')
 def course_list():
@@ -189,61 +224,60 @@ def course_list():
     # Support multiple category selection
     category_names = request.args.getlist('category')  # Get list of selected categories
     
-    # For non-authenticated users, show empty list
-    if not current_user.is_authenticated:
-        courses = []
-    elif current_user.is_instructor():
-        # Instructors can see their own courses
-        query = Course.query.filter_by(instructor_id=current_user.id, is_published=True)
+    # Courses the user may list: instructors their own, students the ones they're
+    # enrolled in, nothing for non-authenticated users
+    visible = None
+    if current_user.is_authenticated:
+        if current_user.is_instructor():
+            visible = Course.query.filter_by(instructor_id=current_user.id, is_published=True)
+        else:
+            course_ids = enrolled_course_ids(current_user.id)
+            if course_ids:
+                visible = Course.query.filter(Course.id.in_(course_ids), Course.is_published == True)
+    
+    categories = Category.query.order_by(Category.name).all()
+    # Sidebar badges: one grouped count instead of loading every category's courses
+    category_counts = dict(db.session.execute(
+        select(Course.category_id, func.count(Course.id)).group_by(Course.category_id)
+    ).all())
+    
+    # Answer a revalidation before running the listing query
+    listing = courses_version(visible) if visible is not None else None
+    # The sidebar counts cover every course, not just the viewer's listing. A
+    # course deleted elsewhere leaves no timestamp behind, so this page is
+    # validated by its ETag alone (no Last-Modified)
+    etag = page_etag(listing, [(c.name, category_counts.get(c.id, 0)) for c in categories],
+                     request.query_string, viewer_key(),
+                     templates=COURSE_LIST_TEMPLATES)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    
+    courses = []
+    if visible is not None:
+        query = visible
         if category_names:
             # Filter by multiple categories
-            category_objs = Category.query.filter(Category.name.in_(category_names)).all()
-            if category_objs:
-                category_ids = [c.id for c in category_objs]
+            category_ids = [c.id for c in categories if c.name in category_names]
+            if category_ids:
                 query = query.filter(Course.category_id.in_(category_ids))
         if search:
-            query = query.filter(
-                or_(
-                    Course.title.contains(search),
-                    Course.description.contains(search)
-                )
-            )
-        courses = query.all()
-    else:
-        # Students can only see courses they're enrolled in
-        enrollments = Enrollment.query.filter_by(student_id=current_user.id).all()
-        enrolled_course_ids = [e.course_id for e in enrollments]
-        if not enrolled_course_ids:
-            courses = []
-        else:
-            query = Course.query.filter(Course.id.in_(enrolled_course_ids), Course.is_published == True)
-            if category_names:
-                # Filter by multiple categories
-                category_objs = Category.query.filter(Category.name.in_(category_names)).all()
-                if category_objs:
-                    category_ids = [c.id for c in category_objs]
-                    query = query.filter(Course.category_id.in_(category_ids))
-            if search:
-                query = query.filter(
-                    or_(
-                        Course.title.contains(search),
-                        Course.description.contains(search)
-                    )
-                )
-            courses = query.all()  # Always execute query
+            query = search_courses(query, search)
+        courses = with_profile(query, 'course_card').all()
     
-    categories = Category.query.order_by(Category.name).all()
-    return render_template('courses/course_list.html', courses=courses, categories=categories, 
-                         selected_categories=category_names, search_query=search)
+    # Highlighted title/description fragments for the search results
+    snippets = course_snippets([c.id for c in courses], search) if search else {}
+    
+    return with_validators(
+        render_template('courses/course_list.html', courses=courses, categories=categories,
+                        category_counts=category_counts, selected_categories=category_names,
+                        search_query=search, snippets=snippets),
+        etag)
 
 @app.route('/courses/<int:course_id>')
 def course_detail(course_id):
     course = Course.query.get_or_404(course_id)
     
-    # Check access permissions
-    can_access = False
-    is_enrolled = False
-    
     if not current_user.is_authenticated:
         flash('Please login to view course details.', 'error')
         return redirect(url_for('login'))
@@ -252,25 +286,38 @@ def course_detail(course_id):
     if current_user.is_admin():
         flash('Please use the Admin Panel to manage courses.', 'info')
         return redirect(url_for('admin_courses'))
-    # Instructors can access their own courses
-    elif current_user.is_instructor() and course.instructor_id == current_user.id:
-        can_access = True
-    # Students can access courses they're enrolled in
-    elif current_user.is_student():
-        enrollment = Enrollment.query.filter_by(student_id=current_user.id, course_id=course_id).first()
-        if enrollment:
-            is_enrolled = True
-            can_access = True
-    
-    if not can_access:
+    
+    # Instructors can access their own courses, students the ones they're enrolled in
+    if not can_view_course(current_user, course):
         flash('You must enroll in this course using the course code to access it.', 'error')
         return redirect(url_for('enroll_by_code'))
     
-    if current_user.is_student() and not is_enrolled:
-        enrollment = Enrollment.query.filter_by(student_id=current_user.id, course_id=course_id).first()
-        is_enrolled = enrollment is not None
-    
-    return render_template('courses/course_detail.html', course=course, is_enrolled=is_enrolled)
+    # Students only get this far when they are enrolled. The viewer-independent
+    # parts come from the fragment cache; the outline is only queried on a miss
+    is_enrolled = current_user.is_student()
+    version = course_version(course)
+    etag = page_etag(version, course.enrollment_count, course.course_code, thumbnail_version(course.thumbnail),
+                     viewer_key(), templates=COURSE_DETAIL_TEMPLATES)
+    last_modified = newest(course.updated_at, version[4])
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    
+    fragments = {
+        # The header's <picture> lists the thumbnail variants written so far
+        'header': cached_fragment('course_header', 'courses/_course_header.html',
+                                  version + (thumbnail_version(course.thumbnail),),
+                                  lambda: {'course': course}),
+        'outline': cached_fragment('course_outline', 'courses/_course_outline.html', version + (True,),
+                                   lambda: {'lessons': lesson_outline(course.id), 'linked': True}),
+        'stats': cached_fragment('course_stats', 'courses/_course_stats.html', version,
+                                 lambda: {'course': course}),
+    }
+    return with_validators(
+        render_template('courses/course_detail.html', course=course, is_enrolled=is_enrolled,
+                        fragments=fragments,
+                        first_lesson_id=first_lesson_id(course.id) if is_enrolled else None),
+        etag, last_modified)
 
 @app.route('/courses/create', methods=['GET', 'POST'])
 @instructor_required
@@ -302,7 +349,7 @@ def course_create():
                 if not category:
                     category = Category(name=custom_code, description=f'Custom category: {custom_code}')
                     db.session.add(category)
-                    db.session.commit()
+                    db.session.flush()
                 category_id = category.id
         elif category_code_value and category_code_value != '' and category_code_value != 'OTHER':
             # Use predefined category code (the value is already just the code like "CS", "EE", etc.)
@@ -313,28 +360,34 @@ def course_create():
                 if not category:
                     category = Category(name=code, description=f'Category: {code}')
                     db.session.add(category)
-                    db.session.commit()
+                    db.session.flush()
                 category_id = category.id
         
+        # course_code is assigned by add_course() below
         course = Course(
             title=form.title.data,
             description=form.description.data,
             instructor_id=current_user.id,
             category_id=category_id,
-            is_published=True,
-            course_code=Course.generate_course_code()
+            is_published=True
         )
         
         if 'thumbnail' in request.files:
             file = request.files['thumbnail']
             if file and file.filename and allowed_file(file.filename, 'image'):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'course_thumbnails', filename)
-                file.save(filepath)
-                course.thumbnail = f'course_thumbnails/{filename}'
+                try:
+                    validate_image(file.stream)
+                except InvalidImage as e:
+                    flash(str(e), 'error')
+                    return render_template('courses/course_create.html', form=form)
+                # Metadata is stripped before the file is hashed and stored
+                course.thumbnail = store_upload(strip_metadata(file), 'course_thumbnails')
         
-        db.session.add(course)
+        # Category, course and thumbnail reference commit together
+        add_course(course)
         db.session.commit()
+        if course.thumbnail:
+            schedule_thumbnail(course.thumbnail)
         flash('Course created successfully!', 'success')
         return redirect(url_for('course_detail', course_id=course.id))
     
@@ -409,16 +462,18 @@ def course_edit(course_id):
         if 'thumbnail' in request.files:
             file = request.files['thumbnail']
             if file and file.filename and allowed_file(file.filename, 'image'):
-                # Delete old thumbnail if exists
+                try:
+                    validate_image(file.stream)
+                except InvalidImage as e:
+                    flash(str(e), 'error')
+                    return render_template('courses/course_edit.html', form=form, course=course)
+                
+                # Release old thumbnail (and its resized variants) if exists
                 if course.thumbnail:
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], course.thumbnail)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
+                    delete_thumbnail(course.thumbnail)
                 
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'course_thumbnails', filename)
-                file.save(filepath)
-                course.thumbnail = f'course_thumbnails/{filename}'
+                course.thumbnail = store_upload(strip_metadata(file), 'course_thumbnails')
+                schedule_thumbnail(course.thumbnail)
         
         db.session.commit()
         flash('Course updated successfully!', 'success')
@@ -449,13 +504,8 @@ def course_delete(course_id):
         return redirect(url_for('course_detail', course_id=course_id))
     
     if request.method == 'POST':
-        # Delete thumbnail if exists
-        if course.thumbnail:
-            thumbnail_path = os.path.join(app.config['UPLOAD_FOLDER'], course.thumbnail)
-            if os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
-        
-        db.session.delete(course)
+        # Set-based cascade; files are removed by the background worker
+        delete_courses([course.id])
         db.session.commit()
         flash('Course deleted successfully!', 'success')
         return redirect(url_for('instructor_dashboard'))
@@ -470,22 +520,33 @@ def lesson_detail(lesson_id):
     course = lesson.course_ref
     
     # Check if user is enrolled (for students) or is the instructor
-    if current_user.is_student():
-        enrollment = Enrollment.query.filter_by(student_id=current_user.id, course_id=course.id).first()
-        if not enrollment:
-            flash('You must enroll in this course to access lessons.', 'error')
-            return redirect(url_for('course_detail', course_id=course.id))
-    
-    # Get all lessons for navigation
-    lessons = lesson.course_ref.lessons
-    lesson_list = list(lessons)
-    current_index = lesson_list.index(lesson) if lesson in lesson_list else 0
-    
-    previous_lesson = lesson_list[current_index - 1] if current_index > 0 else None
-    next_lesson = lesson_list[current_index + 1] if current_index < len(lesson_list) - 1 else None
+    if not can_view_lessons(current_user, course):
+        flash('You must enroll in this course to access lessons.', 'error')
+        return redirect(url_for('course_detail', course_id=course.id))
     
-    return render_template('lessons/lesson_detail.html', lesson=lesson, course=course,
-                         previous_lesson=previous_lesson, next_lesson=next_lesson, lessons=lessons)
+    # Lesson body and outline come from the fragment cache; on a miss they use
+    # indexed neighbor lookups and a light outline instead of loading every lesson
+    version = course_version(course)
+    etag = page_etag(version, lesson.id, viewer_key(), templates=LESSON_DETAIL_TEMPLATES)
+    last_modified = newest(course.updated_at, version[4])
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    
+    key = version + (lesson.id,)
+    
+    def content_context():
+        previous_lesson, next_lesson = lesson_neighbors(lesson)
+        return {'lesson': lesson, 'course': course, 'previous_lesson': previous_lesson, 'next_lesson': next_lesson}
+    
+    fragments = {
+        'content': cached_fragment('lesson_content', 'lessons/_lesson_content.html', key, content_context),
+        'outline': cached_fragment('lesson_outline', 'lessons/_lesson_outline.html', key,
+                                   lambda: {'lesson': lesson, 'lessons': lesson_outline(course.id)}),
+    }
+    return with_validators(
+        render_template('lessons/lesson_detail.html', lesson=lesson, course=course, fragments=fragments),
+        etag, last_modified)
 
 @app.route('/lessons/course/<int:course_id>/create', methods=['GET', 'POST'])
 @instructor_required
@@ -508,18 +569,20 @@ def lesson_create(course_id):
         if 'video_file' in request.files:
             file = request.files['video_file']
             if file and file.filename and allowed_file(file.filename, 'video'):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'lesson_videos', filename)
-                file.save(filepath)
-                lesson.video_file = f'lesson_videos/{filename}'
+                lesson.video_file = store_upload(file, 'lesson_videos')
         
         if 'lesson_file' in request.files:
             file = request.files['lesson_file']
             if file and file.filename and allowed_file(file.filename, 'document'):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'lesson_files', filename)
-                file.save(filepath)
-                lesson.lesson_file = f'lesson_files/{filename}'
+                lesson.lesson_file = store_upload(file, 'lesson_files')
+        
+        # Video sent through the chunked upload API
+        upload = get_user_upload(form.video_upload_id.data, current_user)
+        if upload and upload.course_id == course.id:
+            try:
+                attach_video(lesson, upload)
+            except UploadError as e:
+                flash(e.message, 'error')
         
         db.session.add(lesson)
         db.session.commit()
@@ -553,27 +616,25 @@ def lesson_edit(lesson_id):
             file = request.files['video_file']
             if file and file.filename and allowed_file(file.filename, 'video'):
                 if lesson.video_file:
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], lesson.video_file)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
+                    release(lesson.video_file)
                 
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'lesson_videos', filename)
-                file.save(filepath)
-                lesson.video_file = f'lesson_videos/{filename}'
+                lesson.video_file = store_upload(file, 'lesson_videos')
         
         if 'lesson_file' in request.files:
             file = request.files['lesson_file']
             if file and file.filename and allowed_file(file.filename, 'document'):
                 if lesson.lesson_file:
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], lesson.lesson_file)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
+                    release(lesson.lesson_file)
                 
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'lesson_files', filename)
-                file.save(filepath)
-                lesson.lesson_file = f'lesson_files/{filename}'
+                lesson.lesson_file = store_upload(file, 'lesson_files')
+        
+        # Video sent through the chunked upload API
+        upload = get_user_upload(form.video_upload_id.data, current_user)
+        if upload and upload.course_id == course.id:
+            try:
+                attach_video(lesson, upload)
+            except UploadError as e:
+                flash(e.message, 'error')
         
         db.session.commit()
         flash('Lesson updated successfully!', 'success')
@@ -592,15 +653,9 @@ def lesson_delete(lesson_id):
         return redirect(url_for('lesson_detail', lesson_id=lesson_id))
     
     if request.method == 'POST':
-        # Delete files if exist
-        if lesson.video_file:
-            video_path = os.path.join(app.config['UPLOAD_FOLDER'], lesson.video_file)
-            if os.path.exists(video_path):
-                os.remove(video_path)
-        if lesson.lesson_file:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], lesson.lesson_file)
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        # Release files (removed once no other lesson shares them)
+        release(lesson.video_file)
+        release(lesson.lesson_file)
         
         db.session.delete(lesson)
         db.session.commit()
@@ -637,8 +692,7 @@ def enroll_by_code():
             return render_template('enrollments/enroll.html', form=form)
         
         # Check if already enrolled
-        enrollment = Enrollment.query.filter_by(student_id=current_user.id, course_id=course.id).first()
-        if enrollment:
+        if is_enrolled(current_user, course.id):
             flash(f'You are already enrolled in "{course.title}".', 'info')
             return redirect(url_for('course_detail', course_id=course.id))
         
@@ -666,6 +720,33 @@ def unenroll(course_id):
     
     return redirect(url_for('student_dashboard'))
 
+@app.route('/courses/<int:course_id>/roster', methods=['GET', 'POST'])
+@login_required
+def course_roster_import(course_id):
+    """Enroll the students listed in an uploaded CSV, streaming progress as JSON lines"""
+    course = Course.query.get_or_404(course_id)
+    if course.instructor_id != current_user.id and not current_user.is_admin():
+        flash('Access denied. You can only import rosters into your own courses.', 'error')
+        return redirect(url_for('course_detail', course_id=course_id))
+    
+    if request.method == 'GET':
+        return render_template('courses/course_roster.html', course=course)
+    
+    roster = request.files.get('roster')
+    if not roster or not roster.filename:
+        return jsonify({'error': 'Choose a CSV file to import.'}), 400
+    try:
+        entries = parse_roster(roster.stream)
+    except RosterError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        for progress in import_roster(course, entries):
+            yield json.dumps(progress) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
 # Dashboard routes
 @app.route('/dashboard/student')
 @login_required
@@ -678,7 +759,7 @@ def student_dashboard():
         flash('Access denied. Instructors cannot access student dashboard.', 'error')
         return redirect(url_for('instructor_dashboard'))
     
-    enrollments = Enrollment.query.filter_by(student_id=current_user.id).all()
+    enrollments = with_profile(Enrollment.query.filter_by(student_id=current_user.id), 'student_dashboard').all()
     enrolled_courses = [e.course_ref for e in enrollments]
     
     return render_template('dashboards/student_dashboard.html', enrolled_courses=enrolled_courses, enrollments=enrollments)
@@ -691,7 +772,7 @@ def instructor_dashboard():
         flash('Access denied. Admin users cannot access instructor dashboard.', 'error')
         return redirect(url_for('admin_dashboard'))
     
-    courses = Course.query.filter_by(instructor_id=current_user.id).all()
+    courses = with_profile(Course.query.filter_by(instructor_id=current_user.id), 'instructor_dashboard').all()
     
     # Calculate statistics
     course_ids = [c.id for c in courses]
@@ -706,5 +787,10 @@ def instructor_dashboard():
 # Media file serving
 @app.route('/media/<path:filename>')
 def media(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_media(filename)
+
+# Fingerprinted static assets (see assets.py)
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    return send_asset(filename)
 
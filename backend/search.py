@@ -0,0 +1,156 @@
+"""
+Full-text course search backed by an SQLite FTS5 index.
+
+``courses_fts`` is an external-content FTS5 table over courses.title and
+courses.description. Triggers on ``courses`` keep it in sync, so every
+insert/update/delete path (ORM or raw SQL) updates the index in the same
+transaction. The table and triggers are created alongside ``courses`` by
+db.create_all(); existing databases can be indexed with
+``flask --app backend.app rebuild-search-index``.
+
+search_courses() narrows an existing (already permission-filtered) Course
+query, so the role-based visibility rules stay with the caller. Terms are
+prefix-matched and results can be ranked by bm25 with the title weighted
+above the description. When FTS5 is unavailable (another database backend,
+or an SQLite build without FTS5) it falls back to the old LIKE filter.
+"""
+
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, column, event, or_, select, table, text
+
+from .models import db, Course
+
+FTS_TABLE = 'courses_fts'
+
+# bm25 column weights: title, description
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description,
+        content='courses', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON courses BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON courses BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description ON courses BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+for _statement in FTS_SCHEMA:
+    event.listen(Course.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(Course.__table__, 'before_drop',
+             DDL(f'DROP TABLE IF EXISTS {FTS_TABLE}').execute_if(dialect='sqlite'))
+
+courses_fts = table(FTS_TABLE, column('rowid'))
+
+# Private-use markers around matches; swapped for <mark> after HTML-escaping
+_HIT_START = '\ue000'
+_HIT_END = '\ue001'
+
+_fts_ready = {}
+
+
+def fts_available():
+    """Return True if the current database has the courses_fts index."""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    key = str(engine.url)
+    if key not in _fts_ready:
+        found = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE},
+        ).first()
+        _fts_ready[key] = found is not None
+    return _fts_ready[key]
+
+
+def build_match_query(term):
+    """Turn user input into an FTS5 MATCH expression (AND of prefix terms).
+
+    Only word characters are kept and every token is quoted, so user input
+    can never inject FTS5 query syntax. Returns None if nothing is searchable.
+    """
+    tokens = re.findall(r'\w+', term or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _like_filter(query, term):
+    return query.filter(
+        or_(
+            Course.title.contains(term),
+            Course.description.contains(term)
+        )
+    )
+
+
+def search_courses(query, term, ranked=True):
+    """Restrict a Course query to courses matching ``term``.
+
+    With ``ranked=True`` the results are ordered by bm25 relevance; otherwise
+    the query's own ordering is left alone (used by keyset-paginated views).
+    """
+    match = build_match_query(term)
+    if match is None or not fts_available():
+        return _like_filter(query, term)
+
+    match_clause = text(f'{FTS_TABLE} MATCH :fts_match').bindparams(fts_match=match)
+    if not ranked:
+        matching_ids = select(courses_fts.c.rowid).where(match_clause)
+        return query.filter(Course.id.in_(matching_ids))
+
+    rank = text(f'bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})')
+    return (query.join(courses_fts, courses_fts.c.rowid == Course.id)
+            .filter(match_clause)
+            .order_by(rank))
+
+
+def _render_hits(fragment):
+    html = str(escape(fragment or ''))
+    return Markup(html.replace(_HIT_START, '<mark>').replace(_HIT_END, '</mark>'))
+
+
+def course_snippets(course_ids, term, tokens=24):
+    """Return ``{course_id: {'title': Markup, 'snippet': Markup}}`` with matches highlighted."""
+    match = build_match_query(term)
+    if not course_ids or match is None or not fts_available():
+        return {}
+
+    rows = db.session.execute(
+        text(
+            f"SELECT rowid, "
+            f"highlight({FTS_TABLE}, 0, :start, :end), "
+            f"snippet({FTS_TABLE}, 1, :start, :end, '…', :tokens) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_match "
+            f"AND rowid IN ({', '.join(str(int(i)) for i in course_ids)})"
+        ),
+        {'start': _HIT_START, 'end': _HIT_END, 'tokens': tokens, 'fts_match': match},
+    )
+    return {
+        row[0]: {'title': _render_hits(row[1]), 'snippet': _render_hits(row[2])}
+        for row in rows
+    }
+
+
+def rebuild_search_index():
+    """Create the FTS table/triggers if needed and re-index every course."""
+    for statement in FTS_SCHEMA:
+        db.session.execute(text(statement))
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    _fts_ready.clear()
+    return db.session.execute(text(f'SELECT COUNT(*) FROM {FTS_TABLE}')).scalar()
@@ -0,0 +1,114 @@
+"""
+Cached statistics snapshot for the admin dashboard.
+
+All dashboard figures are computed by one aggregate statement: conditional
+sums over users and courses plus a category count. Lesson and enrollment
+totals are summed from the Course counter columns (see counters.py), so the
+query never scans the enrollments table.
+
+The snapshot is kept in a per-process TTL cache (ADMIN_STATS_TTL seconds)
+and dropped as soon as a commit touches users, courses, categories, lessons
+or enrollments. Each drop bumps a generation counter; a snapshot whose
+computation overlapped a drop is returned but not stored, so a commit that
+lands while the query runs is never hidden for a whole TTL.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import case, event, func, select, true
+
+from .models import db, User, Course, Category, Lesson, Enrollment
+
+DEFAULT_TTL = 60
+
+# Models whose changes make the snapshot stale
+TRACKED_MODELS = (User, Course, Category, Lesson, Enrollment)
+
+_lock = threading.Lock()
+_snapshot = None
+_expires_at = 0.0
+_generation = 0
+
+_DIRTY_KEY = 'admin_stats_dirty'
+
+
+def _compute_stats():
+    users = select(
+        func.count(User.id).label('total_users'),
+        func.coalesce(func.sum(case((User.role == 'instructor', 1), else_=0)), 0).label('total_instructors'),
+        func.coalesce(func.sum(case((User.role == 'student', 1), else_=0)), 0).label('total_students'),
+    ).subquery()
+    courses = select(
+        func.count(Course.id).label('total_courses'),
+        func.coalesce(func.sum(case((Course.is_published == True, 1), else_=0)), 0).label('published_courses'),
+        func.coalesce(func.sum(Course.lesson_count), 0).label('total_lessons'),
+        func.coalesce(func.sum(Course.enrollment_count), 0).label('total_enrollments'),
+    ).subquery()
+    categories = select(func.count(Category.id).label('total_categories')).subquery()
+
+    # Each subquery yields exactly one row, so the cross join is a single row
+    one_row = users.join(courses, true()).join(categories, true())
+    row = db.session.execute(select(users, courses, categories).select_from(one_row)).mappings().one()
+    stats = {key: int(value or 0) for key, value in row.items()}
+    stats['unpublished_courses'] = stats['total_courses'] - stats['published_courses']
+    return stats
+
+
+def get_dashboard_stats(ttl=None):
+    """Return ``(stats, generated_at)`` for the admin dashboard, cached for ``ttl`` seconds."""
+    global _snapshot, _expires_at
+    from .app import app
+
+    if ttl is None:
+        ttl = app.config.get('ADMIN_STATS_TTL', DEFAULT_TTL)
+
+    now = time.monotonic()
+    with _lock:
+        if _snapshot is not None and now < _expires_at:
+            return _snapshot
+        generation = _generation
+
+    snapshot = (_compute_stats(), datetime.utcnow())
+    with _lock:
+        # An invalidation during the query means the result may already be stale
+        if generation == _generation:
+            _snapshot = snapshot
+            _expires_at = now + ttl
+    return snapshot
+
+
+def invalidate_dashboard_stats():
+    """Drop the cached snapshot so the next request recomputes it."""
+    global _snapshot, _expires_at, _generation
+    with _lock:
+        _snapshot = None
+        _expires_at = 0.0
+        _generation += 1
+
+
+def mark_dashboard_stats_dirty(session=None):
+    """Drop the snapshot when ``session`` commits; for bulk statements the flush hook cannot see."""
+    (session or db.session).info[_DIRTY_KEY] = True
+
+
+@event.listens_for(db.session, 'after_flush')
+def _mark_stats_dirty(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, TRACKED_MODELS):
+            session.info[_DIRTY_KEY] = True
+            return
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop(_DIRTY_KEY, False):
+        invalidate_dashboard_stats()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_on_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,364 @@
+"""
+Content-addressed media store.
+
+Every uploaded file is stored under a path derived from the SHA-256 of its
+bytes, sharded by the first two byte pairs of the digest so no directory
+grows without bound::
+
+    lesson_files/3f/a9/3fa9...c2.pdf
+
+The top-level directory is still the media kind, so the per-directory cache
+policies in media.py keep working. The digest is computed while the upload
+is streamed to a temporary file, so nothing is read twice.
+
+A MediaBlob row per stored file counts how many columns reference it.
+Uploading content that is already stored only bumps the count; release()
+drops a reference and the file is unlinked once the last one is gone. File
+removal is queued as a ``cleanup_media`` job (jobs.py) committed with the
+surrounding transaction, so requests never block on deletes and the disk
+never gets ahead of the database; files placed by a transaction that rolls
+back are cleaned up immediately.
+
+Paths written before this store existed (``lesson_videos/<name>``) have no
+MediaBlob row; release() simply removes them, and
+``flask --app backend.app migrate-media`` moves them into the store.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+from sqlalchemy import case, delete, event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.utils import secure_filename
+
+from .app import app
+from .models import db, MediaBlob, User, Course, Lesson
+
+MEDIA_KINDS = ('profile_pictures', 'course_thumbnails', 'lesson_videos', 'lesson_files')
+
+STREAM_BUFFER_SIZE = 64 * 1024
+# Paths per statement in release_many()
+RELEASE_BATCH_SIZE = 500
+
+_BLOB_PATH_RE = re.compile(r'^[a-z_]+/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+_CREATED_KEY = 'media_created'
+_UNLINK_KEY = 'media_unlink'
+
+
+def blob_path(kind, digest, ext=''):
+    """``('lesson_files', '3fa9...', 'pdf')`` -> ``lesson_files/3f/a9/3fa9....pdf``."""
+    name = f'{digest}.{ext}' if ext else digest
+    return f'{kind}/{digest[:2]}/{digest[2:4]}/{name}'
+
+
+def is_blob_path(path):
+    """True for paths written by this store (as opposed to legacy flat paths)."""
+    return bool(path and _BLOB_PATH_RE.match(path))
+
+
+def _extension(filename):
+    filename = secure_filename(filename or '')
+    if '.' not in filename:
+        return ''
+    return filename.rsplit('.', 1)[1].lower()
+
+
+def _full_path(path):
+    return os.path.join(app.config['UPLOAD_FOLDER'], path)
+
+
+def _copy_to_temp(stream):
+    """Copy ``stream`` into a temp file, hashing as it goes; returns (tmp_path, digest, size)."""
+    folder = app.config['UPLOAD_TMP_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.blob')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(STREAM_BUFFER_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAM_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _place(source, path):
+    """Move ``source`` to ``path`` unless identical content is already there."""
+    destination = _full_path(path)
+    if os.path.exists(destination):
+        os.remove(source)
+        return False
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.move(source, destination)
+    return True
+
+
+def _add_reference(path, digest, kind, size):
+    """Insert the blob row with one reference, or add a reference to an existing one."""
+    dialect = db.session.get_bind().dialect.name
+    values = dict(path=path, sha256=digest, kind=kind, size=size, ref_count=1)
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(MediaBlob).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaBlob.path],
+            set_={'ref_count': MediaBlob.ref_count + 1},
+        )
+        db.session.execute(stmt)
+        return
+    if not retain(path):
+        db.session.add(MediaBlob(**values))
+        db.session.flush()
+
+
+def _store(tmp_path, digest, size, kind, ext):
+    path = blob_path(kind, digest, ext)
+    if _place(tmp_path, path):
+        db.session.info.setdefault(_CREATED_KEY, set()).add(path)
+    _add_reference(path, digest, kind, size)
+    return path
+
+
+def store_upload(file, kind):
+    """Store an uploaded FileStorage under ``kind`` and return its media path."""
+    if kind not in MEDIA_KINDS:
+        raise ValueError(f'Unknown media kind: {kind}')
+    tmp_path, digest, size = _copy_to_temp(file.stream)
+    return _store(tmp_path, digest, size, kind, _extension(file.filename))
+
+
+def store_file(source, kind, filename=None, move=True):
+    """Store a file already on disk (e.g. a finished chunked upload); returns its media path.
+
+    With ``move=False`` the source is copied and left in place.
+    """
+    if kind not in MEDIA_KINDS:
+        raise ValueError(f'Unknown media kind: {kind}')
+    ext = _extension(filename or os.path.basename(source))
+    if move:
+        size = os.path.getsize(source)
+        digest = _hash_file(source)
+        tmp_path = source
+    else:
+        with open(source, 'rb') as f:
+            tmp_path, digest, size = _copy_to_temp(f)
+    return _store(tmp_path, digest, size, kind, ext)
+
+
+def retain(path):
+    """Add a reference to an existing blob; returns False if ``path`` is not a stored blob."""
+    result = db.session.execute(
+        update(MediaBlob)
+        .where(MediaBlob.path == path)
+        .values(ref_count=MediaBlob.ref_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def release(path, derived=()):
+    """Drop one reference to ``path``.
+
+    When it was the last reference (or ``path`` is a legacy file without a
+    blob row) the file and any ``derived`` files (e.g. thumbnail variants)
+    are queued for removal when the transaction commits. Returns True in
+    that case.
+    """
+    if not path:
+        return False
+    result = db.session.execute(
+        update(MediaBlob)
+        .where(MediaBlob.path == path)
+        .values(ref_count=MediaBlob.ref_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        removed = db.session.execute(
+            delete(MediaBlob)
+            .where(MediaBlob.path == path, MediaBlob.ref_count <= 0)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not removed:
+            return False
+    db.session.info.setdefault(_UNLINK_KEY, set()).update((path, *derived))
+    return True
+
+
+def release_many(paths, derived=None):
+    """Drop one reference per entry of ``paths`` using set-based statements.
+
+    A path listed n times loses n references. ``derived`` optionally maps a
+    path to files removed together with it. Returns the set of paths queued
+    for removal.
+    """
+    counts = Counter(path for path in paths if path)
+    derived = derived or {}
+    released = set()
+    items = list(counts.items())
+    for start in range(0, len(items), RELEASE_BATCH_SIZE):
+        batch = dict(items[start:start + RELEASE_BATCH_SIZE])
+        stored = set(db.session.execute(
+            select(MediaBlob.path).where(MediaBlob.path.in_(batch))
+        ).scalars())
+        gone = set()
+        if stored:
+            db.session.execute(
+                update(MediaBlob)
+                .where(MediaBlob.path.in_(stored))
+                .values(ref_count=MediaBlob.ref_count - case({p: batch[p] for p in stored}, value=MediaBlob.path))
+                .execution_options(synchronize_session=False)
+            )
+            gone = set(db.session.execute(
+                select(MediaBlob.path).where(MediaBlob.path.in_(stored), MediaBlob.ref_count <= 0)
+            ).scalars())
+            if gone:
+                db.session.execute(
+                    delete(MediaBlob)
+                    .where(MediaBlob.path.in_(gone))
+                    .execution_options(synchronize_session=False)
+                )
+        # Legacy paths have no blob row and are removed outright
+        released |= gone | (set(batch) - stored)
+
+    if released:
+        unlink = db.session.info.setdefault(_UNLINK_KEY, set())
+        for path in released:
+            unlink.add(path)
+            unlink.update(derived.get(path, ()))
+    return released
+
+
+def _referenced(paths, connection=None):
+    """Subset of ``paths`` that have a MediaBlob row (on a fresh connection by default)."""
+    blob_paths = [p for p in paths if is_blob_path(p)]
+    if not blob_paths:
+        return set()
+    query = select(MediaBlob.path).where(MediaBlob.path.in_(blob_paths))
+    if connection is not None:
+        return set(connection.execute(query).scalars())
+    with db.engine.connect() as conn:
+        return set(conn.execute(query).scalars())
+
+
+def _unlink(paths):
+    for path in paths:
+        try:
+            os.remove(_full_path(path))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            app.logger.exception('Could not remove media file %s', path)
+
+
+def remove_unreferenced(paths):
+    """Unlink ``paths`` unless an upload has stored the same content again meanwhile."""
+    paths = set(paths)
+    _unlink(paths - _referenced(paths, db.session))
+
+
+@event.listens_for(db.session, 'before_commit')
+def _queue_released_files(session):
+    paths = session.info.pop(_UNLINK_KEY, None)
+    if paths:
+        from .jobs import enqueue
+        enqueue('cleanup_media', paths=sorted(paths))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _forget_created_files(session):
+    session.info.pop(_CREATED_KEY, None)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_unreferenced_files(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_UNLINK_KEY, None)
+    created = session.info.pop(_CREATED_KEY, None)
+    if created:
+        _unlink(created - _referenced(created))
+
+
+# Columns that hold media paths, with the kind their files are stored under
+MEDIA_COLUMNS = (
+    (User, 'profile_picture', 'profile_pictures'),
+    (Course, 'thumbnail', 'course_thumbnails'),
+    (Lesson, 'video_file', 'lesson_videos'),
+    (Lesson, 'lesson_file', 'lesson_files'),
+)
+
+
+def migrate_legacy_media(dry_run=False, batch_size=100):
+    """Move files referenced by legacy flat paths into the store.
+
+    Every row pointing at a legacy path is repointed at the blob (files shared
+    by several rows are copied once and referenced several times), and the
+    legacy file is removed after its batch commits. Returns a dict of counts:
+    ``migrated`` rows, ``missing`` rows whose file does not exist, and
+    ``stored`` distinct files.
+    """
+    from .images import thumbnail_derivatives, schedule_thumbnail
+
+    counts = {'migrated': 0, 'missing': 0, 'stored': 0}
+    moved = {}
+    new_thumbnails = set()
+
+    for model, column_name, kind in MEDIA_COLUMNS:
+        column = getattr(model, column_name)
+        rows = model.query.filter(column.isnot(None), column != '').order_by(model.id).all()
+        pending = 0
+        for row in rows:
+            old_path = getattr(row, column_name)
+            if is_blob_path(old_path):
+                continue
+            if old_path in moved:
+                new_path = moved[old_path]
+                if not dry_run:
+                    retain(new_path)
+            else:
+                source = _full_path(old_path)
+                if not os.path.isfile(source):
+                    counts['missing'] += 1
+                    continue
+                new_path = '(dry run)' if dry_run else store_file(source, kind, move=False)
+                moved[old_path] = new_path
+                counts['stored'] += 1
+                if not dry_run:
+                    derived = thumbnail_derivatives(old_path) if kind == 'course_thumbnails' else ()
+                    release(old_path, derived)
+                    if kind == 'course_thumbnails':
+                        new_thumbnails.add(new_path)
+            counts['migrated'] += 1
+            if dry_run:
+                continue
+            setattr(row, column_name, new_path)
+            pending += 1
+            if pending >= batch_size:
+                db.session.commit()
+                pending = 0
+        if not dry_run:
+            db.session.commit()
+
+    for path in new_thumbnails:
+        schedule_thumbnail(path)
+    return counts
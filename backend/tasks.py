@@ -0,0 +1,25 @@
+"""
+Background job handlers (see jobs.py).
+
+Every handler must be idempotent: a job can run again after a crash or a
+failed attempt, so work that is already done is skipped rather than
+treated as an error.
+"""
+
+from .deletion import delete_courses
+from .jobs import job_handler
+from .storage import remove_unreferenced
+
+
+@job_handler('cleanup_media')
+def cleanup_media(paths):
+    """Remove media files whose last reference was released."""
+    remove_unreferenced(paths)
+
+
+# Course deletes run in the request now (deletion.py). This handler only drains
+# 'delete_course' jobs queued before that change; nothing enqueues it any more.
+@job_handler('delete_course')
+def delete_course(course_id):
+    """Delete a course with its lessons, enrollments, pending uploads and files."""
+    delete_courses([course_id])
@@ -0,0 +1,100 @@
+from flask import request, jsonify
+from flask_login import current_user
+
+from .app import app
+from .models import db, Course, Lesson
+from .routes import instructor_required
+from .uploads import (UploadError, get_user_upload, start_upload, upload_offset,
+                      write_chunk, attach_video, abort_upload)
+
+def upload_status(upload):
+    return {
+        'upload_id': upload.id,
+        'filename': upload.filename,
+        'size': upload.total_size,
+        'chunk_size': upload.chunk_size,
+        'offset': upload_offset(upload),
+    }
+
+def error_response(error):
+    payload = {'error': error.message}
+    if error.offset is not None:
+        payload['offset'] = error.offset
+    return jsonify(payload), error.status
+
+@app.route('/api/uploads', methods=['POST'])
+@instructor_required
+def upload_start():
+    """Open a chunked upload session for a lesson video"""
+    data = request.get_json(silent=True) or {}
+    course = db.session.get(Course, data.get('course_id') or 0)
+    if course is None or course.instructor_id != current_user.id:
+        return jsonify({'error': 'You can only upload videos to your own courses.'}), 403
+    
+    try:
+        upload = start_upload(current_user, course, data.get('filename'), data.get('size'))
+    except UploadError as e:
+        return error_response(e)
+    return jsonify(upload_status(upload)), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@instructor_required
+def upload_info(upload_id):
+    """Report the current offset so an interrupted upload can resume"""
+    upload = get_user_upload(upload_id, current_user)
+    if upload is None:
+        return jsonify({'error': 'Upload not found.'}), 404
+    return jsonify(upload_status(upload))
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@instructor_required
+def upload_chunk(upload_id):
+    """Append one chunk; the body is the raw bytes and Upload-Offset says where they go"""
+    upload = get_user_upload(upload_id, current_user)
+    if upload is None:
+        return jsonify({'error': 'Upload not found.'}), 404
+    
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header is required.', 'offset': upload_offset(upload)}), 400
+    
+    try:
+        new_offset = write_chunk(upload, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return error_response(e)
+    
+    status = upload_status(upload)
+    status['offset'] = new_offset
+    return jsonify(status)
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@instructor_required
+def upload_abort(upload_id):
+    """Cancel an upload and discard the received bytes"""
+    upload = get_user_upload(upload_id, current_user)
+    if upload is None:
+        return jsonify({'error': 'Upload not found.'}), 404
+    abort_upload(upload)
+    return '', 204
+
+@app.route('/api/uploads/<upload_id>/commit', methods=['POST'])
+@instructor_required
+def upload_commit(upload_id):
+    """Attach a completed upload to an existing lesson as its video file"""
+    upload = get_user_upload(upload_id, current_user)
+    if upload is None:
+        return jsonify({'error': 'Upload not found.'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    lesson = db.session.get(Lesson, data.get('lesson_id') or 0)
+    if lesson is None or lesson.course_id != upload.course_id:
+        return jsonify({'error': 'Lesson not found in this course.'}), 404
+    
+    try:
+        attach_video(lesson, upload)
+    except UploadError as e:
+        return error_response(e)
+    db.session.commit()
+    return jsonify({'lesson_id': lesson.id, 'video_file': lesson.video_file})
@@ -0,0 +1,195 @@
+"""
+Resumable chunked uploads for lesson videos.
+
+Large videos are sent as a sequence of raw PUT requests instead of one
+multipart form, so no single request is bigger than UPLOAD_CHUNK_SIZE and a
+dropped connection only costs the chunk in flight:
+
+1. start_upload() records an UploadSession (owner, course, file name, size).
+2. write_chunk() appends a request body at a given offset, streaming it to
+   ``UPLOAD_TMP_FOLDER/<id>.part`` without buffering it in memory. The offset
+   must equal the bytes already stored, so a client that lost a connection
+   asks for the current offset and continues from there. Writes to one
+   upload hold an exclusive lock on its .part file, so a chunk re-sent while
+   the first attempt is still streaming waits for it and is then rejected
+   with the new offset instead of being appended twice.
+3. commit_upload() moves the finished file into the content-addressed media
+   store (storage.py) and returns the media path to store on the Lesson.
+
+Video size is limited by LESSON_VIDEO_MAX_SIZE, independently of
+MAX_CONTENT_LENGTH which still applies to normal form posts.
+"""
+
+import fcntl
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from werkzeug.utils import secure_filename
+
+from .app import app
+from .models import db, UploadSession
+from .storage import store_file, release
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_VIDEO_MAX_SIZE = 2 * 1024 * 1024 * 1024
+STREAM_BUFFER_SIZE = 64 * 1024
+
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'webm'}
+
+
+class UploadError(Exception):
+    """An upload request that cannot be honoured; ``status`` is the HTTP status to return."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+def _tmp_folder():
+    folder = app.config['UPLOAD_TMP_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def part_path(upload):
+    return os.path.join(_tmp_folder(), f'{upload.id}.part')
+
+
+def upload_offset(upload):
+    """Number of bytes received so far."""
+    try:
+        return os.path.getsize(part_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+def get_user_upload(upload_id, user):
+    """Return the upload session ``upload_id`` if it belongs to ``user``, else None."""
+    if not upload_id:
+        return None
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != user.id:
+        return None
+    return upload
+
+
+def start_upload(user, course, filename, total_size):
+    """Open a new upload session for a lesson video in ``course``."""
+    filename = secure_filename(filename or '')
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in VIDEO_EXTENSIONS:
+        raise UploadError('Unsupported video file type.', 415)
+
+    max_size = app.config.get('LESSON_VIDEO_MAX_SIZE', DEFAULT_VIDEO_MAX_SIZE)
+    if not isinstance(total_size, int) or total_size <= 0:
+        raise UploadError('A positive file size is required.')
+    if total_size > max_size:
+        raise UploadError(f'Video is larger than the {max_size // (1024 * 1024)} MB limit.', 413)
+
+    upload = UploadSession(
+        id=secrets.token_hex(16),
+        user_id=user.id,
+        course_id=course.id,
+        kind='video',
+        filename=filename,
+        total_size=total_size,
+        chunk_size=app.config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE),
+    )
+    db.session.add(upload)
+    db.session.commit()
+    # Create the empty .part file so the offset is well defined from the start
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """Append ``length`` bytes from ``stream`` at ``offset``; returns the new offset.
+
+    Bytes are copied in small buffers straight to disk. If the client goes
+    away mid-chunk, whatever arrived is kept and the next offset reflects it.
+    """
+    if length is None:
+        raise UploadError('Content-Length is required.', 411)
+
+    remaining = length
+    with open(part_path(upload), 'ab') as f:
+        # Held until the chunk is written; the offset is only checked under the lock
+        fcntl.flock(f, fcntl.LOCK_EX)
+        current = os.fstat(f.fileno()).st_size
+        if offset != current:
+            raise UploadError('Offset does not match the bytes already received.', 409, offset=current)
+        if length > upload.chunk_size:
+            raise UploadError(f'Chunks may not exceed {upload.chunk_size} bytes.', 413, offset=current)
+        if offset + length > upload.total_size:
+            raise UploadError('Chunk runs past the declared file size.', 416, offset=current)
+
+        while remaining > 0:
+            data = stream.read(min(STREAM_BUFFER_SIZE, remaining))
+            if not data:
+                break
+            f.write(data)
+            remaining -= len(data)
+
+    upload.updated_at = datetime.utcnow()
+    db.session.commit()
+    return offset + length - remaining
+
+
+def commit_upload(upload):
+    """Move a completed upload into the media store and return its media path.
+
+    The session row is deleted; the caller stores the returned path on the
+    Lesson and commits.
+    """
+    received = upload_offset(upload)
+    if received != upload.total_size:
+        raise UploadError('Upload is not complete yet.', 409, offset=received)
+
+    relative_path = store_file(part_path(upload), 'lesson_videos', upload.filename)
+    db.session.delete(upload)
+    return relative_path
+
+
+def attach_video(lesson, upload):
+    """Commit ``upload`` as the lesson's video, releasing the file it replaces."""
+    old_video = lesson.video_file
+    lesson.video_file = commit_upload(upload)
+    release(old_video)
+
+
+def abort_upload(upload):
+    """Discard an upload session and its partial data."""
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+    db.session.delete(upload)
+    db.session.commit()
+
+
+def purge_stale_uploads(max_age=timedelta(days=1)):
+    """Remove sessions that have not received data for ``max_age``; returns how many.
+
+    Old .part files whose session is gone (e.g. the course was deleted) are
+    removed as well.
+    """
+    cutoff = datetime.utcnow() - max_age
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        try:
+            os.remove(part_path(upload))
+        except FileNotFoundError:
+            pass
+        db.session.delete(upload)
+    db.session.commit()
+
+    folder = _tmp_folder()
+    live = {upload_id for (upload_id,) in db.session.query(UploadSession.id)}
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if (name.endswith('.part') and name[:-len('.part')] not in live
+                and datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff):
+            os.remove(path)
+    return len(stale)
@@ -0,0 +1,129 @@
+"""
+Per-process cache for the Flask-Login user loader.
+
+Flask-Login calls the user loader on every authenticated request, which
+used to cost one ``users`` lookup before the view did any work. load_user()
+now returns a CurrentUser: an immutable snapshot of the few columns the
+views and templates use (id, username, email, role, profile picture), kept
+for USER_CACHE_TTL seconds in an LRU of at most USER_CACHE_SIZE entries.
+
+CurrentUser answers the same role checks as User (is_admin() and friends)
+and compares equal to the User row with the same id, so
+``current_user == course.instructor`` keeps working. It is not attached to
+the session: a view that needs to change the account loads the User row.
+
+Entries are dropped when a commit changes or deletes a user through the ORM
+(e.g. role changes in the admin views) and when deletion.delete_users()
+removes users with bulk statements (mark_users_changed()). Other processes
+notice such changes once their entry expires, so the TTL bounds how long a
+demoted or deleted account keeps its old role elsewhere.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event, select
+
+from .models import db, User
+
+DEFAULT_TTL = 30
+DEFAULT_SIZE = 10000
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+_CHANGED_KEY = 'user_cache_changed'
+
+
+class CurrentUser(UserMixin):
+    """Read-only snapshot of a logged-in user."""
+
+    __slots__ = ('id', 'username', 'email', 'role', 'profile_picture')
+
+    def __init__(self, id, username, email, role, profile_picture):
+        for name, value in zip(self.__slots__, (id, username, email, role, profile_picture)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only; load the User row to change it')
+
+    def __repr__(self):
+        return f'<CurrentUser {self.username}>'
+
+    # Role helpers only read self.role, so User's implementations apply as-is
+    is_instructor = User.is_instructor
+    is_student = User.is_student
+    is_admin = User.is_admin
+    get_role_display = User.get_role_display
+
+
+def invalidate_user(*user_ids):
+    """Drop cached snapshots for ``user_ids``."""
+    with _lock:
+        for user_id in user_ids:
+            _cache.pop(int(user_id), None)
+
+
+def clear_user_cache():
+    with _lock:
+        _cache.clear()
+
+
+def load_user(user_id):
+    """Flask-Login user loader: cached CurrentUser for ``user_id``, or None."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is not None and entry[1] > now:
+            _cache.move_to_end(user_id)
+            return entry[0]
+
+    row = db.session.execute(
+        select(User.id, User.username, User.email, User.role, User.profile_picture).where(User.id == user_id)
+    ).first()
+    if row is None:
+        invalidate_user(user_id)
+        return None
+
+    user = CurrentUser(*row)
+    config = current_app.config
+    with _lock:
+        _cache[user_id] = (user, now + config.get('USER_CACHE_TTL', DEFAULT_TTL))
+        _cache.move_to_end(user_id)
+        while len(_cache) > config.get('USER_CACHE_SIZE', DEFAULT_SIZE):
+            _cache.popitem(last=False)
+    return user
+
+
+def mark_users_changed(user_ids, session=None):
+    """Invalidate ``user_ids`` when ``session`` commits; for bulk statements the flush hook cannot see."""
+    (session or db.session).info.setdefault(_CHANGED_KEY, set()).update(user_ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = [obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)]
+    if changed:
+        mark_users_changed(changed, session)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_on_commit(session):
+    changed = session.info.pop(_CHANGED_KEY, None)
+    if changed:
+        invalidate_user(*changed)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_on_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CHANGED_KEY, None)
@@ -5,6 +5,11 @@ Script to create an admin user for the LMS system.
 Usage:
     python create_admin.py
     python create_admin.py --username admin --email admin@example.com --password admin123
+    python create_admin.py provision students.csv [--batch-size 1000] [--workers N] [--dry-run]
+
+The provision subcommand bulk-creates accounts from a CSV file (header row
+with username, email, password and optional role columns) or a JSONL file
+with the same keys, one object per line. See backend/provisioning.py.
 """
 
 import sys
@@ -16,6 +21,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from backend.app import app
 from backend.models import db, User
+from backend.provisioning import ProvisioningError, provision
 
 
 def create_admin(username=None, email=None, password=None, interactive=True):
@@ -84,6 +90,29 @@ def create_admin(username=None, email=None, password=None, interactive=True):
         print(f"   Admin panel: http://localhost:5000/admin")
 
 
+def provision_users(path, checkpoint=None, batch_size=None, workers=None, dry_run=False):
+    """Bulk-create users from a CSV/JSONL file."""
+    if not os.path.exists(path):
+        print(f"❌ File not found: {path}")
+        return 1
+    
+    with app.app_context():
+        try:
+            created, errors = provision(path, checkpoint=checkpoint, batch_size=batch_size,
+                                        workers=workers, dry_run=dry_run)
+        except ProvisioningError as e:
+            print(f"❌ {e}")
+            return 1
+    
+    for line, message in errors:
+        print(f"⚠️  Line {line}: {message}")
+    if dry_run:
+        print("✅ Dry run finished, nothing was created.")
+    else:
+        print(f"✅ Created {created} user(s), {len(errors)} row(s) skipped.")
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(description='Create an admin user for LMS')
     parser.add_argument('--username', type=str, help='Admin username')
@@ -92,8 +121,22 @@ def main():
     parser.add_argument('--non-interactive', action='store_true', 
                        help='Run in non-interactive mode (requires --username, --email, --password)')
     
+    subparsers = parser.add_subparsers(dest='command')
+    provision_parser = subparsers.add_parser('provision', help='Bulk-create users from a CSV or JSONL file')
+    provision_parser.add_argument('path', help='CSV or JSONL (.jsonl/.ndjson) file of users')
+    provision_parser.add_argument('--checkpoint', type=str,
+                                  help='Checkpoint file used to resume an interrupted run (default: <path>.checkpoint)')
+    provision_parser.add_argument('--batch-size', type=int, default=1000,
+                                  help='Users hashed and inserted per transaction')
+    provision_parser.add_argument('--workers', type=int, help='Password hashing processes (default: one per core)')
+    provision_parser.add_argument('--dry-run', action='store_true', help='Only validate the file and report problems')
+    
     args = parser.parse_args()
     
+    if args.command == 'provision':
+        sys.exit(provision_users(args.path, checkpoint=args.checkpoint, batch_size=args.batch_size,
+                                 workers=args.workers, dry_run=args.dry_run))
+    
     interactive = not args.non_interactive
     create_admin(
         username=args.username,
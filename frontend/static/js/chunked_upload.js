@@ -0,0 +1,114 @@
+/*
+ * Chunked, resumable upload for the lesson video field.
+ *
+ * When a video is selected, submitting the lesson form first sends the file
+ * to /api/uploads in fixed-size chunks, resuming from the server's offset if
+ * a chunk fails, then submits the form with only the upload id attached.
+ */
+(function () {
+    var form = document.querySelector('form[data-chunked-upload]');
+    if (!form || !window.fetch || !window.Blob || !Blob.prototype.slice) {
+        return;
+    }
+
+    var fileInput = form.querySelector('input[name="video_file"]');
+    var uploadIdInput = form.querySelector('input[name="video_upload_id"]');
+    var progress = form.querySelector('[data-upload-progress]');
+    var progressBar = progress ? progress.querySelector('.progress-bar') : null;
+    var csrfInput = form.querySelector('input[name="csrf_token"]');
+    var courseId = parseInt(form.getAttribute('data-course-id'), 10);
+    var maxRetries = 5;
+
+    function headers(extra) {
+        var h = extra || {};
+        if (csrfInput) {
+            h['X-CSRFToken'] = csrfInput.value;
+        }
+        return h;
+    }
+
+    function showProgress(sent, total) {
+        if (!progress) {
+            return;
+        }
+        var percent = total ? Math.floor((sent / total) * 100) : 0;
+        progress.classList.remove('d-none');
+        progressBar.style.width = percent + '%';
+        progressBar.textContent = percent + '%';
+    }
+
+    function json(response) {
+        return response.json().then(function (body) {
+            if (!response.ok && response.status !== 409) {
+                throw new Error(body.error || 'Upload failed');
+            }
+            return body;
+        });
+    }
+
+    function start(file) {
+        return fetch('/api/uploads', {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: headers({'Content-Type': 'application/json'}),
+            body: JSON.stringify({course_id: courseId, filename: file.name, size: file.size})
+        }).then(json);
+    }
+
+    function currentOffset(uploadId) {
+        return fetch('/api/uploads/' + uploadId, {credentials: 'same-origin'})
+            .then(json)
+            .then(function (status) { return status.offset; });
+    }
+
+    function sendFrom(file, upload, offset, retries) {
+        if (offset >= file.size) {
+            return Promise.resolve(upload.upload_id);
+        }
+        showProgress(offset, file.size);
+        var chunk = file.slice(offset, Math.min(offset + upload.chunk_size, file.size));
+        return fetch('/api/uploads/' + upload.upload_id, {
+            method: 'PUT',
+            credentials: 'same-origin',
+            headers: headers({'Content-Type': 'application/octet-stream', 'Upload-Offset': String(offset)}),
+            body: chunk
+        }).then(json).then(function (status) {
+            return sendFrom(file, upload, status.offset, maxRetries);
+        }, function (error) {
+            if (retries <= 0) {
+                throw error;
+            }
+            // Connection dropped: ask the server how much it kept and resume there
+            return new Promise(function (resolve) { setTimeout(resolve, 1000); })
+                .then(function () { return currentOffset(upload.upload_id); })
+                .then(function (serverOffset) { return sendFrom(file, upload, serverOffset, retries - 1); });
+        });
+    }
+
+    form.addEventListener('submit', function (event) {
+        var file = fileInput && fileInput.files && fileInput.files[0];
+        if (!file || uploadIdInput.value) {
+            return;
+        }
+        event.preventDefault();
+        var submitButton = form.querySelector('button[type="submit"]');
+        if (submitButton) {
+            submitButton.disabled = true;
+        }
+
+        start(file).then(function (upload) {
+            return sendFrom(file, upload, upload.offset || 0, maxRetries);
+        }).then(function (uploadId) {
+            showProgress(file.size, file.size);
+            uploadIdInput.value = uploadId;
+            // The bytes are already on the server; don't send them again with the form
+            fileInput.value = '';
+            form.submit();
+        }).catch(function (error) {
+            if (submitButton) {
+                submitButton.disabled = false;
+            }
+            alert('Video upload failed: ' + error.message);
+        });
+    });
+})();
@@ -0,0 +1,104 @@
+/*
+ * Roster import with live progress.
+ *
+ * The import endpoint streams one JSON progress object per line (one per
+ * committed batch); this reads the stream as it arrives, updates the
+ * progress bar and lists the rows that could not be enrolled.
+ */
+(function () {
+    var form = document.querySelector('form[data-roster-import]');
+    if (!form || !window.fetch || !window.TextDecoder) {
+        return;
+    }
+
+    var progress = form.querySelector('[data-roster-progress]');
+    var progressBar = progress.querySelector('.progress-bar');
+    var errorBox = form.querySelector('[data-roster-error]');
+    var summary = form.querySelector('[data-roster-summary]');
+    var errorList = document.querySelector('[data-roster-errors]');
+    var errorRows = errorList.querySelector('tbody');
+    var submit = form.querySelector('button[type="submit"]');
+    var csrfInput = form.querySelector('input[name="csrf_token"]');
+
+    function show(element, text) {
+        element.textContent = text;
+        element.classList.remove('d-none');
+    }
+
+    function render(state) {
+        var percent = state.total ? Math.floor((state.processed / state.total) * 100) : 100;
+        progressBar.style.width = percent + '%';
+        progressBar.textContent = percent + '%';
+
+        var text = state.enrolled + ' enrolled, ' + state.already_enrolled + ' already enrolled, ' +
+            state.error_count + ' not imported (' + state.processed + ' of ' + state.total + ' rows).';
+        show(summary, state.done ? 'Import finished: ' + text : text);
+
+        errorRows.innerHTML = '';
+        state.errors.forEach(function (row) {
+            var tr = document.createElement('tr');
+            [row.line, row.value, row.error].forEach(function (value) {
+                var td = document.createElement('td');
+                td.textContent = value;
+                tr.appendChild(td);
+            });
+            errorRows.appendChild(tr);
+        });
+        errorList.classList.toggle('d-none', state.errors.length === 0);
+    }
+
+    function readLines(response) {
+        var reader = response.body.getReader();
+        var decoder = new TextDecoder();
+        var buffer = '';
+
+        function pump() {
+            return reader.read().then(function (chunk) {
+                buffer += decoder.decode(chunk.value || new Uint8Array(), { stream: !chunk.done });
+                var lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.forEach(function (line) {
+                    if (line.trim()) {
+                        render(JSON.parse(line));
+                    }
+                });
+                if (!chunk.done) {
+                    return pump();
+                }
+            });
+        }
+        return pump();
+    }
+
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        errorBox.classList.add('d-none');
+        summary.classList.add('d-none');
+        errorList.classList.add('d-none');
+        progress.classList.remove('d-none');
+        progressBar.style.width = '0%';
+        progressBar.textContent = '0%';
+        submit.disabled = true;
+
+        fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: { 'X-CSRFToken': csrfInput ? csrfInput.value : '' },
+            credentials: 'same-origin'
+        }).then(function (response) {
+            if (!response.ok) {
+                return response.json().then(function (body) {
+                    throw new Error(body.error || 'Import failed');
+                }, function () {
+                    throw new Error('Import failed');
+                });
+            }
+            return readLines(response);
+        }).catch(function (err) {
+            progress.classList.add('d-none');
+            show(errorBox, err.message);
+        }).then(function () {
+            submit.disabled = false;
+        });
+    });
+})();
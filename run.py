@@ -12,8 +12,13 @@ from backend.app import app
 
 if __name__ == '__main__':
     with app.app_context():
-        from backend.models import db
-        db.create_all()
+        from backend.migrations import upgrade_database
+        # Creates a new database, or applies pending schema migrations
+        upgrade_database(report=print)
+        
+        # Fingerprinted, precompressed static assets served from /assets
+        from backend.assets import build_assets
+        build_assets()
         
         # Create upload directories
         media_folder = app.config['UPLOAD_FOLDER']
@@ -27,6 +32,7 @@ if __name__ == '__main__':
     print("=" * 50)
     print("Server starting on http://localhost:5000")
     print("Press Ctrl+C to stop the server")
+    print("Background jobs: flask --app backend.app jobs-worker")
     print("=" * 50)
     
     app.run(debug=True, host='0.0.0.0', port=5000)